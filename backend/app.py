@@ -9,12 +9,16 @@ Flask Web 服务器
 - routes/smoke_alarm.py - 烟雾报警器模块（增强版）
 - routes/rooms.py - 房间管理模块
 - routes/automation_rules.py - 自动化响应规则模块
+- routes/export.py - 历史数据流式导出（NDJSON / CSV）
 """
 
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
-from config import FLASK_HOST, FLASK_PORT
+from config import FLASK_HOST, FLASK_PORT, RETENTION_ENABLED, ARCHIVE_ENABLED
+from database import (init_schema, enforce_retention, archive_expired, check_archive_settings,
+                      enforce_retention_after_archive, warm_state_cache, state_cache)
+from retention import RetentionWorker
 
 # 导入各设备模块的路由蓝图
 from routes.air_conditioner import air_conditioner_bp
@@ -23,6 +27,31 @@ from routes.lighting import lighting_bp
 from routes.smoke_alarm import smoke_alarm_bp
 from routes.rooms import rooms_bp
 from routes.automation_rules import automation_bp
+from routes.export import export_bp
+
+# 启动时执行一次数据库结构迁移
+init_schema()
+
+# 冷数据归档任务（按 ARCHIVE_* 配置把早期数据转存为 Parquet）
+archive_worker = RetentionWorker(archive_expired, name='archive')
+
+
+def _archive_then_enforce_retention():
+    """归档和保留同时开启时的一轮任务：先归档，再清理已归档的数据"""
+    return enforce_retention_after_archive(archive_worker.run_once())
+
+
+# 后台数据保留任务（按 RETENTION_* 配置定期清理过期数据）
+# 同时开启归档时由同一个线程每轮先归档、再清理，ARCHIVE_AFTER_DAYS 不小于保留天数时拒绝启动
+if RETENTION_ENABLED and ARCHIVE_ENABLED:
+    check_archive_settings()
+    retention_worker = RetentionWorker(_archive_then_enforce_retention)
+else:
+    retention_worker = RetentionWorker(enforce_retention)
+if RETENTION_ENABLED:
+    retention_worker.start()
+elif ARCHIVE_ENABLED:
+    archive_worker.start()
 
 app = Flask(__name__)
 
@@ -41,6 +70,9 @@ socketio = SocketIO(app,
 import mqtt_client
 mqtt_client.init_socketio(socketio)
 
+# 导入 mqtt_client 时按 ingest 配置启用了设备状态缓存，此时再把状态表加载到内存
+warm_state_cache()
+
 # 配置 CORS 以允许来自前端的请求
 # 开发环境设置 max_age=0 避免浏览器缓存 CORS 预检请求
 CORS(app,
@@ -96,6 +128,9 @@ app.register_blueprint(rooms_bp)
 # 自动化响应规则模块
 app.register_blueprint(automation_bp)
 
+# 历史数据导出
+app.register_blueprint(export_bp)
+
 
 @app.route("/")
 def index():
@@ -110,7 +145,7 @@ def index():
                 "endpoints": {
                     "/devices": "获取所有设备列表",
                     "/history": "获取历史数据",
-                    "/history/<device_id>": "获取指定设备的历史数据",
+                    "/history/<device_id>": "获取指定设备的历史数据（带 start/end/max_points 参数时返回自动降采样的曲线）",
                     "/latest/<device_id>": "获取指定设备的最新数据"
                 }
             },
@@ -144,11 +179,54 @@ def index():
                     "/smoke_alarms/<alarm_id>/events": "获取事件历史",
                     "/smoke_alarms/<alarm_id>/acknowledge": "确认/清除报警"
                 }
+            },
+            "export": {
+                "description": "历史数据流式导出",
+                "endpoints": {
+                    "/export": "获取可导出的数据集及其列",
+                    "/export/<dataset>": "导出数据集（device_id/start/end 过滤，format=ndjson|csv）"
+                }
             }
         }
     })
 
 
+@app.route("/ingest/stats")
+def ingest_stats():
+    """MQTT 写入缓冲指标（队列深度、批大小、刷写耗时、丢弃数）、处理线程池、状态合并指标及各主题路由的消息数"""
+    stats = mqtt_client.ingest_queue.stats()
+    stats['consumer'] = {
+        'client_id': mqtt_client.MQTT_CLIENT_ID,
+        'ingest': mqtt_client.MQTT_INGEST,
+        'shared_group': mqtt_client.MQTT_SHARED_GROUP or None,
+        'shared_worker': (f'{mqtt_client.MQTT_SHARED_WORKER_INDEX}/{mqtt_client.MQTT_SHARED_WORKERS}'
+                          if mqtt_client.MQTT_SHARED_GROUP else None),
+        'subscriptions': mqtt_client.subscriptions(),
+    }
+    stats['workers'] = mqtt_client.dispatch_pool.stats()
+    stats['state_coalescing'] = mqtt_client.state_buffer.stats()
+    stats['topics'] = mqtt_client.router.stats()
+    return jsonify(stats)
+
+
+@app.route("/retention/stats")
+def retention_stats():
+    """数据保留任务指标（执行次数、删除行数/分区数、最近一次结果）"""
+    return jsonify(retention_worker.stats())
+
+
+@app.route("/archive/stats")
+def archive_stats():
+    """冷数据归档任务指标（执行次数、归档行数、最近一次结果）"""
+    return jsonify(archive_worker.stats())
+
+
+@app.route("/state_cache/stats")
+def state_cache_stats():
+    """设备状态缓存指标（命中率、各类设备数）"""
+    return jsonify(state_cache.stats())
+
+
 # ==================== WebSocket 事件处理器 ====================
 
 @socketio.on('connect')
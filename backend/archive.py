@@ -0,0 +1,214 @@
+"""
+冷数据归档：Parquet 列存文件 + DuckDB 查询
+早于 ARCHIVE_AFTER_DAYS 天的原始温湿度数据和设备事件按天写入
+<ARCHIVE_DIR>/<数据集>/date=YYYY-MM-DD/part-<最小 id>.parquet（zstd 压缩）后从数据库删除，
+在线表和索引只保留近期数据；历史曲线 / 聚合 / 分页查询涉及已归档的日期时，由 DuckDB 直接扫描对应日期的文件。
+
+pyarrow（写入）和 duckdb（查询）是可选依赖，未安装时归档不可用，查询只读数据库。
+"""
+
+import os
+from datetime import datetime, timedelta
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# 可归档的数据集（EXPORT_DATASETS 的子集）
+# 烟雾报警事件仍被确认记录引用，报警统计也从事件表重建，保留在数据库中
+ARCHIVE_DATASETS = ('sensors', 'lock_events', 'ac_events', 'lighting_events')
+
+_DAY_PREFIX = 'date='
+
+
+def available():
+    """pyarrow 与 duckdb 是否都已安装"""
+    return pa is not None and duckdb is not None
+
+
+def _column_type(name):
+    if name == 'id':
+        return pa.int64()
+    if name == 'timestamp':
+        return pa.timestamp('us')
+    if name in ('temperature', 'humidity'):
+        return pa.float64()
+    return pa.string()
+
+
+def _parse_time(value):
+    """导出行中的时间文本（SQLite 为 'YYYY-MM-DD HH:MM:SS'，openGauss 为 ISO 格式）转为 datetime"""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+class ParquetArchive:
+    """按 数据集/日期 分区的 Parquet 归档目录"""
+
+    def __init__(self, root):
+        self.root = root
+
+    # ---------- 写入 ----------
+
+    def write_day(self, dataset, day, columns, batches, prefix='part'):
+        """
+        把某一天的行（database.iter_export 的批次）写为一个 Parquet 文件
+        返回 (行数, 最大 id, 文件路径)；没有数据时返回 (0, None, None)
+        文件名为 <prefix>-<这批行的最小 id>：中途失败重跑时覆盖同一个文件，不会重复归档
+        """
+        schema = pa.schema([(name, _column_type(name)) for name in columns])
+        time_index = columns.index('timestamp')
+        directory = os.path.join(self.root, dataset, f'{_DAY_PREFIX}{day:%Y-%m-%d}')
+        os.makedirs(directory, exist_ok=True)
+        temp_path = os.path.join(directory, 'part.parquet.tmp')
+
+        writer = None
+        rows, min_id, max_id = 0, None, None
+        try:
+            for batch in batches:
+                if writer is None:
+                    writer = pq.ParquetWriter(temp_path, schema, compression='zstd')
+                arrays = [
+                    pa.array([_parse_time(r[i]) if i == time_index else r[i] for r in batch], type=field.type)
+                    for i, field in enumerate(schema)
+                ]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                ids = [r[0] for r in batch]
+                min_id = min(ids) if min_id is None else min(min_id, *ids)
+                max_id = max(ids) if max_id is None else max(max_id, *ids)
+                rows += len(batch)
+        except Exception:
+            if writer is not None:
+                writer.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        if writer is None:
+            return 0, None, None
+        writer.close()
+        path = os.path.join(directory, f'{prefix}-{min_id}.parquet')
+        os.replace(temp_path, path)
+        return rows, max_id, path
+
+    # ---------- 查询 ----------
+
+    def files(self, dataset, start=None, end=None):
+        """与 [start, end) 有交集的日期分区下的全部 Parquet 文件"""
+        base = os.path.join(self.root, dataset)
+        if not os.path.isdir(base):
+            return []
+        first = start.date() if start else None
+        found = []
+        for entry in sorted(os.listdir(base)):
+            if not entry.startswith(_DAY_PREFIX):
+                continue
+            day = datetime.strptime(entry[len(_DAY_PREFIX):], '%Y-%m-%d').date()
+            if (first and day < first) or (end and datetime.combine(day, datetime.min.time()) >= end):
+                continue
+            directory = os.path.join(base, entry)
+            found.extend(os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.endswith('.parquet'))
+        return found
+
+    def _execute(self, dataset, start, end, query, params):
+        """对 [start, end) 涉及的文件执行查询，{source} 替换为 read_parquet(文件列表)；没有文件时返回 None"""
+        paths = self.files(dataset, start, end)
+        if not paths:
+            return None
+        con = duckdb.connect()
+        try:
+            return con, con.execute(query.format(source='read_parquet($files)'), dict(params, files=paths))
+        except Exception:
+            con.close()
+            raise
+
+    def page(self, dataset, columns, key_column, key, upper, lower, after_id, floor, limit):
+        """
+        已归档行的游标分页，边界和排序与 queries._page_query 相同（下界 < 时间 <= 上界，
+        时间等于上界时 id > after_id，按 timestamp DESC, id），另外只取时间不早于 floor 的行
+        key 为 None 时不按设备过滤；返回 [(columns...), ...]，timestamp 为 datetime
+        """
+        where = f"{key_column} = $key AND " if key is not None else ""
+        params = {'upper': upper, 'lower': lower, 'after': after_id, 'floor': floor, 'limit': limit}
+        if key is not None:
+            params['key'] = key
+        result = self._execute(dataset, max(lower, floor), upper + timedelta(microseconds=1), f"""
+            SELECT {', '.join(columns)} FROM {{source}}
+            WHERE {where}timestamp <= $upper AND timestamp > $lower AND timestamp >= $floor
+              AND (timestamp < $upper OR id > $after)
+            ORDER BY timestamp DESC, id
+            LIMIT $limit
+        """, params)
+        if result is None:
+            return []
+        con, cur = result
+        try:
+            return cur.fetchall()
+        finally:
+            con.close()
+
+    def iter_sensor_range(self, device_id, start, end, chunk_size):
+        """
+        按 (timestamp, id DESC) 顺序分块读取已归档的温湿度数据，与 sensor.range_chunk 顺序一致
+        每块是 [(timestamp, Unix 秒, temperature, humidity), ...]，timestamp 为 datetime
+        """
+        result = self._execute('sensors', start, end, """
+            SELECT timestamp, epoch(timestamp), temperature, humidity FROM {source}
+            WHERE device_id = $device AND timestamp >= $start AND timestamp < $end
+            ORDER BY timestamp, id DESC
+        """, {'device': device_id, 'start': start, 'end': end})
+        if result is None:
+            return
+        con, cur = result
+        try:
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            con.close()
+
+    def sensor_count(self, device_id, start, end):
+        """已归档的 [start, end) 内温湿度行数"""
+        result = self._execute('sensors', start, end, """
+            SELECT COUNT(*) FROM {source}
+            WHERE device_id = $device AND timestamp >= $start AND timestamp < $end
+        """, {'device': device_id, 'start': start, 'end': end})
+        if result is None:
+            return 0
+        con, cur = result
+        try:
+            return cur.fetchone()[0]
+        finally:
+            con.close()
+
+    def sensor_aggregate(self, device_id, start, end, seconds):
+        """
+        已归档温湿度按桶宽聚合，列顺序与 sensor.aggregate.raw 相同：
+        (桶起点 datetime, 样本数, 温度 avg/min/max, 湿度 avg/min/max)
+        """
+        result = self._execute('sensors', start, end, """
+            SELECT make_timestamp(epoch_us(timestamp) // $width * $width) AS b,
+                   COUNT(*), AVG(temperature), MIN(temperature), MAX(temperature),
+                   AVG(humidity), MIN(humidity), MAX(humidity)
+            FROM {source}
+            WHERE device_id = $device AND timestamp >= $start AND timestamp < $end
+            GROUP BY b
+            ORDER BY b
+        """, {'width': seconds * 1000000, 'device': device_id, 'start': start, 'end': end})
+        if result is None:
+            return []
+        con, cur = result
+        try:
+            return cur.fetchall()
+        finally:
+            con.close()
+
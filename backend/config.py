@@ -4,6 +4,7 @@
 """
 
 import os
+import socket
 from pathlib import Path
 
 # 尝试加载 .env 文件
@@ -50,15 +51,120 @@ DB_TYPE = os.getenv("DB_TYPE", "sqlite")
 # 当使用 sqlite 时，DB_PATH 指向数据库文件（相对或绝对路径）
 DB_PATH = os.getenv("DB_PATH", str(Path(__file__).parent.parent / 'data.sqlite3'))
 
+# 连接池配置
+# openGauss 连接池最大连接数
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+# 连接池耗尽时等待可用连接的超时时间（秒）
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# 空闲连接最长保留时间（秒），超过后关闭
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+# 空闲超过该时间（秒）的 openGauss 连接在借出前做健康检查
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30"))
+
+# SQLite 性能参数（每条池化连接建立时应用一次）
+SQLITE_PROFILE = {
+    # 日志模式：WAL 允许读写并发，DELETE 为 SQLite 默认的回滚日志
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    # 同步级别：WAL 下 NORMAL 只在检查点时 fsync，断电最多丢失最近的提交
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # 内存映射读取大小（字节），0 表示关闭
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # 页缓存大小：负数表示 KiB，正数表示页数
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-16000")),
+    # 临时表和排序使用的存储：DEFAULT / FILE / MEMORY
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    # 遇到锁时的等待时间（毫秒），避免立即报 "database is locked"
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),
+}
+
+# 数据保留策略：各表保留天数，0 表示永久保留
+# 原始温湿度数据的长期趋势由 1m/1h/1d 汇总表保留，因此原始数据可以较早清理
+RETENTION_DAYS = {
+    "temperature_humidity_data": int(os.getenv("RETENTION_TEMPERATURE_HUMIDITY_DAYS", "30")),
+    "temperature_humidity_1m": int(os.getenv("RETENTION_ROLLUP_1M_DAYS", "90")),
+    "temperature_humidity_1h": int(os.getenv("RETENTION_ROLLUP_1H_DAYS", "730")),
+    "temperature_humidity_1d": int(os.getenv("RETENTION_ROLLUP_1D_DAYS", "0")),
+    "lock_events": int(os.getenv("RETENTION_LOCK_EVENTS_DAYS", "365")),
+    "ac_events": int(os.getenv("RETENTION_AC_EVENTS_DAYS", "365")),
+    "lighting_events": int(os.getenv("RETENTION_LIGHTING_EVENTS_DAYS", "365")),
+    "smoke_alarm_events": int(os.getenv("RETENTION_SMOKE_ALARM_EVENTS_DAYS", "365")),
+}
+# 是否在 Web 服务进程中运行后台清理任务（会永久删除超过保留天数的数据，默认关闭，需显式开启）
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "false").lower() == "true"
+# 清理任务执行间隔（秒）
+RETENTION_CHECK_INTERVAL = int(os.getenv("RETENTION_CHECK_INTERVAL", "3600"))
+# 非分区表每个事务最多删除的行数，批次之间暂停 RETENTION_BATCH_PAUSE_MS 毫秒让出写锁
+RETENTION_DELETE_BATCH = int(os.getenv("RETENTION_DELETE_BATCH", "5000"))
+RETENTION_BATCH_PAUSE_MS = int(os.getenv("RETENTION_BATCH_PAUSE_MS", "50"))
+
+# 冷数据归档（需要安装 pyarrow 和 duckdb）：早于 ARCHIVE_AFTER_DAYS 天的原始温湿度数据和设备事件
+# 按天写入 ARCHIVE_DIR 下的 Parquet 文件后从数据库删除，历史查询透明地合并归档数据
+# 同时开启保留清理时，每轮先归档再清理；ARCHIVE_AFTER_DAYS 须小于对应表的 RETENTION_*_DAYS，否则启动时报错
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", str(Path(__file__).parent.parent / 'archive'))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "7"))
+
+# 设备状态内存缓存：状态接口直接读内存，由 MQTT 消息和本进程的写入同步更新
+# 多个 Web 进程同时写状态表时应关闭（缓存只感知本进程内的写入）
+STATE_CACHE_ENABLED = os.getenv("STATE_CACHE_ENABLED", "true").lower() == "true"
+
 # ==================== MQTT 配置 ====================
 MQTT_BROKER = os.getenv("MQTT_BROKER", "127.0.0.1")
 MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
 MQTT_TOPIC = os.getenv("MQTT_TOPIC", "home/+/temperature_humidity")
+# 客户端ID（每个进程必须唯一，Broker 按它区分共享订阅组内的成员）；缺省为 smart-home-<主机名>-<进程号>
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID") or f"smart-home-{socket.gethostname()}-{os.getpid()}"
+# 是否订阅并写入设备主题；设为 false 的进程只连接 Broker 发布控制命令（如 ingest 由独立进程负责时的 Web 进程）
+MQTT_INGEST = os.getenv("MQTT_INGEST", "true").lower() == "true"
+# 共享订阅组：非空时以 $share/<组>/<主题> 订阅，同组的多个 ingest 进程分摊消息，每条只投递给其中一个
+# 事件和温湿度读数走共享订阅；状态主题每个成员都直接订阅，只处理按设备ID 哈希分到本进程的设备，
+# 同一设备的状态快照总由同一进程按序写入（不依赖 Broker 的分派策略，Mosquitto 的轮询也适用）
+MQTT_SHARED_GROUP = os.getenv("MQTT_SHARED_GROUP", "")
+# 共享订阅组内的进程数和本进程的序号（0 起），组内各进程的 MQTT_SHARED_WORKERS 必须一致
+MQTT_SHARED_WORKERS = int(os.getenv("MQTT_SHARED_WORKERS", "1"))
+MQTT_SHARED_WORKER_INDEX = int(os.getenv("MQTT_SHARED_WORKER_INDEX", "0"))
+
+# MQTT 写入缓冲（write-behind）：消息先入队，由写线程按微批次写库
+# 每批最多写入的记录数
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+# 一批最长等待时间（毫秒），到时即使未攒满也写入
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", "200"))
+# 队列容量（条），写库跟不上时用于削峰
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "20000"))
+# 队列已满时入队最多等待的时间（毫秒），超时则丢弃该条并计数
+INGEST_ENQUEUE_TIMEOUT_MS = int(os.getenv("INGEST_ENQUEUE_TIMEOUT_MS", "50"))
+
+# MQTT 消息处理线程池：paho 网络线程只把消息按设备ID 分派到处理线程（同一设备始终由同一线程按序处理），
+# 解码、更新缓存、入写入队列和 WebSocket 推送都在处理线程中进行，不会阻塞心跳和订阅
+# 线程数，0 表示直接在网络线程中处理
+MQTT_WORKERS = int(os.getenv("MQTT_WORKERS", "4"))
+# 每个处理线程的待处理消息上限
+MQTT_WORKER_QUEUE_SIZE = int(os.getenv("MQTT_WORKER_QUEUE_SIZE", "2000"))
+# 处理线程队列已满时网络线程最多等待的时间（毫秒），超时则丢弃该消息并计数
+MQTT_WORKER_ENQUEUE_TIMEOUT_MS = int(os.getenv("MQTT_WORKER_ENQUEUE_TIMEOUT_MS", "10"))
+# 状态快照合并间隔（毫秒）：门锁 / 灯具 / 烟雾报警器的 state 主题每个设备每个间隔只写库、推送最新一条，
+# 事件和温湿度读数不合并；0 表示不合并，每条都立即处理
+STATE_COALESCE_INTERVAL_MS = int(os.getenv("STATE_COALESCE_INTERVAL_MS", "200"))
 
 # ==================== 应用配置 ====================
 FLASK_HOST = os.getenv("FLASK_HOST", "0.0.0.0")
 FLASK_PORT = int(os.getenv("FLASK_PORT", "5000"))
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+# 历史曲线查询默认最多返回的点数（据此自动选择原始数据或 1m/1h/1d 汇总）
+HISTORY_MAX_POINTS = int(os.getenv("HISTORY_MAX_POINTS", "500"))
+# 聚合查询（/history/<device_id>/aggregate）单次最多返回的时间桶数
+HISTORY_MAX_BUCKETS = int(os.getenv("HISTORY_MAX_BUCKETS", "5000"))
+# LTTB 降采样（/history/<device_id>?points=N）每次从数据库读取的行数，决定内存占用上限
+HISTORY_CHUNK_ROWS = int(os.getenv("HISTORY_CHUNK_ROWS", "5000"))
+# 温湿度原始数据的存储方式：db 写入 temperature_humidity_data 表；segments 写入按 设备/天 分段的
+# 定长记录文件（需要 NumPy），范围查询和聚合直接在内存映射的数组上计算。汇总表仍在数据库中。
+# 切换到 segments 不会迁移表中已有的原始数据
+SENSOR_STORE = os.getenv("SENSOR_STORE", "db")
+SEGMENT_DIR = os.getenv("SEGMENT_DIR", str(Path(__file__).parent.parent / 'segments'))
+# 每隔多少条记录写一个稀疏索引项
+SEGMENT_INDEX_STRIDE = int(os.getenv("SEGMENT_INDEX_STRIDE", "256"))
+# 流式导出（/export/<dataset>）每次从游标取出并写入响应的行数
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))
 
 # ==================== 模拟器配置 ====================
 # 温湿度传感器数据发送间隔（秒）
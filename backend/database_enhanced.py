@@ -10,8 +10,9 @@
 """
 
 import json
-from datetime import date, datetime
-from database import get_connection, DB_TYPE
+from datetime import date, datetime, timedelta
+from database import get_connection, DB_TYPE, keyset_bounds, build_page, update_alarm_statistics
+from queries import sql, prepared
 
 
 # ==================== 房间管理数据库操作 ====================
@@ -482,6 +483,17 @@ def get_all_maintenance_records(limit=100, filter_alarm_id=None, filter_type=Non
         filter_alarm_id: 筛选指定设备ID (可选)
         filter_type: 筛选维护类型 (可选)
     """
+    return get_all_maintenance_records_page(limit, filter_alarm_id, filter_type)['items']
+
+
+def get_all_maintenance_records_page(limit=100, filter_alarm_id=None, filter_type=None,
+                                     cursor=None, before=None, after=None):
+    """按游标分页获取维护记录（按 maintenance_date 最新在前）
+
+    返回 {'items': [...], 'next_cursor': 下一页游标或 None}，
+    cursor / before / after 的含义见 pagination 模块
+    """
+    upper, lower, after_id = keyset_bounds(cursor, before, after)
     conn = get_connection()
     try:
         if DB_TYPE == 'sqlite':
@@ -492,9 +504,10 @@ def get_all_maintenance_records(limit=100, filter_alarm_id=None, filter_type=Non
                 SELECT id, alarm_id, maintenance_type, performed_by,
                        maintenance_date, next_maintenance_date, notes, cost
                 FROM device_maintenance
-                WHERE 1=1
+                WHERE maintenance_date <= ? AND maintenance_date > ?
+                  AND (maintenance_date < ? OR id > ?)
             """
-            params = []
+            params = [upper, lower, upper, after_id]
 
             if filter_alarm_id:
                 sql += " AND alarm_id = ?"
@@ -504,13 +517,13 @@ def get_all_maintenance_records(limit=100, filter_alarm_id=None, filter_type=Non
                 sql += " AND maintenance_type = ?"
                 params.append(filter_type)
 
-            sql += " ORDER BY maintenance_date DESC LIMIT ?"
-            params.append(limit)
+            sql += " ORDER BY maintenance_date DESC, id LIMIT ?"
+            params.append(limit + 1)
 
             cur.execute(sql, tuple(params))
             rows = cur.fetchall()
 
-            return [{
+            return build_page([{
                 'id': r[0],
                 'alarm_id': r[1],
                 'maintenance_type': r[2],
@@ -519,17 +532,18 @@ def get_all_maintenance_records(limit=100, filter_alarm_id=None, filter_type=Non
                 'next_maintenance_date': r[5],
                 'notes': r[6],
                 'cost': float(r[7]) if r[7] else 0.0
-            } for r in rows]
+            } for r in rows], limit, time_key='maintenance_date')
         else:
             # openGauss
             sql = """
                 SELECT id, alarm_id, maintenance_type, performed_by,
                        maintenance_date, next_maintenance_date, notes, cost
                 FROM device_maintenance
-                WHERE 1=1
+                WHERE maintenance_date <= $1 AND maintenance_date > $2
+                  AND (maintenance_date < $1 OR id > $3)
             """
-            params = []
-            param_count = 1
+            params = [upper, lower, after_id]
+            param_count = 4
 
             if filter_alarm_id:
                 sql += f" AND alarm_id = ${param_count}"
@@ -541,8 +555,8 @@ def get_all_maintenance_records(limit=100, filter_alarm_id=None, filter_type=Non
                 params.append(filter_type)
                 param_count += 1
 
-            sql += f" ORDER BY maintenance_date DESC LIMIT ${param_count}"
-            params.append(limit)
+            sql += f" ORDER BY maintenance_date DESC, id LIMIT ${param_count}"
+            params.append(limit + 1)
 
             stmt = conn.prepare(sql)
             rows = stmt(*params)
@@ -559,7 +573,7 @@ def get_all_maintenance_records(limit=100, filter_alarm_id=None, filter_type=Non
                     'notes': r[6],
                     'cost': float(r[7]) if r[7] else 0.0
                 })
-            return result
+            return build_page(result, limit, time_key='maintenance_date')
     finally:
         conn.close()
 
@@ -568,29 +582,36 @@ def get_all_maintenance_records(limit=100, filter_alarm_id=None, filter_type=Non
 
 def acknowledge_alarm(alarm_id, event_id, acknowledged_by, response_time=None,
                      action_taken=None, resolution=None, notes=None):
-    """确认报警"""
+    """确认报警（同一事务内累加当天的误报数和响应时间）"""
     conn = get_connection()
     try:
         if DB_TYPE == 'sqlite':
-            cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO alarm_acknowledgments
-                (alarm_id, event_id, acknowledged_by, response_time, action_taken, resolution, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (alarm_id, event_id, acknowledged_by, response_time, action_taken, resolution, notes))
-            conn.commit()
-            return cur.lastrowid
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                    INSERT INTO alarm_acknowledgments
+                    (alarm_id, event_id, acknowledged_by, response_time, action_taken, resolution, notes)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (alarm_id, event_id, acknowledged_by, response_time, action_taken, resolution, notes))
+                update_alarm_statistics(conn, acks=[(alarm_id, resolution, response_time)])
+                conn.commit()
+                return cur.lastrowid
+            except Exception:
+                conn.rollback()
+                raise
         else:
-            stmt = conn.prepare("""
-                INSERT INTO alarm_acknowledgments
-                (alarm_id, event_id, acknowledged_by, acknowledged_at, response_time,
-                 action_taken, resolution, notes)
-                VALUES ($1, $2, $3, NOW(), $4, $5, $6, $7)
-                RETURNING id
-            """)
-            rows = stmt(alarm_id, event_id, acknowledged_by, response_time, action_taken, resolution, notes)
-            for row in rows:
-                return row[0]
+            with conn.xact():
+                stmt = conn.prepare("""
+                    INSERT INTO alarm_acknowledgments
+                    (alarm_id, event_id, acknowledged_by, acknowledged_at, response_time,
+                     action_taken, resolution, notes)
+                    VALUES ($1, $2, $3, NOW(), $4, $5, $6, $7)
+                    RETURNING id
+                """)
+                ack_id = stmt.first(alarm_id, event_id, acknowledged_by, response_time,
+                                    action_taken, resolution, notes)
+                update_alarm_statistics(conn, acks=[(alarm_id, resolution, response_time)])
+            return ack_id
     finally:
         conn.close()
 
@@ -733,141 +754,39 @@ def get_alarm_statistics(alarm_id=None, start_date=None, end_date=None):
         conn.close()
 
 
-def update_daily_statistics(alarm_id, stat_date=None):
-    """更新每日统计数据（基于当天的事件和确认记录）"""
-    if stat_date is None:
-        stat_date = date.today()
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def rebuild_alarm_statistics(start_date, end_date=None):
+    """
+    离线重建 [start_date, end_date] 内每天的报警统计，返回写入的统计行数
+    删除范围内已有的统计行，再对事件表和确认表按时间范围做一次 GROUP BY 写回；
+    用于修复历史数据或补算迁移前的日期，日常统计由写入时增量累加
+    """
+    start = _as_date(start_date)
+    end = _as_date(end_date) if end_date is not None else start
+    if end < start:
+        raise ValueError("end_date 不能早于 start_date")
+    lower = datetime.combine(start, datetime.min.time())
+    upper = datetime.combine(end + timedelta(days=1), datetime.min.time())
 
     conn = get_connection()
     try:
-        # Get room_id for this alarm
-        room_id = None
         if DB_TYPE == 'sqlite':
-            cur = conn.cursor()
-            cur.execute("SELECT room_id FROM smoke_alarm_state WHERE alarm_id = ?", (alarm_id,))
-            row = cur.fetchone()
-            if row:
-                room_id = row[0]
-        else:
-            stmt = conn.prepare("SELECT room_id FROM smoke_alarm_state WHERE alarm_id = $1")
-            rows = stmt(alarm_id)
-            for row in rows:
-                room_id = row[0]
-                break
-
-        # Count events and calculate statistics
-        if DB_TYPE == 'sqlite':
-            cur.execute("""
-                SELECT COUNT(*) as total,
-                       MAX(smoke_level) as max_level
-                FROM smoke_alarm_events
-                WHERE alarm_id = ?
-                    AND event_type IN ('ALARM_TRIGGERED', 'ALARM_CLEARED')
-                    AND DATE(timestamp) = DATE(?)
-            """, (alarm_id, stat_date))
-            event_stats = cur.fetchone()
-
-            cur.execute("""
-                SELECT COUNT(*) as false_count,
-                       AVG(response_time) as avg_time
-                FROM alarm_acknowledgments
-                WHERE alarm_id = ?
-                    AND DATE(acknowledged_at) = DATE(?)
-            """, (alarm_id, stat_date))
-            ack_stats = cur.fetchone()
-
-            false_alarms = 0
-            if ack_stats:
-                cur.execute("""
-                    SELECT COUNT(*)
-                    FROM alarm_acknowledgments
-                    WHERE alarm_id = ?
-                        AND DATE(acknowledged_at) = DATE(?)
-                        AND resolution = 'false_alarm'
-                """, (alarm_id, stat_date))
-                false_alarms = cur.fetchone()[0]
-
-            total_alarms = event_stats[0] if event_stats else 0
-            max_smoke = event_stats[1] if event_stats else 0.0
-            avg_response = ack_stats[1] if ack_stats else None
-            real_alarms = total_alarms - false_alarms
-
-            # Upsert statistics
-            cur.execute("""
-                INSERT OR REPLACE INTO alarm_statistics
-                (alarm_id, room_id, stat_date, total_alarms, false_alarms, real_alarms,
-                 avg_response_time, max_smoke_level)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (alarm_id, room_id, stat_date, total_alarms, false_alarms, real_alarms,
-                  avg_response, max_smoke))
-            conn.commit()
+            lower, upper = str(lower), str(upper)
+            try:
+                conn.execute(sql('alarm_stats.clear'), (start.isoformat(), end.isoformat()))
+                written = conn.execute(sql('alarm_stats.rebuild'), (lower, upper, lower, upper)).rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
         else:
-            # openGauss implementation (similar logic but with $placeholders)
-            stmt = conn.prepare("""
-                SELECT COUNT(*) as total,
-                       MAX(smoke_level) as max_level
-                FROM smoke_alarm_events
-                WHERE alarm_id = $1
-                    AND event_type IN ('ALARM_TRIGGERED', 'ALARM_CLEARED')
-                    AND DATE(timestamp) = $2
-            """)
-            rows = stmt(alarm_id, stat_date)
-            event_stats = None
-            for row in rows:
-                event_stats = row
-                break
-
-            stmt = conn.prepare("""
-                SELECT COUNT(*) as false_count,
-                       AVG(response_time) as avg_time
-                FROM alarm_acknowledgments
-                WHERE alarm_id = $1
-                    AND DATE(acknowledged_at) = $2
-                    AND resolution = 'false_alarm'
-            """)
-            rows = stmt(alarm_id, stat_date)
-            false_alarms = 0
-            avg_response = None
-            for row in rows:
-                false_alarms = row[0]
-                avg_response = row[1]
-                break
-
-            total_alarms = event_stats[0] if event_stats else 0
-            max_smoke = event_stats[1] if event_stats else 0.0
-            real_alarms = total_alarms - false_alarms
-
-            # Check if record exists
-            stmt = conn.prepare("""
-                SELECT id FROM alarm_statistics
-                WHERE alarm_id = $1 AND stat_date = $2
-            """)
-            rows = stmt(alarm_id, stat_date)
-            exists = False
-            for _ in rows:
-                exists = True
-                break
-
-            if exists:
-                stmt = conn.prepare("""
-                    UPDATE alarm_statistics
-                    SET total_alarms = $1, false_alarms = $2, real_alarms = $3,
-                        avg_response_time = $4, max_smoke_level = $5
-                    WHERE alarm_id = $6 AND stat_date = $7
-                """)
-                stmt(total_alarms, false_alarms, real_alarms, avg_response, max_smoke,
-                    alarm_id, stat_date)
-            else:
-                stmt = conn.prepare("""
-                    INSERT INTO alarm_statistics
-                    (alarm_id, room_id, stat_date, total_alarms, false_alarms, real_alarms,
-                     avg_response_time, max_smoke_level, created_at)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, NOW())
-                """)
-                stmt(alarm_id, room_id, stat_date, total_alarms, false_alarms, real_alarms,
-                    avg_response, max_smoke)
-
-        return True
+            with conn.xact():
+                prepared(conn, 'alarm_stats.clear')(start, end)
+                written = prepared(conn, 'alarm_stats.rebuild').first(lower, upper, lower, upper) or 0
+        return written
     finally:
         conn.close()
 
@@ -948,3 +867,26 @@ def delete_room(room_id):
     finally:
         conn.close()
 
+
+
+# ==================== 命令行 ====================
+
+def main():
+    import argparse
+    from database import init_schema
+
+    parser = argparse.ArgumentParser(description="数据库维护命令")
+    commands = parser.add_subparsers(dest='command', required=True)
+    rebuild = commands.add_parser('rebuild-stats', help="按日期范围重建报警统计")
+    rebuild.add_argument('start_date', help="起始日期，如 2024-01-01")
+    rebuild.add_argument('end_date', nargs='?', help="结束日期（含），缺省与起始日期相同")
+    args = parser.parse_args()
+
+    init_schema()
+    if args.command == 'rebuild-stats':
+        written = rebuild_alarm_statistics(args.start_date, args.end_date)
+        print(f"✓ 报警统计已重建：{args.start_date} ~ {args.end_date or args.start_date}，共 {written} 行")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""
+数据库连接池模块
+- SQLite：每个线程复用一条连接（线程退出后连接可被新线程接管），空闲超时自动关闭
+- openGauss：有界连接池，借出前做健康检查，空闲超时淘汰
+
+借出的连接是 PooledConnection 代理，调用 close() 会把连接归还连接池而不是真正关闭，
+因此原有的 `conn = get_connection() ... finally: conn.close()` 写法无需修改。
+也可以使用上下文管理器：
+
+    with pool.connection() as conn:
+        ...
+
+同一线程内嵌套借用会拿到同一条连接（引用计数），不会额外占用连接池名额。
+
+一个请求内的多次写入可以合并为一个事务（工作单元）：
+
+    with pool.transaction():
+        ...  # 期间借出的都是同一条连接，调用方自己的 commit() / rollback() 不生效
+
+正常退出时提交一次，异常时整体回滚；after_commit() 登记的回调在提交后执行。
+
+openGauss 连接上的预编译语句按物理连接缓存（conn.prepare_cached(sql)），
+连接被淘汰或关闭时缓存随之丢弃。
+"""
+
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeoutError(Exception):
+    """在超时时间内没有可用连接"""
+
+
+class PooledConnection:
+    """借出的连接代理：属性访问转发给底层连接，close() 归还连接池"""
+
+    __slots__ = ('_pool', '_raw')
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def __getattr__(self, name):
+        raw = object.__getattribute__(self, '_raw')
+        if raw is None:
+            raise sqlite3.ProgrammingError("Connection has been returned to the pool")
+        return getattr(raw, name)
+
+    def prepare_cached(self, sql):
+        """返回该物理连接上已预编译的语句，首次使用时才 prepare"""
+        raw = object.__getattribute__(self, '_raw')
+        if raw is None:
+            raise sqlite3.ProgrammingError("Connection has been returned to the pool")
+        return self._pool._prepare_cached(raw, sql)
+
+    def commit(self):
+        """提交；处于工作单元中时由工作单元统一提交"""
+        if not self._pool._in_transaction(self._raw):
+            self.__getattr__('commit')()
+
+    def rollback(self):
+        """回滚；处于工作单元中时由工作单元统一回滚"""
+        if not self._pool._in_transaction(self._raw):
+            self.__getattr__('rollback')()
+
+    def close(self):
+        """归还连接（重复调用无副作用）"""
+        if self._raw is not None:
+            raw, self._raw = self._raw, None
+            self._pool._release(raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class _Borrow:
+    """线程当前借用的连接、嵌套深度，以及进行中的工作单元事务和提交后回调"""
+
+    __slots__ = ('conn', 'depth', 'transaction', 'callbacks')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.depth = 0
+        self.transaction = None
+        self.callbacks = []
+
+
+class _BasePool:
+    """连接池公共逻辑：线程内可重入借用"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._statements = {}  # id(conn) -> {sql: 预编译语句}
+
+    def acquire(self):
+        """借出一条连接（同一线程嵌套调用返回同一条连接）"""
+        borrow = getattr(self._local, 'borrow', None)
+        if borrow is None:
+            borrow = _Borrow(self._checkout())
+            self._local.borrow = borrow
+        borrow.depth += 1
+        return PooledConnection(self, borrow.conn)
+
+    def _release(self, conn):
+        borrow = getattr(self._local, 'borrow', None)
+        if borrow is None or borrow.conn is not conn:
+            # 跨线程归还：直接按最外层处理
+            self._checkin(conn)
+            return
+        borrow.depth -= 1
+        if borrow.depth <= 0:
+            self._local.borrow = None
+            self._checkin(conn)
+
+    def _prepare_cached(self, conn, sql):
+        # 同一条连接同一时刻只被一个线程借用，这里无需加锁
+        cache = self._statements.get(id(conn))
+        if cache is None:
+            cache = self._statements[id(conn)] = {}
+        stmt = cache.get(sql)
+        if stmt is None:
+            stmt = cache[sql] = conn.prepare(sql)
+        return stmt
+
+    def _forget_statements(self, conn):
+        self._statements.pop(id(conn), None)
+
+    @contextmanager
+    def connection(self):
+        """上下文管理器：with pool.connection() as conn: ..."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        工作单元：with 块内本线程的所有语句在同一条连接、同一个事务中执行
+        正常退出时提交，异常时回滚；嵌套使用时并入最外层事务
+        """
+        conn = self.acquire()
+        borrow = self._local.borrow
+        if borrow.transaction is not None:
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+
+        try:
+            borrow.transaction = self._begin(borrow.conn)
+            try:
+                yield conn
+            except BaseException:
+                borrow.transaction.rollback()
+                raise
+            borrow.transaction.commit()
+            callbacks = borrow.callbacks
+        finally:
+            borrow.transaction = None
+            borrow.callbacks = []
+            conn.close()
+        for callback in callbacks:
+            callback()
+
+    def in_transaction(self):
+        """当前线程是否处于工作单元中"""
+        borrow = getattr(self._local, 'borrow', None)
+        return borrow is not None and borrow.transaction is not None
+
+    def after_commit(self, callback):
+        """工作单元中登记到提交后执行（回滚则丢弃），否则立即执行"""
+        borrow = getattr(self._local, 'borrow', None)
+        if borrow is not None and borrow.transaction is not None:
+            borrow.callbacks.append(callback)
+        else:
+            callback()
+
+    def _in_transaction(self, conn):
+        borrow = getattr(self._local, 'borrow', None)
+        return borrow is not None and borrow.transaction is not None and borrow.conn is conn
+
+    def _begin(self, conn):
+        """在物理连接上开始事务，返回带 commit() / rollback() 的对象"""
+        raise NotImplementedError
+
+    def _checkout(self):
+        raise NotImplementedError
+
+    def _checkin(self, conn):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+
+class SQLitePool(_BasePool):
+    """
+    SQLite 每线程连接池
+    线程第一次借用时绑定一条连接并长期复用；线程退出后，其连接回收到空闲列表，
+    供新线程（例如 Flask 的每请求线程）接管，避免反复 connect。
+    """
+
+    def __init__(self, path, max_idle=300, sweep_interval=30, on_connect=None):
+        super().__init__()
+        self.path = path
+        self.max_idle = max_idle
+        self.sweep_interval = sweep_interval
+        self._on_connect = on_connect
+        self._lock = threading.Lock()
+        self._owned = {}      # thread ident -> (thread, conn)
+        self._orphans = []    # [(conn, last_used)] 所属线程已退出的空闲连接
+        self._last_used = {}  # id(conn) -> 最近归还时间
+        self._last_sweep = time.monotonic()
+        self._closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        if self._on_connect:
+            self._on_connect(conn)
+        return conn
+
+    def _checkout(self):
+        thread = threading.current_thread()
+        now = time.monotonic()
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now)
+            owned = self._owned.get(thread.ident)
+            if owned is not None and owned[0] is thread:
+                return owned[1]
+            # 新线程：先回收已退出线程的连接，再尝试接管
+            self._sweep(now)
+            conn = self._orphans.pop()[0] if self._orphans else None
+        if conn is None:
+            conn = self._connect()
+        with self._lock:
+            self._owned[thread.ident] = (thread, conn)
+        return conn
+
+    def _begin(self, conn):
+        # BEGIN IMMEDIATE 一开始就取得写锁，避免事务中途由读升级为写时遇到 SQLITE_BUSY
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def _checkin(self, conn):
+        if conn.in_transaction:
+            # 调用方没有提交（通常是异常路径），丢弃未完成的事务
+            conn.rollback()
+        self._last_used[id(conn)] = time.monotonic()
+
+    def _sweep(self, now):
+        """回收已退出线程的连接，关闭空闲超时的连接（调用方持有锁）"""
+        for ident, (thread, conn) in list(self._owned.items()):
+            if not thread.is_alive():
+                del self._owned[ident]
+                if conn.in_transaction:
+                    conn.rollback()
+                self._orphans.append((conn, self._last_used.get(id(conn), now)))
+        kept = []
+        for conn, last_used in self._orphans:
+            if now - last_used > self.max_idle:
+                self._last_used.pop(id(conn), None)
+                conn.close()
+            else:
+                kept.append((conn, last_used))
+        self._orphans = kept
+        self._last_sweep = now
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'sqlite',
+                'thread_connections': len(self._owned),
+                'idle_connections': len(self._orphans),
+            }
+
+    def close(self):
+        """关闭所有连接（进程退出或测试切换数据库时使用）"""
+        with self._lock:
+            self._closed = True
+            conns = [conn for _, conn in self._owned.values()] + [c for c, _ in self._orphans]
+            self._owned.clear()
+            self._orphans = []
+            self._last_used.clear()
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+class OpenGaussPool(_BasePool):
+    """
+    openGauss 有界连接池
+    - 最多 max_size 条连接，借不到时最多等待 timeout 秒
+    - 空闲超过 health_check_interval 的连接借出前执行 SELECT 1 检查
+    - 空闲超过 max_idle 的连接直接淘汰
+    """
+
+    def __init__(self, connect, max_size=10, timeout=10, max_idle=300, health_check_interval=30):
+        super().__init__()
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self._cond = threading.Condition()
+        self._idle = deque()   # [(conn, last_used)]，右端为最近归还
+        self._size = 0         # 已创建（含借出）的连接数
+        self._closed = False
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.timeout
+        conn = None
+        last_used = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+                self._evict_idle(time.monotonic())
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(
+                        f"No database connection available within {self.timeout}s "
+                        f"(pool size {self.max_size})"
+                    )
+                self._cond.wait(remaining)
+
+        if conn is not None:
+            if time.monotonic() - last_used < self.health_check_interval or self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _begin(self, conn):
+        # 块内调用方自己的 with conn.xact() 嵌套为保存点
+        xact = conn.xact()
+        xact.start()
+        return xact
+
+    def _checkin(self, conn):
+        with self._cond:
+            if self._closed or getattr(conn, 'closed', False):
+                self._size -= 1
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _evict_idle(self, now):
+        """淘汰空闲超时的连接（调用方持有锁）；最旧的在左端"""
+        while self._idle and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._discard(conn)
+
+    @staticmethod
+    def _is_healthy(conn):
+        if getattr(conn, 'closed', False):
+            return False
+        try:
+            conn.prepare("SELECT 1").first()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        """关闭连接并丢弃其预编译语句缓存"""
+        self._forget_statements(conn)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                'backend': 'opengauss',
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+                'prepared_statements': sum(len(c) for c in self._statements.values()),
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._size -= 1
+                self._discard(conn)
+            self._cond.notify_all()
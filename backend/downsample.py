@@ -0,0 +1,157 @@
+"""
+曲线降采样：Largest-Triangle-Three-Buckets（LTTB）
+把 n 个点压缩为固定点数，保留峰谷等视觉形状（与按时间桶取平均不同，选出的都是真实数据点）。
+
+数据按块流式输入：事先知道总行数 n，就能确定每个桶的边界，
+只需缓存「当前桶 + 下一个桶」的数据，内存与总行数无关。
+安装了 NumPy 时每个桶的三角形面积向量化计算，否则逐点计算。
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _pick(ax, ay, xs, ys, cx, cy):
+    """返回 xs/ys 中与 (ax, ay)、(cx, cy) 围成三角形面积最大的点的下标"""
+    if np is not None:
+        x = np.asarray(xs, dtype=float)
+        y = np.asarray(ys, dtype=float)
+        return int(np.argmax(np.abs((ax - cx) * (y - ay) - (ax - x) * (cy - ay))))
+    best, best_area = 0, -1.0
+    for i, (x, y) in enumerate(zip(xs, ys)):
+        area = abs((ax - cx) * (y - ay) - (ax - x) * (cy - ay))
+        if area > best_area:
+            best, best_area = i, area
+    return best
+
+
+def _mean(values):
+    if np is not None:
+        return float(np.mean(np.asarray(values, dtype=float)))
+    return sum(values) / len(values)
+
+
+class LTTBStream:
+    """
+    对共享 x 轴的多条序列同时做 LTTB（每条序列独立选点，桶边界相同）
+
+        stream = LTTBStream(total=n, threshold=500, series=2)
+        for xs, labels, columns in chunks:   # columns: 每条序列一个列表
+            stream.feed(xs, labels, columns)
+        result = stream.finish()             # [(labels, values), ...] 每条序列一项
+
+    labels 是随点一起输出的标签（例如时间戳字符串），x 必须是数值（例如 Unix 秒）
+    """
+
+    def __init__(self, total, threshold, series=1):
+        self.total = total
+        self.threshold = threshold
+        self.series = series
+        # 缓冲区第一行的全局下标
+        self._offset = 0
+        self._xs = []
+        self._labels = []
+        self._columns = [[] for _ in range(series)]
+        self._received = 0
+        self._bucket = 0
+        self._selected = [([], []) for _ in range(series)]
+        # 每条序列上一个选中点 (x, y)
+        self._anchors = [None] * series
+        self._passthrough = threshold >= total or threshold < 3
+        self._every = 0 if self._passthrough else (total - 2) / (threshold - 2)
+
+    # ---------- 桶边界 ----------
+
+    def _bounds(self, k, limit):
+        """第 k 个中间桶的全局下标范围 [start, end)；最后一个点（limit - 1）不属于任何桶"""
+        start = int(k * self._every) + 1
+        end = int((k + 1) * self._every) + 1
+        return min(start, limit - 1), min(end, limit - 1)
+
+    # ---------- 输入 ----------
+
+    def feed(self, xs, labels, columns):
+        """追加一块数据（超出 total 的行忽略）"""
+        room = self.total - self._received
+        if room <= 0:
+            return
+        xs, labels = xs[:room], labels[:room]
+        columns = [c[:room] for c in columns]
+        if self._received == 0 and xs:
+            # 第一个点总是保留
+            for s in range(self.series):
+                self._emit(s, labels[0], columns[s][0])
+                self._anchors[s] = (xs[0], columns[s][0])
+        self._received += len(xs)
+        self._xs.extend(xs)
+        self._labels.extend(labels)
+        for s in range(self.series):
+            self._columns[s].extend(columns[s])
+        if not self._passthrough:
+            self._drain(final=False)
+
+    def finish(self):
+        """处理剩余数据，返回每条序列的 (labels, values)"""
+        if self._passthrough:
+            skip = 1 if self._received else 0
+            for s in range(self.series):
+                self._selected[s][0].extend(self._labels[skip:])
+                self._selected[s][1].extend(self._columns[s][skip:])
+        elif self._received >= 2:
+            # 实际行数可能少于 total（查询期间有数据被删除），按已收到的行收尾
+            self._drain(final=True)
+            for s in range(self.series):
+                self._emit(s, self._labels[-1], self._columns[s][-1])
+        self._xs, self._labels, self._columns = [], [], [[] for _ in range(self.series)]
+        return self._selected
+
+    # ---------- 处理 ----------
+
+    def _emit(self, s, label, value):
+        self._selected[s][0].append(label)
+        self._selected[s][1].append(value)
+
+    def _drain(self, final):
+        """处理所有「下一个桶」已完整到达的桶；final 时数据已全部到达"""
+        last_bucket = self.threshold - 3
+        limit = self._received if final else self.total
+        while self._bucket <= last_bucket:
+            start, end = self._bounds(self._bucket, limit)
+            if start >= end:
+                return
+            if self._bucket < last_bucket:
+                next_start, next_end = self._bounds(self._bucket + 1, limit)
+            else:
+                next_start, next_end = end, end
+            if next_start >= next_end:
+                # 下一个桶为空：用最后一个点
+                next_start, next_end = limit - 1, limit
+            if self._received < next_end:
+                return
+
+            lo, hi = start - self._offset, end - self._offset
+            nlo, nhi = next_start - self._offset, next_end - self._offset
+            xs = self._xs[lo:hi]
+            cx = _mean(self._xs[nlo:nhi])
+            for s in range(self.series):
+                ys = self._columns[s][lo:hi]
+                cy = _mean(self._columns[s][nlo:nhi])
+                ax, ay = self._anchors[s]
+                i = _pick(ax, ay, xs, ys, cx, cy)
+                self._emit(s, self._labels[lo + i], ys[i])
+                self._anchors[s] = (xs[i], ys[i])
+            self._bucket += 1
+            self._trim(end)
+
+    def _trim(self, index):
+        """丢弃全局下标 index 之前的行（已处理的桶）"""
+        drop = index - self._offset
+        if drop <= 0:
+            return
+        del self._xs[:drop]
+        del self._labels[:drop]
+        for column in self._columns:
+            del column[:drop]
+        self._offset = index
@@ -0,0 +1,368 @@
+"""
+MQTT 遥测写入缓冲（write-behind）与消息处理线程池
+- KeyedWorkerPool: paho 网络线程只把消息按设备ID 分派给处理线程，同一设备的消息
+  总是由同一线程按到达顺序处理，网络线程不做解码、推送，也不会因写入队列满而阻塞
+- LatestValueBuffer: 状态快照按 (类型, 设备ID) 只保留最新一条，每个合并间隔统一写库和推送，
+  设备发布再快，每个间隔也只有一次写库和推送；事件和温湿度读数不经过这里，不会丢失
+- WriteBehindQueue: 处理线程把解码后的记录放入有界队列；专用写线程按
+  「攒满 batch_size 条或最早一条已等待 flush_interval 毫秒」组成微批次，
+  调用 database.write_batch() 在一个事务内写入，一批只提交一次。
+"""
+
+import atexit
+import queue
+import threading
+import time
+import zlib
+
+from config import (INGEST_BATCH_SIZE, INGEST_FLUSH_INTERVAL_MS, INGEST_QUEUE_SIZE,
+                    INGEST_ENQUEUE_TIMEOUT_MS, MQTT_WORKERS, MQTT_WORKER_QUEUE_SIZE,
+                    MQTT_WORKER_ENQUEUE_TIMEOUT_MS, STATE_COALESCE_INTERVAL_MS)
+
+
+def shard(key, count):
+    """键（设备ID）对应的分片号；crc32 在进程间稳定，多个进程对同一设备得到相同结果"""
+    return zlib.crc32(str(key).encode('utf-8')) % count
+
+
+class KeyedWorkerPool:
+    """
+    按键分片的处理线程池：同一个键（设备ID）的任务总在同一线程中按提交顺序执行，
+    不同设备并行处理。每个线程一个有界队列，满时等待 enqueue_timeout 后丢弃并计数。
+    workers 为 0 时在调用线程中直接执行
+    """
+
+    def __init__(self, workers=MQTT_WORKERS, max_queue=MQTT_WORKER_QUEUE_SIZE,
+                 enqueue_timeout_ms=MQTT_WORKER_ENQUEUE_TIMEOUT_MS, name='mqtt-worker'):
+        self.workers = workers
+        self.enqueue_timeout = enqueue_timeout_ms / 1000.0
+        self._queues = [queue.Queue(maxsize=max_queue) for _ in range(workers)]
+        self._name = name
+        self._threads = []
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'processed': 0,
+            'failed': 0,
+            'dropped': 0,
+            'max_wait_ms': None,
+            'total_wait_ms': 0.0,
+        }
+
+    def _shard(self, key):
+        return shard(key, self.workers)
+
+    # ---------- 生产者接口 ----------
+
+    def submit(self, key, func, *args):
+        """提交一个任务；队列已满且等待超时时丢弃并返回 False"""
+        if not self.workers:
+            with self._stats_lock:
+                self._stats['submitted'] += 1
+            self._execute(func, args, time.monotonic())
+            return True
+        try:
+            self._queues[self._shard(key)].put((func, args, time.monotonic()), timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats['dropped'] += 1
+            return False
+        with self._stats_lock:
+            self._stats['submitted'] += 1
+        return True
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        if not self._threads:
+            self._stopping.clear()
+            for i, q in enumerate(self._queues):
+                thread = threading.Thread(target=self._run, args=(q,), name=f'{self._name}-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            if self._threads:
+                atexit.register(self.stop)
+        return self
+
+    def join(self):
+        """阻塞直到当前已提交的任务全部执行完"""
+        for q in self._queues:
+            q.join()
+
+    def stop(self, timeout=5.0):
+        """执行完剩余任务后停止处理线程"""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    # ---------- 指标 ----------
+
+    def stats(self):
+        with self._stats_lock:
+            s = dict(self._stats)
+        total = s.pop('total_wait_ms')
+        done = s['processed'] + s['failed']
+        s['avg_wait_ms'] = round(total / done, 3) if done else None
+        s['workers'] = self.workers
+        s['queue_depth'] = [q.qsize() for q in self._queues]
+        s['max_queue'] = self._queues[0].maxsize if self._queues else 0
+        return s
+
+    # ---------- 处理线程 ----------
+
+    def _run(self, q):
+        while True:
+            try:
+                func, args, queued_at = q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            try:
+                self._execute(func, args, queued_at)
+            finally:
+                q.task_done()
+
+    def _execute(self, func, args, queued_at):
+        wait_ms = (time.monotonic() - queued_at) * 1000
+        try:
+            func(*args)
+            outcome = 'processed'
+        except Exception as e:
+            outcome = 'failed'
+            print(f"✗ 处理任务失败: {e}")
+        with self._stats_lock:
+            s = self._stats
+            s[outcome] += 1
+            s['total_wait_ms'] += wait_ms
+            s['max_wait_ms'] = round(max(s['max_wait_ms'] or 0, wait_ms), 3)
+
+
+class LatestValueBuffer:
+    """
+    最新值合并缓冲：同一个键在一个间隔内多次 put 时只保留最后一次，
+    刷写线程每 interval 毫秒按首次出现的顺序执行各键最新的任务。interval 为 0 时直接执行
+    """
+
+    def __init__(self, interval_ms=STATE_COALESCE_INTERVAL_MS, name='state-coalescer'):
+        self.interval = interval_ms / 1000.0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._name = name
+        self._thread = None
+        self._stopping = threading.Event()
+        self._stats = {
+            'received': 0,
+            'coalesced': 0,
+            'flushed': 0,
+            'failed': 0,
+            'last_flush_size': 0,
+        }
+
+    # ---------- 生产者接口 ----------
+
+    def put(self, key, func, *args):
+        """登记键的最新任务，替换该键尚未执行的任务"""
+        with self._lock:
+            self._stats['received'] += 1
+            inline = self._thread is None
+            if not inline:
+                if key in self._pending:
+                    self._stats['coalesced'] += 1
+                self._pending[key] = (func, args)
+        if inline:
+            # 未启动或已停止（退出时处理线程中的剩余消息）时直接执行
+            self._execute([(func, args)])
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        if self.interval > 0 and (self._thread is None or not self._thread.is_alive()):
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def flush(self):
+        """立即执行全部待处理任务"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        self._execute(pending.values())
+
+    def stop(self, timeout=5.0):
+        """停止刷写线程并执行剩余任务，之后的 put 直接执行"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        with self._lock:
+            self._thread = None
+        self.flush()
+
+    # ---------- 指标 ----------
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['pending'] = len(self._pending)
+        s['interval_ms'] = self.interval * 1000
+        return s
+
+    # ---------- 刷写线程 ----------
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.flush()
+
+    def _execute(self, tasks):
+        flushed = failed = 0
+        for func, args in tasks:
+            try:
+                func(*args)
+                flushed += 1
+            except Exception as e:
+                failed += 1
+                print(f"✗ 处理状态快照失败: {e}")
+        with self._lock:
+            self._stats['flushed'] += flushed
+            self._stats['failed'] += failed
+            if flushed or failed:
+                self._stats['last_flush_size'] = flushed + failed
+
+
+class WriteBehindQueue:
+    """有界队列 + 单写线程的微批量写入器"""
+
+    def __init__(self, write_batch, batch_size=INGEST_BATCH_SIZE,
+                 flush_interval_ms=INGEST_FLUSH_INTERVAL_MS, max_queue=INGEST_QUEUE_SIZE,
+                 enqueue_timeout_ms=INGEST_ENQUEUE_TIMEOUT_MS, name='ingest-writer'):
+        self._write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.enqueue_timeout = enqueue_timeout_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._name = name
+        self._thread = None
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_batch_size': 0,
+            'last_flush_ms': None,
+            'max_flush_ms': None,
+            'total_flush_ms': 0.0,
+        }
+
+    # ---------- 生产者接口 ----------
+
+    def submit(self, kind, **fields):
+        """放入一条记录；队列已满且等待超时时丢弃并返回 False"""
+        try:
+            self._queue.put((kind, fields), timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats['dropped'] += 1
+            return False
+        with self._stats_lock:
+            self._stats['enqueued'] += 1
+        return True
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def flush(self):
+        """阻塞直到当前已入队的记录全部写完"""
+        self._queue.join()
+
+    def stop(self, timeout=5.0):
+        """写完剩余记录后停止写线程"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    # ---------- 指标 ----------
+
+    def stats(self):
+        with self._stats_lock:
+            s = dict(self._stats)
+        total = s.pop('total_flush_ms')
+        s['avg_flush_ms'] = round(total / s['batches'], 3) if s['batches'] else None
+        s['queue_depth'] = self._queue.qsize()
+        s['max_queue'] = self._queue.maxsize
+        s['batch_size'] = self.batch_size
+        s['flush_interval_ms'] = self.flush_interval * 1000
+        return s
+
+    # ---------- 写线程 ----------
+
+    def _next_batch(self):
+        """等待第一条记录，然后在 flush_interval 内尽量攒满一批"""
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            elif self._stopping.is_set():
+                return
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        written = failed = 0
+        try:
+            self._write_batch(batch)
+            written = len(batch)
+        except Exception as e:
+            # 整批失败时逐条重试，避免一条坏数据拖垮整批
+            print(f"✗ 批量写入失败（{len(batch)} 条），改为逐条写入: {e}")
+            for record in batch:
+                try:
+                    self._write_batch([record])
+                    written += 1
+                except Exception as e2:
+                    failed += 1
+                    print(f"✗ 丢弃无法写入的记录 {record[0]}: {e2}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            s = self._stats
+            s['written'] += written
+            s['failed'] += failed
+            s['batches'] += 1
+            s['last_batch_size'] = len(batch)
+            s['last_flush_ms'] = round(elapsed_ms, 3)
+            s['max_flush_ms'] = round(max(s['max_flush_ms'] or 0, elapsed_ms), 3)
+            s['total_flush_ms'] += elapsed_ms
+        for _ in batch:
+            self._queue.task_done()
@@ -1,15 +1,30 @@
 """
 MQTT 客户端模块
-订阅温湿度传感器主题，支持多个设备
-通过 WebSocket 实时推送数据到前端
+订阅温湿度传感器与各设备的状态 / 事件主题，支持多个设备
+消息按主题路由到各设备类型的处理器（见 topic_router），通过 WebSocket 实时推送数据到前端
 """
 
 import paho.mqtt.client as mqtt
 import json
-from database import (insert_sensor_data, upsert_lock_state, insert_lock_event,
-                     upsert_lighting_state, insert_lighting_event,
-                     upsert_smoke_alarm_state, insert_smoke_alarm_event)
-from config import MQTT_BROKER, MQTT_PORT, MQTT_TOPIC
+from database import write_batch, state_cache, enable_state_cache
+from config import (MQTT_BROKER, MQTT_PORT, MQTT_TOPIC, MQTT_CLIENT_ID, MQTT_INGEST,
+                    MQTT_SHARED_GROUP, MQTT_SHARED_WORKERS, MQTT_SHARED_WORKER_INDEX, SENSOR_STORE)
+from ingest import WriteBehindQueue, KeyedWorkerPool, LatestValueBuffer, shard
+from topic_router import TopicRouter, shared_topics
+from payloads import (PayloadError, decoder, SensorReading, LockState, LockEvent,
+                      LightingState, LightingEvent, SmokeAlarmState, SmokeAlarmEvent)
+
+# 设备状态缓存只在收到全部设备主题的进程中启用（共享订阅组的成员只收到一部分消息）
+enable_state_cache(MQTT_INGEST and not MQTT_SHARED_GROUP)
+
+# 写入缓冲：on_message 只入队，写线程按微批次写库
+ingest_queue = WriteBehindQueue(write_batch).start()
+
+# 处理线程池：网络线程只分派消息，同一设备的消息由同一处理线程按序处理
+dispatch_pool = KeyedWorkerPool().start()
+
+# 状态快照合并：每个设备每个合并间隔只写库、推送最新一条状态（事件和温湿度读数不合并）
+state_buffer = LatestValueBuffer().start()
 
 # WebSocket 实例（延迟导入避免循环依赖）
 _socketio = None
@@ -29,214 +44,218 @@ def emit_to_clients(event, data):
             print(f"✗ WebSocket 推送失败: {e}")
 
 
-def parse_device_id(topic):
+def _flush_state(kind, fields, event, payload):
+    """写入并推送一条状态快照（由 state_buffer 按设备合并后调用）"""
+    ingest_queue.submit(kind, **fields)
+    emit_to_clients(event, payload)
+
+
+# 主题路由：每种设备的状态 / 事件主题注册一个处理器，处理器参数为 + 匹配到的设备ID 和解码后的载荷结构体（见 payloads）
+router = TopicRouter()
+
+
+if MQTT_SHARED_GROUP and not 0 <= MQTT_SHARED_WORKER_INDEX < MQTT_SHARED_WORKERS:
+    raise ValueError(f"MQTT_SHARED_WORKER_INDEX 应在 0 到 {MQTT_SHARED_WORKERS - 1} 之间")
+
+if MQTT_INGEST and MQTT_SHARED_GROUP and SENSOR_STORE == 'segments':
+    # 段文件的追加由目录级文件锁串行化，多个 ingest 进程只会互相等待；只支持一个 ingest 进程写入
+    raise ValueError("SENSOR_STORE=segments 不支持多个 ingest 进程，请取消 MQTT_SHARED_GROUP 或改用 SENSOR_STORE=db")
+
+
+def _is_state(pattern):
+    return pattern.endswith('/state')
+
+
+def subscriptions():
     """
-    从主题中提取设备ID
-    例如: home/room1/temperature_humidity -> room1
-          home/room2/temperature_humidity -> room2
+    本进程订阅的主题（不做 ingest 时为空）
+    共享订阅组内：事件和温湿度读数加 $share 前缀由 Broker 分摊，状态主题直接订阅、在 on_message 中按设备分片
     """
-    parts = topic.split('/')
-    if len(parts) >= 2:
-        return parts[1]  # 返回位置作为设备ID
-    return 'room1'  # 默认
+    if not MQTT_INGEST:
+        return []
+    patterns = router.patterns()
+    if not MQTT_SHARED_GROUP:
+        return patterns
+    return (shared_topics([p for p in patterns if not _is_state(p)], MQTT_SHARED_GROUP)
+            + [p for p in patterns if _is_state(p)])
+
+
+def owns_device(device_id):
+    """共享订阅组内该设备的状态是否由本进程写入"""
+    return not MQTT_SHARED_GROUP or shard(device_id, MQTT_SHARED_WORKERS) == MQTT_SHARED_WORKER_INDEX
 
 
 def on_connect(client, userdata, flags, rc):
-    """连接回调"""
+    """连接回调：订阅全部已注册路由的主题（共享订阅组内多个进程分摊）"""
     if rc == 0:
-        print(f"✓ 已连接到 MQTT Broker: {MQTT_BROKER}:{MQTT_PORT}")
-        # 温湿度
-        client.subscribe(MQTT_TOPIC)
-        print(f"✓ 已订阅主题: {MQTT_TOPIC}")
-        # 门锁状态与事件
-        client.subscribe("home/lock/+/state")
-        client.subscribe("home/lock/+/event")
-        print("✓ 已订阅主题: home/lock/+/state, home/lock/+/event")
-        # ------------------------------------------------------------------------------------------------------
-        # 灯具状态与事件
-        client.subscribe("home/lighting/+/state")
-        client.subscribe("home/lighting/+/event")
-        print("✓ 已订阅主题: home/lighting/+/state, home/lighting/+/event")
-        # ------------------------------------------------------------------------------------------------------
-        # 烟雾报警器状态与事件
-        client.subscribe("home/smoke_alarm/+/state")
-        client.subscribe("home/smoke_alarm/+/event")
-        print("✓ 已订阅主题: home/smoke_alarm/+/state, home/smoke_alarm/+/event")
+        print(f"✓ 已连接到 MQTT Broker: {MQTT_BROKER}:{MQTT_PORT}（客户端ID: {MQTT_CLIENT_ID}）")
+        topics = subscriptions()
+        if not topics:
+            print("✓ MQTT_INGEST=false：只发布控制命令，不订阅设备主题")
+            return
+        client.subscribe([(topic, 0) for topic in topics])
+        print(f"✓ 已订阅主题: {', '.join(topics)}")
     else:
         print(f"✗ 连接失败，返回码: {rc}")
 
 
 def on_message(client, userdata, msg):
-    """消息回调：处理温湿度、门锁、灯具和烟雾报警器数据"""
-    try:
-        topic = msg.topic
-        payload = msg.payload.decode()
-
-        # 门锁主题处理
-        if topic.startswith("home/lock/"):
-            parts = topic.split('/')
-            lock_id = parts[2] if len(parts) > 2 else 'front_door'
-            try:
-                data = json.loads(payload)
-            except json.JSONDecodeError:
-                data = {}
-            if topic.endswith('/state'):
-                # 期望: { locked: true/false, method, actor, battery, ts }
-                upsert_lock_state(
-                    lock_id=lock_id,
-                    locked=bool(data.get('locked', False)),  # 默认解锁状态
-                    method=data.get('method'),
-                    actor=data.get('actor'),
-                    battery=data.get('battery'),
-                    ts=data.get('ts')
-                )
-                print(f"📨 [lock:{lock_id}] state locked={data.get('locked')} method={data.get('method')} actor={data.get('actor')}")
-                # WebSocket 实时推送
-                emit_to_clients('lock_state_update', {
-                    'lock_id': lock_id,
-                    'locked': data.get('locked'),
-                    'method': data.get('method'),
-                    'actor': data.get('actor'),
-                    'battery': data.get('battery'),
-                    'timestamp': data.get('ts')
-                })
-            elif topic.endswith('/event'):
-                insert_lock_event(
-                    lock_id=lock_id,
-                    event_type=str(data.get('type', 'event')),
-                    method=data.get('method'),
-                    actor=data.get('actor'),
-                    detail=json.dumps(data.get('detail')) if isinstance(data.get('detail'), (dict, list)) else data.get('detail'),
-                    ts=data.get('ts')
-                )
-                print(f"📨 [lock:{lock_id}] event {data.get('type')} by {data.get('actor')}")
-                # WebSocket 实时推送
-                emit_to_clients('lock_event', {
-                    'lock_id': lock_id,
-                    'event_type': data.get('type'),
-                    'method': data.get('method'),
-                    'actor': data.get('actor'),
-                    'detail': data.get('detail'),
-                    'timestamp': data.get('ts')
-                })
-            return
-        # ------------------------------------------------------------------------------------------------------    
-        # 灯具主题处理
-        if topic.startswith("home/lighting/"):
-            parts = topic.split('/')
-            light_id = parts[2] if len(parts) > 2 else 'light_room1'
-            try:
-                data = json.loads(payload)
-            except json.JSONDecodeError:
-                data = {}
-            if topic.endswith('/state'):
-                # 期望: { power: true/false, brightness: 0-100, auto_mode: true/false, room_brightness: float, color_temp: int }
-                upsert_lighting_state(
-                    light_id=light_id,
-                    power=data.get('power'),
-                    brightness=data.get('brightness'),
-                    auto_mode=data.get('auto_mode'),
-                    room_brightness=data.get('room_brightness'),
-                    color_temp=data.get('color_temp')
-                )
-                print(f"📨 [light:{light_id}] state power={data.get('power')} brightness={data.get('brightness')}% auto={data.get('auto_mode')}")
-                # WebSocket 实时推送
-                emit_to_clients('lighting_state_update', {
-                    'light_id': light_id,
-                    'power': data.get('power'),
-                    'brightness': data.get('brightness'),
-                    'auto_mode': data.get('auto_mode'),
-                    'room_brightness': data.get('room_brightness'),
-                    'color_temp': data.get('color_temp')
-                })
-            elif topic.endswith('/event'):
-                insert_lighting_event(
-                    light_id=light_id,
-                    event_type=str(data.get('type', 'event')),
-                    old_value=data.get('old_value'),
-                    new_value=data.get('new_value'),
-                    detail=data.get('detail')
-                )
-                print(f"📨 [light:{light_id}] event {data.get('type')} - {data.get('detail')}")
-                # WebSocket 实时推送
-                emit_to_clients('lighting_event', {
-                    'light_id': light_id,
-                    'event_type': data.get('type'),
-                    'old_value': data.get('old_value'),
-                    'new_value': data.get('new_value'),
-                    'detail': data.get('detail')
-                })
-            return
-        # ------------------------------------------------------------------------------------------------------    
-
-        # 烟雾报警器主题处理
-        if topic.startswith("home/smoke_alarm/"):
-            parts = topic.split('/')
-            alarm_id = parts[2] if len(parts) > 2 else 'smoke_unknown'
-            try:
-                data = json.loads(payload)
-            except json.JSONDecodeError:
-                data = {}
-            if topic.endswith('/state'):
-                # 期望: { smoke_level: float, alarm_active: bool, battery: int, test_mode: bool, location: str }
-                upsert_smoke_alarm_state(
-                    alarm_id=alarm_id,
-                    location=data.get('location'),
-                    smoke_level=data.get('smoke_level'),
-                    alarm_active=bool(data.get('alarm_active', False)),
-                    battery=data.get('battery'),
-                    test_mode=bool(data.get('test_mode', False)),
-                    sensitivity=data.get('sensitivity')
-                )
-                print(f"📨 [smoke:{alarm_id}] smoke_level={data.get('smoke_level')} alarm={data.get('alarm_active')} battery={data.get('battery')}%")
-                # WebSocket 实时推送（烟雾报警器状态更新 - 重要！）
-                emit_to_clients('smoke_alarm_state_update', {
-                    'alarm_id': alarm_id,
-                    'location': data.get('location'),
-                    'smoke_level': data.get('smoke_level'),
-                    'alarm_active': data.get('alarm_active'),
-                    'battery': data.get('battery'),
-                    'test_mode': data.get('test_mode'),
-                    'sensitivity': data.get('sensitivity')
-                })
-            elif topic.endswith('/event'):
-                insert_smoke_alarm_event(
-                    alarm_id=alarm_id,
-                    event_type=str(data.get('type', 'event')),
-                    smoke_level=data.get('smoke_level'),
-                    detail=json.dumps(data.get('detail')) if isinstance(data.get('detail'), (dict, list)) else data.get('detail')
-                )
-                print(f"📨 [smoke:{alarm_id}] event {data.get('type')}")
-                # WebSocket 实时推送（烟雾报警器事件 - 紧急通知！）
-                emit_to_clients('smoke_alarm_event', {
-                    'alarm_id': alarm_id,
-                    'event_type': data.get('type'),
-                    'smoke_level': data.get('smoke_level'),
-                    'detail': data.get('detail'),
-                    'priority': 'high' if data.get('type') == 'alarm_triggered' else 'normal'
-                })
-            return
+    """
+    消息回调（paho 网络线程）：按设备ID（主题中第一个 + 层）分派到处理线程后立即返回，
+    处理线程繁忙时丢弃并计入 dispatch_pool 的 dropped
+    """
+    hit = router.match(msg.topic)
+    key = hit[1][0] if hit is not None and hit[1] else msg.topic
+    if hit is not None and _is_state(hit[0].pattern) and not owns_device(key):
+        # 该设备的状态由组内其他进程写入
+        return
+    dispatch_pool.submit(key, handle_message, msg.topic, msg.payload)
 
-        # 温湿度主题处理
-        device_id = parse_device_id(topic)
-        try:
-            data = json.loads(payload)
-        except json.JSONDecodeError:
-            data = eval(payload)
-        insert_sensor_data(data, device_id)
-        print(f"📨 [{device_id}] 温度: {data['temperature']}°C, 湿度: {data['humidity']}%")
-        # WebSocket 实时推送
-        emit_to_clients('sensor_data_update', {
-            'device_id': device_id,
-            'temperature': data.get('temperature'),
-            'humidity': data.get('humidity'),
-            'timestamp': data.get('timestamp')
-        })
 
+def handle_message(topic, payload):
+    """在处理线程中解码并调用主题对应的处理器"""
+    try:
+        if not router.dispatch(topic, payload):
+            print(f"⚠ 没有处理器的主题: {topic}")
+    except PayloadError as e:
+        print(f"✗ 丢弃格式错误的消息 [{topic}]: {e}")
     except Exception as e:
         print(f"✗ 处理消息时出错: {e}")
-        print(f"  主题: {msg.topic}")
-        print(f"  数据: {msg.payload.decode()}")
+        print(f"  主题: {topic}")
+        print(f"  数据: {payload.decode(errors='replace')}")
+
+
+# ==================== 温湿度 ====================
+
+@router.route(MQTT_TOPIC, decode=decoder(SensorReading))
+def handle_sensor_reading(*args):
+    """温湿度读数（MQTT_TOPIC 中第一个 + 为设备ID，如 home/room1/temperature_humidity）"""
+    data = args[-1]
+    device_id = args[0] if len(args) > 1 else 'room1'
+    ingest_queue.submit(
+        'sensor',
+        device_id=device_id,
+        temperature=data.temperature,
+        humidity=data.humidity
+    )
+    print(f"📨 [{device_id}] 温度: {data.temperature}°C, 湿度: {data.humidity}%")
+    # WebSocket 实时推送
+    emit_to_clients('sensor_data_update', {
+        'device_id': device_id,
+        'temperature': data.temperature,
+        'humidity': data.humidity,
+        'timestamp': data.timestamp
+    })
+
+
+# ==================== 门锁 ====================
+
+@router.route("home/lock/+/state", decode=decoder(LockState))
+def handle_lock_state(lock_id, data):
+    """门锁状态（LockState）"""
+    state = {
+        'locked': data.locked,
+        'method': data.method,
+        'actor': data.actor,
+        'battery': data.battery
+    }
+    # 先更新内存状态（状态接口立即可见），写库和推送按设备合并
+    state_cache.merge('lock', lock_id, state)
+    print(f"📨 [lock:{lock_id}] state locked={data.locked} method={data.method} actor={data.actor}")
+    state_buffer.put(('lock', lock_id), _flush_state, 'lock_state', dict(state, lock_id=lock_id), 'lock_state_update',
+                     dict(state, lock_id=lock_id, timestamp=data.ts))
+
+
+@router.route("home/lock/+/event", decode=decoder(LockEvent))
+def handle_lock_event(lock_id, data):
+    """门锁事件（LockEvent）"""
+    ingest_queue.submit(
+        'lock_event',
+        lock_id=lock_id,
+        event_type=data.type,
+        method=data.method,
+        actor=data.actor,
+        detail=data.detail,
+        ts=data.ts
+    )
+    print(f"📨 [lock:{lock_id}] event {data.type} by {data.actor}")
+    # WebSocket 实时推送
+    emit_to_clients('lock_event', {
+        'lock_id': lock_id,
+        'event_type': data.type,
+        'method': data.method,
+        'actor': data.actor,
+        'detail': data.detail,
+        'timestamp': data.ts
+    })
+
+
+# ==================== 灯具 ====================
+
+@router.route("home/lighting/+/state", decode=decoder(LightingState))
+def handle_lighting_state(light_id, data):
+    """灯具状态（LightingState）"""
+    state = data._asdict()
+    state_cache.merge('lighting', light_id, state)
+    print(f"📨 [light:{light_id}] state power={data.power} brightness={data.brightness}% auto={data.auto_mode}")
+    state_buffer.put(('lighting', light_id), _flush_state, 'lighting_state', dict(state, light_id=light_id),
+                     'lighting_state_update', dict(state, light_id=light_id))
+
+
+@router.route("home/lighting/+/event", decode=decoder(LightingEvent))
+def handle_lighting_event(light_id, data):
+    """灯具事件（LightingEvent）"""
+    ingest_queue.submit(
+        'lighting_event',
+        light_id=light_id,
+        event_type=data.type,
+        old_value=data.old_value,
+        new_value=data.new_value,
+        detail=data.detail
+    )
+    print(f"📨 [light:{light_id}] event {data.type} - {data.detail}")
+    # WebSocket 实时推送
+    emit_to_clients('lighting_event', {
+        'light_id': light_id,
+        'event_type': data.type,
+        'old_value': data.old_value,
+        'new_value': data.new_value,
+        'detail': data.detail
+    })
+
+
+# ==================== 烟雾报警器 ====================
+
+@router.route("home/smoke_alarm/+/state", decode=decoder(SmokeAlarmState))
+def handle_smoke_alarm_state(alarm_id, data):
+    """烟雾报警器状态（SmokeAlarmState）"""
+    state = data._asdict()
+    state_cache.merge('smoke_alarm', alarm_id, state)
+    print(f"📨 [smoke:{alarm_id}] smoke_level={data.smoke_level} alarm={data.alarm_active} battery={data.battery}%")
+    # 报警状态变化另有 alarm_triggered 等事件实时推送，状态快照按设备合并
+    state_buffer.put(('smoke_alarm', alarm_id), _flush_state, 'smoke_alarm_state', dict(state, alarm_id=alarm_id),
+                     'smoke_alarm_state_update', dict(state, alarm_id=alarm_id))
+
+
+@router.route("home/smoke_alarm/+/event", decode=decoder(SmokeAlarmEvent))
+def handle_smoke_alarm_event(alarm_id, data):
+    """烟雾报警器事件（SmokeAlarmEvent）"""
+    ingest_queue.submit(
+        'smoke_alarm_event',
+        alarm_id=alarm_id,
+        event_type=data.type,
+        smoke_level=data.smoke_level,
+        detail=data.detail
+    )
+    print(f"📨 [smoke:{alarm_id}] event {data.type}")
+    # WebSocket 实时推送（烟雾报警器事件 - 紧急通知！）
+    emit_to_clients('smoke_alarm_event', {
+        'alarm_id': alarm_id,
+        'event_type': data.type,
+        'smoke_level': data.smoke_level,
+        'detail': data.detail,
+        'priority': 'high' if data.type == 'alarm_triggered' else 'normal'
+    })
 
 
 def on_disconnect(client, userdata, rc):
@@ -246,7 +265,7 @@ def on_disconnect(client, userdata, rc):
 
 
 # 创建 MQTT 客户端
-client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=MQTT_CLIENT_ID)
 client.on_connect = on_connect
 client.on_message = on_message
 client.on_disconnect = on_disconnect
@@ -303,10 +322,8 @@ def publish_lighting_auto_adjust(light_id, room_brightness):
 if __name__ == "__main__":
     print("="*50)
     print("MQTT 客户端运行中...")
-    print(f"订阅主题: {MQTT_TOPIC}")
-    print("订阅主题: home/lock/+/state, home/lock/+/event")
-    print("订阅主题: home/lighting/+/state, home/lighting/+/event")
-    print("订阅主题: home/smoke_alarm/+/state, home/smoke_alarm/+/event")
+    for topic in subscriptions():
+        print(f"订阅主题: {topic}")
     print("="*50)
     
     try:
@@ -317,4 +334,7 @@ if __name__ == "__main__":
         print("\n正在停止 MQTT 客户端...")
         client.loop_stop()
         client.disconnect()
+        dispatch_pool.stop()
+        state_buffer.stop()
+        ingest_queue.stop()
         print("✓ 已停止")
@@ -0,0 +1,79 @@
+"""
+游标（keyset）分页
+历史数据与事件列表统一按 (timestamp DESC, id) 排序。游标是上一页最后一行 (timestamp, id)
+的不透明编码，下一页从该位置之后沿索引继续读取：翻到多深都只读取 limit 行，
+而 LIMIT/OFFSET 需要先跳过前面的所有行。
+
+请求参数：
+- limit:  每页条数
+- cursor: 上一页返回的 next_cursor（第一页可传空值 cursor=）
+- before / after: 只返回该时间之前 / 之后的记录（ISO 格式，不含边界本身）
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+PAGE_ARGS = ('cursor', 'before', 'after')
+
+# 单页最大条数
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    """游标无法解析"""
+
+
+def encode_cursor(timestamp, row_id):
+    """把一行的 (timestamp, id) 编码为 URL 安全的游标字符串"""
+    raw = json.dumps([timestamp, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (timestamp 字符串, id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, row_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidCursor("cursor 无效") from e
+    if not isinstance(timestamp, str) or not isinstance(row_id, int):
+        raise InvalidCursor("cursor 无效")
+    return timestamp, row_id
+
+
+def parse_time(value):
+    """解析 ISO 时间参数（空值返回 None）"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '')).replace(tzinfo=None)
+
+
+def wants_page(args):
+    """请求带有 cursor / before / after 任一参数时返回分页格式 {'items', 'next_cursor'}"""
+    return any(k in args for k in PAGE_ARGS)
+
+
+def parse_page_args(args, default_limit):
+    """
+    解析 limit / cursor / before / after 查询参数，返回 get_*_page() 的关键字参数
+    参数错误时抛出 ValueError（InvalidCursor 是其子类）
+    """
+    limit = args.get('limit', default_limit, type=int)
+    if limit <= 0:
+        raise ValueError("limit 必须为正整数")
+    cursor = args.get('cursor') or None
+    if cursor:
+        decode_cursor(cursor)
+    try:
+        before = parse_time(args.get('before'))
+        after = parse_time(args.get('after'))
+    except ValueError:
+        raise ValueError("时间格式错误，应为 ISO 格式，如 2024-01-01T00:00:00") from None
+    return {
+        'limit': min(limit, MAX_PAGE_SIZE),
+        'cursor': cursor,
+        'before': before,
+        'after': after,
+    }
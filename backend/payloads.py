@@ -0,0 +1,187 @@
+"""
+MQTT 载荷的类型化解码
+每种主题的载荷声明为一个 NamedTuple 结构体（字段类型 + 缺省值），decoder() 在注册路由时把它编译成
+一个解码函数：JSON 解析（已安装 orjson 时用 orjson）后按预先生成的字段表一次完成校验和类型转换，
+返回结构体实例，处理器直接按属性取值。
+
+- 没有缺省值的字段必填，值为 null 视同缺失；载荷中多余的字段忽略
+- 数值字段兼容数字字符串（"21.5"），其余字段类型须与声明一致
+- 类型不符、缺少必填字段、不是 JSON 对象的载荷抛出 PayloadError（由路由计入 rejected 并丢弃），
+  不会对载荷做 eval 或其他兜底解析
+
+    decode = decoder(LockState)
+    state = decode(b'{"locked": true, "battery": 80}')   # LockState(locked=True, ..., battery=80)
+"""
+
+import json
+from typing import NamedTuple, Optional, get_type_hints, get_args
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+
+class PayloadError(ValueError):
+    """载荷格式错误"""
+
+
+class Text:
+    """类型标记：字符串原样保留，数值 / 对象 / 数组序列化为 JSON 文本（对应数据库 TEXT 列）"""
+
+
+def _finite(value):
+    # 标准库 json 会解析出 NaN / Infinity，orjson 不会
+    return value == value and abs(value) != float('inf')
+
+
+def _number(name, value):
+    # bool 是 int 的子类，需要单独排除
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and _finite(value):
+        return float(value)
+    # 兼容旧设备把读数发成数字字符串（如 "21.5"）
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            pass
+        else:
+            if _finite(number):
+                return number
+    raise PayloadError(f"字段 {name} 应为数值")
+
+
+def _integer(name, value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    # 电量、亮度等整数列也接受设备发来的小数，四舍五入
+    if isinstance(value, float) and _finite(value):
+        return round(value)
+    raise PayloadError(f"字段 {name} 应为整数")
+
+
+def _boolean(name, value):
+    if isinstance(value, bool):
+        return value
+    if value in (0, 1) and not isinstance(value, float):
+        return bool(value)
+    raise PayloadError(f"字段 {name} 应为布尔值")
+
+
+def _string(name, value):
+    if isinstance(value, str):
+        return value
+    raise PayloadError(f"字段 {name} 应为字符串")
+
+
+def _text(name, value):
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+_CONVERTERS = {
+    float: _number,
+    int: _integer,
+    bool: _boolean,
+    str: _string,
+    Text: _text,
+}
+
+
+def decoder(struct):
+    """把 NamedTuple 结构体编译为解码函数 decode(payload) -> struct 实例"""
+    hints = get_type_hints(struct)
+    fields = []
+    for name in struct._fields:
+        hint = hints[name]
+        # Optional[X] 取 X
+        args = [a for a in get_args(hint) if a is not type(None)]
+        convert = _CONVERTERS.get(args[0] if args else hint)
+        if convert is None:
+            raise TypeError(f"{struct.__name__}.{name}: 不支持的字段类型 {hint}")
+        required = name not in struct._field_defaults
+        fields.append((name, convert, required, struct._field_defaults.get(name)))
+    fields = tuple(fields)
+    make = struct._make
+
+    def decode(payload):
+        try:
+            data = _loads(payload)
+        except (ValueError, UnicodeDecodeError):
+            raise PayloadError("不是合法的 JSON") from None
+        if not isinstance(data, dict):
+            raise PayloadError("载荷应为 JSON 对象")
+        values = []
+        for name, convert, required, default in fields:
+            value = data.get(name)
+            if value is None:
+                if required:
+                    raise PayloadError(f"缺少字段 {name}")
+                values.append(default)
+            else:
+                values.append(convert(name, value))
+        return make(values)
+
+    decode.struct = struct
+    return decode
+
+
+# ==================== 各主题的载荷结构 ====================
+
+class SensorReading(NamedTuple):
+    """home/<设备ID>/temperature_humidity"""
+    temperature: float
+    humidity: float
+    timestamp: Optional[str] = None
+
+
+class LockState(NamedTuple):
+    """home/lock/<锁ID>/state"""
+    locked: bool = False  # 缺省按解锁处理
+    method: Optional[str] = None
+    actor: Optional[str] = None
+    battery: Optional[int] = None
+    ts: Optional[str] = None
+
+
+class LockEvent(NamedTuple):
+    """home/lock/<锁ID>/event"""
+    type: str = 'event'
+    method: Optional[str] = None
+    actor: Optional[str] = None
+    detail: Optional[Text] = None
+    ts: Optional[str] = None
+
+
+class LightingState(NamedTuple):
+    """home/lighting/<灯具ID>/state"""
+    power: Optional[bool] = None
+    brightness: Optional[int] = None
+    auto_mode: Optional[bool] = None
+    room_brightness: Optional[float] = None
+    color_temp: Optional[int] = None
+
+
+class LightingEvent(NamedTuple):
+    """home/lighting/<灯具ID>/event"""
+    type: str = 'event'
+    old_value: Optional[Text] = None
+    new_value: Optional[Text] = None
+    detail: Optional[Text] = None
+
+
+class SmokeAlarmState(NamedTuple):
+    """home/smoke_alarm/<报警器ID>/state"""
+    location: Optional[str] = None
+    smoke_level: Optional[float] = None
+    alarm_active: bool = False
+    battery: Optional[int] = None
+    test_mode: bool = False
+    sensitivity: Optional[str] = None
+
+
+class SmokeAlarmEvent(NamedTuple):
+    """home/smoke_alarm/<报警器ID>/event"""
+    type: str = 'event'
+    smoke_level: Optional[float] = None
+    detail: Optional[Text] = None
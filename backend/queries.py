@@ -0,0 +1,543 @@
+"""
+SQL 语句目录
+设备状态、事件和温湿度数据的读写语句在这里集中命名，每条语句只写一次：
+- 字符串：按 SQLite 写法给出，openGauss 版本在导入时自动转换
+  （? 依次替换为 $1..$n，CURRENT_TIMESTAMP 替换为 NOW()）
+- 字典：两种数据库写法不同（如 UPSERT），分别给出 'sqlite' / 'opengauss'
+
+使用方式：
+    cur.execute(sql('lock_state.get'), (lock_id,))        # SQLite
+    rows = prepared(conn, 'lock_state.get')(lock_id)      # openGauss，同一连接只 prepare 一次
+
+状态 upsert 是固定形状的语句：未提供的字段传 None，由 COALESCE 保留原值，
+因此无论更新哪些字段都复用同一条预编译语句。
+"""
+
+import re
+
+from config import DB_TYPE
+from schema import ROLLUP_TABLES, SQLITE_BUCKET_FORMAT, OPENGAUSS_BUCKET_UNIT
+
+DIALECT = 'sqlite' if DB_TYPE == 'sqlite' else 'opengauss'
+
+_SENSOR_COLUMNS = "id, device_id, temperature, humidity, timestamp"
+_LOCK_STATE_COLUMNS = "lock_id, locked, method, actor, battery, updated_at"
+_AC_STATE_COLUMNS = ("ac_id, device_id, power, mode, target_temp, current_temp, "
+                     "current_humidity, fan_speed, updated_at")
+_LIGHTING_STATE_COLUMNS = ("light_id, device_id, power, brightness, auto_mode, room_brightness, "
+                           "color_temp, updated_at")
+_SMOKE_ALARM_STATE_COLUMNS = ("alarm_id, location, smoke_level, alarm_active, battery, "
+                              "test_mode, sensitivity, updated_at")
+
+
+
+def _page_query(columns, table, key=None):
+    """
+    游标分页语句：按 (timestamp DESC, id) 排序，取上一页最后一行之后的 limit 行
+    参数: [key,] 上界时间, 下界时间, 上界时间, 上界 id, limit
+    SQLite 的 (设备, timestamp DESC) 索引隐含 rowid 升序，openGauss 使用 v5 的
+    (设备, timestamp DESC, id) 索引，两边都能按索引顺序直接取行，无需排序
+    """
+    where = f"{key} = ? AND " if key else ""
+    return f"""
+        SELECT {columns} FROM {table}
+        WHERE {where}timestamp <= ? AND timestamp > ? AND (timestamp < ? OR id > ?)
+        ORDER BY timestamp DESC, id
+        LIMIT ?
+    """
+
+
+QUERIES = {
+    # ---------- 温湿度数据 ----------
+    'sensor.insert': {
+        'sqlite': "INSERT INTO temperature_humidity_data (device_id, temperature, humidity, timestamp) VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
+        'opengauss': "INSERT INTO temperature_humidity_data (device_id, temperature, humidity) VALUES ($1, $2, $3)",
+    },
+    'sensor.page': _page_query(_SENSOR_COLUMNS, 'temperature_humidity_data'),
+    'sensor.page_by_device': _page_query(_SENSOR_COLUMNS, 'temperature_humidity_data', 'device_id'),
+    'sensor.latest': f"SELECT {_SENSOR_COLUMNS} FROM temperature_humidity_data WHERE device_id = ? ORDER BY timestamp DESC LIMIT 1",
+    'sensor.range': """
+        SELECT timestamp, temperature, humidity FROM temperature_humidity_data
+        WHERE device_id = ? AND timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp
+    """,
+    # LTTB 降采样：先统计范围内行数，再按 (timestamp, id DESC) 游标分块读取
+    # （v2/v5 的 (device_id, timestamp DESC[, id]) 索引反向扫描即为此顺序）
+    # chunk 参数: device_id, 下界时间, 结束时间（不含）, 上一块最后时间, 上一块最后 id, 行数
+    'sensor.range_count': """
+        SELECT COUNT(*) FROM temperature_humidity_data
+        WHERE device_id = ? AND timestamp >= ? AND timestamp < ?
+    """,
+    'sensor.range_chunk': {
+        'sqlite': """
+            SELECT id, timestamp, CAST(strftime('%s', timestamp) AS INTEGER), temperature, humidity
+            FROM temperature_humidity_data
+            WHERE device_id = ? AND timestamp >= ? AND timestamp < ? AND (timestamp > ? OR id < ?)
+            ORDER BY timestamp, id DESC
+            LIMIT ?
+        """,
+        'opengauss': """
+            SELECT id, timestamp, EXTRACT(EPOCH FROM timestamp), temperature, humidity
+            FROM temperature_humidity_data
+            WHERE device_id = $1 AND timestamp >= $2 AND timestamp < $3 AND (timestamp > $4 OR id < $5)
+            ORDER BY timestamp, id DESC
+            LIMIT $6
+        """,
+    },
+    'sensor.devices': """
+        SELECT s.device_id, s.reading_count, COALESCE(r.room_name, s.device_id) as room_name,
+               s.first_seen, s.last_seen, s.last_temperature, s.last_humidity
+        FROM sensor_devices s
+        LEFT JOIN rooms r ON s.device_id = r.room_id
+        ORDER BY s.device_id
+    """,
+    # 参数: device_id, 本批条数, 最后一条温度, 最后一条湿度
+    'sensor_devices.upsert': {
+        'sqlite': """
+            INSERT INTO sensor_devices
+            (device_id, reading_count, first_seen, last_seen, last_temperature, last_humidity)
+            VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, ?, ?)
+            ON CONFLICT(device_id) DO UPDATE SET
+                reading_count=reading_count + excluded.reading_count,
+                last_seen=excluded.last_seen,
+                last_temperature=excluded.last_temperature,
+                last_humidity=excluded.last_humidity
+        """,
+        'opengauss': """
+            INSERT INTO sensor_devices
+            (device_id, reading_count, first_seen, last_seen, last_temperature, last_humidity)
+            VALUES ($1, $2, NOW(), NOW(), $3, $4)
+            ON DUPLICATE KEY UPDATE
+                reading_count=reading_count + $2,
+                last_seen=NOW(),
+                last_temperature=$3,
+                last_humidity=$4
+        """,
+    },
+
+    # ---------- 门锁 ----------
+    # 参数: lock_id, locked, method, actor, 插入用 battery, 更新用 battery
+    'lock_state.upsert': {
+        'sqlite': """
+            INSERT INTO lock_state (lock_id, locked, method, actor, battery)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(lock_id) DO UPDATE SET
+                locked=excluded.locked, method=excluded.method, actor=excluded.actor,
+                battery=COALESCE(?, battery), updated_at=CURRENT_TIMESTAMP
+        """,
+        'opengauss': """
+            INSERT INTO lock_state (lock_id, locked, method, actor, battery, updated_at)
+            VALUES ($1, $2, $3, $4, $5, NOW())
+            ON DUPLICATE KEY UPDATE
+                locked=$2, method=$3, actor=$4,
+                battery=COALESCE($6, battery), updated_at=NOW()
+        """,
+    },
+    'lock_state.get': f"SELECT {_LOCK_STATE_COLUMNS} FROM lock_state WHERE lock_id = ?",
+    'lock_state.all': f"SELECT {_LOCK_STATE_COLUMNS} FROM lock_state",
+    'lock_event.insert': {
+        'sqlite': "INSERT INTO lock_events (lock_id, event_type, method, actor, detail) VALUES (?, ?, ?, ?, ?)",
+        # 分区表的 timestamp 为 NOT NULL，显式传入 NULL 不会使用 DEFAULT，没有 ts 时取当前时间
+        'opengauss': "INSERT INTO lock_events (lock_id, event_type, method, actor, detail, timestamp) VALUES ($1, $2, $3, $4, $5, COALESCE($6::timestamp, NOW()))",
+    },
+    'lock_event.page': _page_query(
+        "id, lock_id, event_type, method, actor, detail, timestamp", 'lock_events', 'lock_id'),
+
+    # ---------- 空调 ----------
+    # 参数: ac_id, device_id, 6 个插入值（已填默认值）, 6 个更新值（None 表示不修改）
+    'ac_state.upsert': {
+        'sqlite': """
+            INSERT INTO ac_state
+            (ac_id, device_id, power, mode, target_temp, current_temp, current_humidity, fan_speed)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(ac_id) DO UPDATE SET
+                power=COALESCE(?, power),
+                mode=COALESCE(?, mode),
+                target_temp=COALESCE(?, target_temp),
+                current_temp=COALESCE(?, current_temp),
+                current_humidity=COALESCE(?, current_humidity),
+                fan_speed=COALESCE(?, fan_speed),
+                updated_at=CURRENT_TIMESTAMP
+        """,
+        'opengauss': """
+            INSERT INTO ac_state
+            (ac_id, device_id, power, mode, target_temp, current_temp, current_humidity, fan_speed, updated_at)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, NOW())
+            ON DUPLICATE KEY UPDATE
+                power=COALESCE($9, power),
+                mode=COALESCE($10, mode),
+                target_temp=COALESCE($11, target_temp),
+                current_temp=COALESCE($12, current_temp),
+                current_humidity=COALESCE($13, current_humidity),
+                fan_speed=COALESCE($14, fan_speed),
+                updated_at=NOW()
+        """,
+    },
+    'ac_state.get': f"SELECT {_AC_STATE_COLUMNS} FROM ac_state WHERE ac_id = ?",
+    'ac_state.all': f"SELECT {_AC_STATE_COLUMNS} FROM ac_state",
+    # 写入温湿度时同步该房间空调的当前温湿度，参数: temperature, humidity, device_id
+    'ac_state.update_readings': "UPDATE ac_state SET current_temp = ?, current_humidity = ?, updated_at = CURRENT_TIMESTAMP WHERE device_id = ?",
+    'ac_event.insert': {
+        'sqlite': "INSERT INTO ac_events (ac_id, event_type, old_value, new_value, detail) VALUES (?, ?, ?, ?, ?)",
+        'opengauss': "INSERT INTO ac_events (ac_id, event_type, old_value, new_value, detail, timestamp) VALUES ($1, $2, $3, $4, $5, NOW())",
+    },
+    'ac_event.page': _page_query(
+        "id, ac_id, event_type, old_value, new_value, detail, timestamp", 'ac_events', 'ac_id'),
+
+    # ---------- 灯具 ----------
+    # 参数: light_id, 6 个插入值（已填默认值）, 6 个更新值（None 表示不修改）
+    'lighting_state.upsert': {
+        'sqlite': """
+            INSERT INTO lighting_state
+            (light_id, device_id, power, brightness, auto_mode, room_brightness, color_temp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(light_id) DO UPDATE SET
+                device_id=COALESCE(?, device_id),
+                power=COALESCE(?, power),
+                brightness=COALESCE(?, brightness),
+                auto_mode=COALESCE(?, auto_mode),
+                room_brightness=COALESCE(?, room_brightness),
+                color_temp=COALESCE(?, color_temp),
+                updated_at=CURRENT_TIMESTAMP
+        """,
+        'opengauss': """
+            INSERT INTO lighting_state
+            (light_id, device_id, power, brightness, auto_mode, room_brightness, color_temp, updated_at)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, NOW())
+            ON DUPLICATE KEY UPDATE
+                device_id=COALESCE($8, device_id),
+                power=COALESCE($9, power),
+                brightness=COALESCE($10, brightness),
+                auto_mode=COALESCE($11, auto_mode),
+                room_brightness=COALESCE($12, room_brightness),
+                color_temp=COALESCE($13, color_temp),
+                updated_at=NOW()
+        """,
+    },
+    'lighting_state.get': f"SELECT {_LIGHTING_STATE_COLUMNS} FROM lighting_state WHERE light_id = ?",
+    'lighting_state.all': f"SELECT {_LIGHTING_STATE_COLUMNS} FROM lighting_state",
+    'lighting_event.insert': {
+        'sqlite': "INSERT INTO lighting_events (light_id, event_type, old_value, new_value, detail) VALUES (?, ?, ?, ?, ?)",
+        'opengauss': "INSERT INTO lighting_events (light_id, event_type, old_value, new_value, detail, timestamp) VALUES ($1, $2, $3, $4, $5, NOW())",
+    },
+    'lighting_event.page': _page_query(
+        "id, light_id, event_type, old_value, new_value, detail, timestamp", 'lighting_events', 'light_id'),
+
+    # ---------- 烟雾报警器 ----------
+    # 参数: alarm_id, 6 个插入值（已填默认值）, 6 个更新值（None 表示不修改）
+    'smoke_alarm_state.upsert': {
+        'sqlite': """
+            INSERT INTO smoke_alarm_state
+            (alarm_id, location, smoke_level, alarm_active, battery, test_mode, sensitivity)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(alarm_id) DO UPDATE SET
+                location=COALESCE(?, location),
+                smoke_level=COALESCE(?, smoke_level),
+                alarm_active=COALESCE(?, alarm_active),
+                battery=COALESCE(?, battery),
+                test_mode=COALESCE(?, test_mode),
+                sensitivity=COALESCE(?, sensitivity),
+                updated_at=CURRENT_TIMESTAMP
+        """,
+        'opengauss': """
+            INSERT INTO smoke_alarm_state
+            (alarm_id, location, smoke_level, alarm_active, battery, test_mode, sensitivity, updated_at)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, NOW())
+            ON DUPLICATE KEY UPDATE
+                location=COALESCE($8, location),
+                smoke_level=COALESCE($9, smoke_level),
+                alarm_active=COALESCE($10, alarm_active),
+                battery=COALESCE($11, battery),
+                test_mode=COALESCE($12, test_mode),
+                sensitivity=COALESCE($13, sensitivity),
+                updated_at=NOW()
+        """,
+    },
+    'smoke_alarm_state.get': f"SELECT {_SMOKE_ALARM_STATE_COLUMNS} FROM smoke_alarm_state WHERE alarm_id = ?",
+    'smoke_alarm_state.all': f"SELECT {_SMOKE_ALARM_STATE_COLUMNS} FROM smoke_alarm_state",
+    'smoke_alarm_event.insert': {
+        'sqlite': "INSERT INTO smoke_alarm_events (alarm_id, event_type, smoke_level, detail) VALUES (?, ?, ?, ?)",
+        'opengauss': "INSERT INTO smoke_alarm_events (alarm_id, event_type, smoke_level, detail, timestamp) VALUES ($1, $2, $3, $4, NOW())",
+    },
+    'smoke_alarm_event.page': _page_query(
+        "id, alarm_id, event_type, smoke_level, detail, timestamp", 'smoke_alarm_events', 'alarm_id'),
+
+    # ---------- 报警统计（增量累加到当天一行） ----------
+    # 参数: alarm_id, 报警事件数, 本批最大烟雾浓度
+    'alarm_stats.events': {
+        'sqlite': """
+            INSERT INTO alarm_statistics
+            (alarm_id, room_id, stat_date, total_alarms, false_alarms, real_alarms, max_smoke_level)
+            VALUES (?1, (SELECT room_id FROM smoke_alarm_state WHERE alarm_id = ?1), DATE('now'), ?2, 0, ?2, ?3)
+            ON CONFLICT(alarm_id, stat_date) DO UPDATE SET
+                total_alarms=total_alarms + excluded.total_alarms,
+                real_alarms=real_alarms + excluded.total_alarms,
+                max_smoke_level=MAX(COALESCE(max_smoke_level, excluded.max_smoke_level),
+                                    COALESCE(excluded.max_smoke_level, max_smoke_level))
+        """,
+        'opengauss': """
+            INSERT INTO alarm_statistics
+            (alarm_id, room_id, stat_date, total_alarms, false_alarms, real_alarms, max_smoke_level, created_at)
+            VALUES ($1, (SELECT room_id FROM smoke_alarm_state WHERE alarm_id = $1), CURRENT_DATE, $2, 0, $2, $3, NOW())
+            ON DUPLICATE KEY UPDATE
+                total_alarms=total_alarms + $2,
+                real_alarms=real_alarms + $2,
+                max_smoke_level=GREATEST(COALESCE(max_smoke_level, $3), COALESCE($3, max_smoke_level))
+        """,
+    },
+    # 参数: alarm_id, 误报数, 有响应时间的确认数, 响应时间之和
+    # 平均响应时间 = response_time_sum / response_count，放在 SET 第一项，只引用更新前的值
+    'alarm_stats.acks': {
+        'sqlite': """
+            INSERT INTO alarm_statistics
+            (alarm_id, room_id, stat_date, total_alarms, false_alarms, real_alarms,
+             response_count, response_time_sum, avg_response_time)
+            VALUES (?1, (SELECT room_id FROM smoke_alarm_state WHERE alarm_id = ?1), DATE('now'),
+                    0, ?2, -?2, ?3, ?4, ROUND(?4 * 1.0 / NULLIF(?3, 0)))
+            ON CONFLICT(alarm_id, stat_date) DO UPDATE SET
+                avg_response_time=COALESCE(
+                    ROUND((response_time_sum + excluded.response_time_sum) * 1.0
+                          / NULLIF(response_count + excluded.response_count, 0)),
+                    avg_response_time),
+                false_alarms=false_alarms + excluded.false_alarms,
+                real_alarms=real_alarms - excluded.false_alarms,
+                response_count=response_count + excluded.response_count,
+                response_time_sum=response_time_sum + excluded.response_time_sum
+        """,
+        'opengauss': """
+            INSERT INTO alarm_statistics
+            (alarm_id, room_id, stat_date, total_alarms, false_alarms, real_alarms,
+             response_count, response_time_sum, avg_response_time, created_at)
+            VALUES ($1, (SELECT room_id FROM smoke_alarm_state WHERE alarm_id = $1), CURRENT_DATE,
+                    0, $2, 0 - $2, $3, $4, ROUND($4 * 1.0 / NULLIF($3, 0)), NOW())
+            ON DUPLICATE KEY UPDATE
+                avg_response_time=COALESCE(
+                    ROUND((response_time_sum + $4) * 1.0 / NULLIF(response_count + $3, 0)),
+                    avg_response_time),
+                false_alarms=false_alarms + $2,
+                real_alarms=real_alarms - $2,
+                response_count=response_count + $3,
+                response_time_sum=response_time_sum + $4
+        """,
+    },
+    # 离线重建：删除日期范围内的统计行，再对事件和确认记录做一次 GROUP BY 写回
+    # clear 参数: 起始日期, 结束日期（含）；rebuild 参数: 事件时间下界、上界（不含）、确认时间下界、上界（不含）
+    'alarm_stats.clear': "DELETE FROM alarm_statistics WHERE stat_date >= ? AND stat_date <= ?",
+    'alarm_stats.rebuild': """
+        INSERT INTO alarm_statistics
+        (alarm_id, room_id, stat_date, total_alarms, false_alarms, real_alarms,
+         response_count, response_time_sum, avg_response_time, max_smoke_level)
+        SELECT u.alarm_id, s.room_id, u.stat_date,
+               SUM(u.total_n), SUM(u.false_n), SUM(u.total_n) - SUM(u.false_n),
+               SUM(u.response_n), SUM(u.response_sum),
+               ROUND(SUM(u.response_sum) * 1.0 / NULLIF(SUM(u.response_n), 0)),
+               MAX(u.smoke_level)
+        FROM (
+            SELECT alarm_id, DATE(timestamp) AS stat_date, 1 AS total_n, 0 AS false_n,
+                   0 AS response_n, 0 AS response_sum, smoke_level
+            FROM smoke_alarm_events
+            WHERE event_type IN ('ALARM_TRIGGERED', 'ALARM_CLEARED')
+                AND timestamp >= ? AND timestamp < ?
+            UNION ALL
+            SELECT alarm_id, DATE(acknowledged_at), 0,
+                   CASE WHEN resolution = 'false_alarm' THEN 1 ELSE 0 END,
+                   CASE WHEN response_time IS NULL THEN 0 ELSE 1 END,
+                   COALESCE(response_time, 0), NULL
+            FROM alarm_acknowledgments
+            WHERE acknowledged_at >= ? AND acknowledged_at < ?
+        ) u
+        LEFT JOIN smoke_alarm_state s ON s.alarm_id = u.alarm_id
+        GROUP BY u.alarm_id, s.room_id, u.stat_date
+    """,
+}
+
+# 温湿度汇总表：每种分辨率一条 upsert（合并一批读数）和一条范围查询
+# upsert 参数: device_id, samples, temp_min, temp_max, temp_sum, hum_min, hum_max, hum_sum
+for _res, _table in ROLLUP_TABLES.items():
+    QUERIES[f'rollup.upsert.{_res}'] = {
+        'sqlite': f"""
+            INSERT INTO {_table} (device_id, bucket, samples, temp_min, temp_max, temp_sum, hum_min, hum_max, hum_sum)
+            VALUES (?, strftime('{SQLITE_BUCKET_FORMAT[_res]}', 'now'), ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(device_id, bucket) DO UPDATE SET
+                samples=samples + excluded.samples,
+                temp_min=MIN(temp_min, excluded.temp_min),
+                temp_max=MAX(temp_max, excluded.temp_max),
+                temp_sum=temp_sum + excluded.temp_sum,
+                hum_min=MIN(hum_min, excluded.hum_min),
+                hum_max=MAX(hum_max, excluded.hum_max),
+                hum_sum=hum_sum + excluded.hum_sum
+        """,
+        'opengauss': f"""
+            INSERT INTO {_table} (device_id, bucket, samples, temp_min, temp_max, temp_sum, hum_min, hum_max, hum_sum)
+            VALUES ($1, date_trunc('{OPENGAUSS_BUCKET_UNIT[_res]}', NOW()), $2, $3, $4, $5, $6, $7, $8)
+            ON DUPLICATE KEY UPDATE
+                samples=samples + $2,
+                temp_min=LEAST(temp_min, $3),
+                temp_max=GREATEST(temp_max, $4),
+                temp_sum=temp_sum + $5,
+                hum_min=LEAST(hum_min, $6),
+                hum_max=GREATEST(hum_max, $7),
+                hum_sum=hum_sum + $8
+        """,
+    }
+    QUERIES[f'rollup.range.{_res}'] = f"""
+        SELECT bucket, samples, temp_min, temp_max, temp_sum / samples, hum_min, hum_max, hum_sum / samples
+        FROM {_table}
+        WHERE device_id = ? AND bucket >= ? AND bucket < ?
+        ORDER BY bucket
+    """
+
+# 按任意桶宽聚合温湿度（/history/<device_id>/aggregate）
+# 桶起点按 Unix 纪元对齐：floor(秒数 / 桶宽) * 桶宽；原始表和各汇总表输出相同的列：
+# 桶起点, 样本数, 温度 avg/min/max, 湿度 avg/min/max
+# 参数: 桶宽秒数, device_id, 开始, 结束（不含）
+_AGGREGATE_SOURCES = {
+    'raw': ('temperature_humidity_data', 'timestamp',
+            "COUNT(*), AVG(temperature), MIN(temperature), MAX(temperature), "
+            "AVG(humidity), MIN(humidity), MAX(humidity)"),
+}
+for _res, _table in ROLLUP_TABLES.items():
+    _AGGREGATE_SOURCES[_res] = (
+        _table, 'bucket',
+        "SUM(samples), SUM(temp_sum) / SUM(samples), MIN(temp_min), MAX(temp_max), "
+        "SUM(hum_sum) / SUM(samples), MIN(hum_min), MAX(hum_max)")
+
+for _source, (_table, _column, _aggregates) in _AGGREGATE_SOURCES.items():
+    QUERIES[f'sensor.aggregate.{_source}'] = {
+        'sqlite': f"""
+            SELECT datetime(CAST(strftime('%s', {_column}) AS INTEGER) / ?1 * ?1, 'unixepoch') AS b, {_aggregates}
+            FROM {_table}
+            WHERE device_id = ?2 AND {_column} >= ?3 AND {_column} < ?4
+            GROUP BY b
+            ORDER BY b
+        """,
+        'opengauss': f"""
+            SELECT TIMESTAMP 'epoch' + FLOOR(EXTRACT(EPOCH FROM {_column}) / $1) * $1 * INTERVAL '1 second' AS b,
+                   {_aggregates}
+            FROM {_table}
+            WHERE device_id = $2 AND {_column} >= $3 AND {_column} < $4
+            GROUP BY b
+            ORDER BY b
+        """,
+    }
+
+# 流式导出：数据集 -> (表, 设备列, 输出列, 导出全部设备时的排序列)
+# 按设备导出时沿 (设备, timestamp) 索引按时间顺序读取；导出全部设备时，有时间单列索引的表
+# 按 timestamp 读取，其余按主键顺序扫描。两种顺序都不需要额外排序，结果可以边读边发送
+# 参数: [设备,] 开始, 结束（不含）
+EXPORT_DATASETS = {
+    'sensors': ('temperature_humidity_data', 'device_id',
+                ('id', 'device_id', 'temperature', 'humidity', 'timestamp'), 'timestamp'),
+    'lock_events': ('lock_events', 'lock_id',
+                    ('id', 'lock_id', 'event_type', 'method', 'actor', 'detail', 'timestamp'), 'id'),
+    'ac_events': ('ac_events', 'ac_id',
+                  ('id', 'ac_id', 'event_type', 'old_value', 'new_value', 'detail', 'timestamp'), 'id'),
+    'lighting_events': ('lighting_events', 'light_id',
+                        ('id', 'light_id', 'event_type', 'old_value', 'new_value', 'detail', 'timestamp'), 'id'),
+    'smoke_alarm_events': ('smoke_alarm_events', 'alarm_id',
+                           ('id', 'alarm_id', 'event_type', 'smoke_level', 'detail', 'timestamp'), 'timestamp'),
+}
+
+for _name, (_table, _key, _columns, _order) in EXPORT_DATASETS.items():
+    QUERIES[f'export.{_name}'] = f"""
+        SELECT {', '.join(_columns)} FROM {_table}
+        WHERE timestamp >= ? AND timestamp < ?
+        ORDER BY {_order}
+    """
+    QUERIES[f'export.{_name}.by_device'] = f"""
+        SELECT {', '.join(_columns)} FROM {_table}
+        WHERE {_key} = ? AND timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp
+    """
+
+# 冷数据归档：最早一行的时间；分批删除某天已写入归档的行（id 不超过已归档的最大 id，
+# 归档开始后写入的迟到数据留在数据库，下次归档）。delete 参数: 开始, 结束（不含）, 最大 id, 批大小
+# openGauss 的按月分区表中 ctid 只在单个分区内唯一，按 id 删除，外层重复时间条件只扫描当天所在分区
+for _name, (_table, _key, _columns, _order) in EXPORT_DATASETS.items():
+    QUERIES[f'archive.oldest.{_name}'] = f"SELECT MIN(timestamp) FROM {_table}"
+    QUERIES[f'archive.delete.{_name}'] = {
+        'sqlite': f"""
+            DELETE FROM {_table} WHERE rowid IN (
+                SELECT rowid FROM {_table} WHERE timestamp >= ? AND timestamp < ? AND id <= ? LIMIT ?)
+        """,
+        'opengauss': f"""
+            DELETE FROM {_table} WHERE timestamp >= $1 AND timestamp < $2 AND id <= $3 AND id IN (
+                SELECT id FROM {_table} WHERE timestamp >= $1 AND timestamp < $2 AND id <= $3 LIMIT $4)
+        """,
+    }
+
+# 数据保留：表 -> 时间列
+RETENTION_TIME_COLUMNS = {
+    'temperature_humidity_data': 'timestamp',
+    'temperature_humidity_1m': 'bucket',
+    'temperature_humidity_1h': 'bucket',
+    'temperature_humidity_1d': 'bucket',
+    'lock_events': 'timestamp',
+    'ac_events': 'timestamp',
+    'lighting_events': 'timestamp',
+    'smoke_alarm_events': 'timestamp',
+}
+
+# 仍被其他表引用的行不能删除
+_RETENTION_GUARDS = {
+    'smoke_alarm_events': " AND id NOT IN (SELECT event_id FROM alarm_acknowledgments WHERE event_id IS NOT NULL)",
+}
+
+# 分批删除过期行，参数: cutoff, batch_size
+for _table, _column in RETENTION_TIME_COLUMNS.items():
+    _guard = _RETENTION_GUARDS.get(_table, '')
+    QUERIES[f'retention.purge.{_table}'] = {
+        'sqlite': f"DELETE FROM {_table} WHERE rowid IN (SELECT rowid FROM {_table} WHERE {_column} < ?{_guard} LIMIT ?)",
+        'opengauss': f"DELETE FROM {_table} WHERE ctid IN (SELECT ctid FROM {_table} WHERE {_column} < $1{_guard} LIMIT $2)",
+    }
+
+# openGauss 分区表的分区及其上界（按上界升序）
+QUERIES['retention.partitions'] = {
+    'opengauss': """
+        SELECT p.relname, p.boundaries[1]
+        FROM pg_partition p JOIN pg_class c ON p.parentid = c.oid
+        WHERE c.relname = $1 AND p.parttype = 'p'
+        ORDER BY p.boundaries[1]
+    """,
+}
+
+
+def to_opengauss(sql_text):
+    """把 SQLite 写法转换为 openGauss 写法：? -> $n，CURRENT_TIMESTAMP -> NOW()"""
+    counter = iter(range(1, sql_text.count('?') + 1))
+    sql_text = re.sub(r'\?', lambda _: f"${next(counter)}", sql_text)
+    return sql_text.replace('CURRENT_TIMESTAMP', 'NOW()')
+
+
+def compile_queries(queries, dialect):
+    """按数据库类型展开语句目录，返回 {name: sql}（只适用于另一种数据库的语句跳过）"""
+    compiled = {}
+    for name, entry in queries.items():
+        if isinstance(entry, dict):
+            if dialect in entry:
+                compiled[name] = entry[dialect]
+        elif dialect == 'opengauss':
+            compiled[name] = to_opengauss(entry)
+        else:
+            compiled[name] = entry
+    return compiled
+
+
+# 导入时编译一次当前数据库类型的 SQL
+_COMPILED = compile_queries(QUERIES, DIALECT)
+
+
+def sql(name):
+    """当前数据库类型下语句 name 的 SQL 文本"""
+    return _COMPILED[name]
+
+
+def prepared(conn, name):
+    """
+    openGauss：取得语句 name 在该连接上的预编译句柄
+    连接池借出的连接按物理连接缓存；裸连接退化为每次 prepare
+    """
+    text = _COMPILED[name]
+    if hasattr(conn, 'prepare_cached'):
+        return conn.prepare_cached(text)
+    return conn.prepare(text)
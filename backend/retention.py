@@ -0,0 +1,91 @@
+"""
+数据保留后台任务
+每隔 RETENTION_CHECK_INTERVAL 秒调用一次 database.enforce_retention()：
+openGauss 分区表整月删除过期分区，其余表按时间索引分批删除过期行。
+"""
+
+import atexit
+import threading
+import time
+
+from config import RETENTION_CHECK_INTERVAL
+
+
+class RetentionWorker:
+    """定期执行数据保留策略的守护线程"""
+
+    def __init__(self, enforce, interval=RETENTION_CHECK_INTERVAL, name='retention'):
+        self._enforce = enforce
+        self.interval = interval
+        self._name = name
+        self._thread = None
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'runs': 0,
+            'failed_runs': 0,
+            'rows_deleted': 0,
+            'partitions_dropped': 0,
+            'last_run_at': None,
+            'last_duration_ms': None,
+            'last_result': None,
+        }
+
+    # ---------- 生命周期 ----------
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self, timeout=5.0):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    # ---------- 指标 ----------
+
+    def stats(self):
+        with self._stats_lock:
+            s = dict(self._stats)
+        s['interval'] = self.interval
+        s['running'] = self._thread is not None and self._thread.is_alive()
+        return s
+
+    # ---------- 执行 ----------
+
+    def run_once(self):
+        """立即执行一次保留策略，返回各表结果"""
+        started = time.perf_counter()
+        try:
+            result = self._enforce()
+        except Exception as e:
+            print(f"✗ 数据保留任务执行失败: {e}")
+            with self._stats_lock:
+                self._stats['failed_runs'] += 1
+            return None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        rows = sum(r.get('rows', 0) for r in result.values())
+        partitions = sum(len(r.get('partitions', ())) for r in result.values())
+        if rows or partitions:
+            print(f"✓ 数据保留：删除 {rows} 行、{partitions} 个分区，用时 {elapsed_ms:.0f} ms")
+        with self._stats_lock:
+            s = self._stats
+            s['runs'] += 1
+            s['rows_deleted'] += rows
+            s['partitions_dropped'] += partitions
+            s['last_run_at'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            s['last_duration_ms'] = round(elapsed_ms, 3)
+            s['last_result'] = result
+        return result
+
+    def _run(self):
+        # 启动后先执行一次，之后按固定间隔执行
+        while not self._stopping.is_set():
+            self.run_once()
+            self._stopping.wait(self.interval)
@@ -5,11 +5,14 @@
 """
 
 from flask import Blueprint, jsonify, request
+from config import HISTORY_MAX_POINTS
 from database import (
-    get_recent_data, get_devices, get_latest_data,
+    get_recent_data, get_recent_data_page, get_devices, get_latest_data, get_sensor_series,
+    get_sensor_aggregate, get_sensor_lttb,
     upsert_ac_state, get_ac_state, get_all_acs, 
-    insert_ac_event, get_ac_events
+    insert_ac_event, get_ac_events, get_ac_events_page, unit_of_work
 )
+from pagination import parse_time, wants_page, parse_page_args
 
 # 创建蓝图
 air_conditioner_bp = Blueprint('air_conditioner', __name__)
@@ -25,7 +28,13 @@ def devices():
 
 @air_conditioner_bp.route("/history")
 def history():
-    """获取所有设备的历史数据"""
+    """获取所有设备的历史数据（带 cursor/before/after 参数时按游标分页）"""
+    if wants_page(request.args):
+        try:
+            page = parse_page_args(request.args, 100)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(get_recent_data_page(**page))
     limit = request.args.get('limit', 100, type=int)
     data = get_recent_data(limit=limit)
     return jsonify(data)
@@ -33,10 +42,62 @@ def history():
 
 @air_conditioner_bp.route("/history/<device_id>")
 def history_by_device(device_id):
-    """获取指定设备的历史数据"""
-    limit = request.args.get('limit', 100, type=int)
-    data = get_recent_data(device_id=device_id, limit=limit)
-    return jsonify(data)
+    """
+    获取指定设备的历史数据
+    - 默认：最近 limit 条原始数据（列表）
+    - 指定 cursor / before / after 时：按游标分页，返回 {items, next_cursor}
+    - 指定 start / end / max_points 时：返回该时间范围的曲线，
+      按点数上限自动选择原始数据或 1m/1h/1d 汇总（含 min/max/avg）
+    - 指定 points 时：用 LTTB 把该时间范围的温度、湿度曲线各降采样到最多 points 个真实数据点
+    """
+    if not any(k in request.args for k in ('start', 'end', 'max_points', 'points')):
+        if wants_page(request.args):
+            try:
+                page = parse_page_args(request.args, 100)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            return jsonify(get_recent_data_page(device_id=device_id, **page))
+        limit = request.args.get('limit', 100, type=int)
+        data = get_recent_data(device_id=device_id, limit=limit)
+        return jsonify(data)
+
+    try:
+        start = parse_time(request.args.get('start'))
+        end = parse_time(request.args.get('end'))
+    except ValueError:
+        return jsonify({"error": "时间格式错误，应为 ISO 格式，如 2024-01-01T00:00:00"}), 400
+    if start and end and start >= end:
+        return jsonify({"error": "start 必须早于 end"}), 400
+    if 'points' in request.args:
+        points = request.args.get('points', HISTORY_MAX_POINTS, type=int)
+        if points <= 0:
+            return jsonify({"error": "points 必须为正整数"}), 400
+        return jsonify(get_sensor_lttb(device_id, start=start, end=end, points=points))
+    max_points = request.args.get('max_points', HISTORY_MAX_POINTS, type=int)
+    if max_points <= 0:
+        return jsonify({"error": "max_points 必须为正整数"}), 400
+    return jsonify(get_sensor_series(device_id, start=start, end=end, max_points=max_points))
+
+
+@air_conditioner_bp.route("/history/<device_id>/aggregate")
+def history_aggregate(device_id):
+    """
+    按时间桶聚合指定设备的温湿度（在数据库内计算）
+    参数：start / end（ISO 格式，缺省最近 24 小时）、bucket（如 30s/5m/1h/1d，默认 5m）、
+    agg（逗号分隔的 avg/min/max/count，默认 avg,min,max）
+    返回列式 JSON：{"columns": {"time": [...], "temperature_avg": [...], ...}}
+    """
+    try:
+        start = parse_time(request.args.get('start'))
+        end = parse_time(request.args.get('end'))
+    except ValueError:
+        return jsonify({"error": "时间格式错误，应为 ISO 格式，如 2024-01-01T00:00:00"}), 400
+    bucket = request.args.get('bucket', '5m')
+    aggs = tuple(a.strip() for a in request.args.get('agg', 'avg,min,max').split(',') if a.strip())
+    try:
+        return jsonify(get_sensor_aggregate(device_id, start=start, end=end, bucket=bucket, aggs=aggs))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 
 @air_conditioner_bp.route("/latest/<device_id>")
@@ -60,21 +121,18 @@ def list_acs():
 
 @air_conditioner_bp.route("/ac/<ac_id>", methods=["GET"])
 def ac_state(ac_id):
-    """获取空调状态"""
+    """
+    获取空调状态（只读）
+    current_temp / current_humidity 由温湿度写入路径随新读数同步更新，
+    新建的空调尚未收到读数时用该房间的最新读数补上
+    """
     state = get_ac_state(ac_id)
     if state:
-        # 获取最新的温湿度数据
-        device_id = state.get('device_id', 'room1')
-        latest_data = get_latest_data(device_id)
-        if latest_data:
-            state['current_temp'] = latest_data['temperature']
-            state['current_humidity'] = latest_data['humidity']
-            # 更新数据库中的当前温湿度
-            upsert_ac_state(
-                ac_id, 
-                current_temp=latest_data['temperature'],
-                current_humidity=latest_data['humidity']
-            )
+        if state.get('current_temp') is None:
+            latest_data = get_latest_data(state.get('device_id', 'room1'))
+            if latest_data:
+                state['current_temp'] = latest_data['temperature']
+                state['current_humidity'] = latest_data['humidity']
         return jsonify(state)
     return jsonify({"error": "空调未找到"}), 404
 
@@ -84,77 +142,79 @@ def control_ac(ac_id):
     """控制空调（开关、温度设置等）"""
     body = request.get_json(force=True) or {}
     
-    # 获取当前状态
-    current_state = get_ac_state(ac_id)
-    
-    # 提取控制参数
-    power = body.get('power')  # True/False
-    target_temp = body.get('target_temp')  # 目标温度
-    mode = body.get('mode')  # cool/heat/fan/dehumidify
-    fan_speed = body.get('fan_speed')  # low/medium/high/auto
-    device_id = body.get('device_id', 'room1')
-    
-    # 记录旧值（用于事件日志）
-    old_power = current_state.get('power') if current_state else False
-    old_temp = current_state.get('target_temp') if current_state else None
-    old_mode = current_state.get('mode') if current_state else None
-    old_fan_speed = current_state.get('fan_speed') if current_state else None
-    
-    # 更新空调状态
-    upsert_ac_state(
-        ac_id=ac_id,
-        device_id=device_id,
-        power=power,
-        mode=mode,
-        target_temp=target_temp,
-        fan_speed=fan_speed
-    )
-    
-    # 记录事件（使用英文避免编码问题）
-    if power is not None and power != old_power:
-        event_type = 'power_on' if power else 'power_off'
-        insert_ac_event(
-            ac_id=ac_id,
-            event_type=event_type,
-            old_value=str(old_power),
-            new_value=str(power),
-            detail=f"AC {'turned on' if power else 'turned off'}"
-        )
-    
-    if target_temp is not None and target_temp != old_temp:
-        insert_ac_event(
-            ac_id=ac_id,
-            event_type='temp_change',
-            old_value=str(old_temp) if old_temp else None,
-            new_value=str(target_temp),
-            detail=f"Target temp set to {target_temp}C"
-        )
-    
-    if mode is not None and mode != old_mode:
-        # 使用英文避免中文编码问题
-        mode_display = {
-            'cool': 'cooling',
-            'heat': 'heating',
-            'fan': 'fan',
-            'dehumidify': 'dehumidify'
-        }
-        insert_ac_event(
-            ac_id=ac_id,
-            event_type='mode_change',
-            old_value=old_mode,
-            new_value=mode,
-            detail=f"Mode changed to {mode_display.get(mode, mode)}"
-        )
-    
-    if fan_speed is not None and fan_speed != old_fan_speed:
-        insert_ac_event(
+    # 读取、状态更新和事件记录在同一个事务中完成
+    with unit_of_work():
+        # 获取当前状态
+        current_state = get_ac_state(ac_id)
+
+        # 提取控制参数
+        power = body.get('power')  # True/False
+        target_temp = body.get('target_temp')  # 目标温度
+        mode = body.get('mode')  # cool/heat/fan/dehumidify
+        fan_speed = body.get('fan_speed')  # low/medium/high/auto
+        device_id = body.get('device_id', 'room1')
+
+        # 记录旧值（用于事件日志）
+        old_power = current_state.get('power') if current_state else False
+        old_temp = current_state.get('target_temp') if current_state else None
+        old_mode = current_state.get('mode') if current_state else None
+        old_fan_speed = current_state.get('fan_speed') if current_state else None
+
+        # 更新空调状态
+        upsert_ac_state(
             ac_id=ac_id,
-            event_type='fan_speed_change',
-            old_value=old_fan_speed,
-            new_value=fan_speed,
-            detail=f"Fan speed set to {fan_speed}"
+            device_id=device_id,
+            power=power,
+            mode=mode,
+            target_temp=target_temp,
+            fan_speed=fan_speed
         )
-    
+
+        # 记录事件（使用英文避免编码问题）
+        if power is not None and power != old_power:
+            event_type = 'power_on' if power else 'power_off'
+            insert_ac_event(
+                ac_id=ac_id,
+                event_type=event_type,
+                old_value=str(old_power),
+                new_value=str(power),
+                detail=f"AC {'turned on' if power else 'turned off'}"
+            )
+
+        if target_temp is not None and target_temp != old_temp:
+            insert_ac_event(
+                ac_id=ac_id,
+                event_type='temp_change',
+                old_value=str(old_temp) if old_temp else None,
+                new_value=str(target_temp),
+                detail=f"Target temp set to {target_temp}C"
+            )
+
+        if mode is not None and mode != old_mode:
+            # 使用英文避免中文编码问题
+            mode_display = {
+                'cool': 'cooling',
+                'heat': 'heating',
+                'fan': 'fan',
+                'dehumidify': 'dehumidify'
+            }
+            insert_ac_event(
+                ac_id=ac_id,
+                event_type='mode_change',
+                old_value=old_mode,
+                new_value=mode,
+                detail=f"Mode changed to {mode_display.get(mode, mode)}"
+            )
+
+        if fan_speed is not None and fan_speed != old_fan_speed:
+            insert_ac_event(
+                ac_id=ac_id,
+                event_type='fan_speed_change',
+                old_value=old_fan_speed,
+                new_value=fan_speed,
+                detail=f"Fan speed set to {fan_speed}"
+            )
+
     return jsonify({
         "status": "success",
         "message": "空调控制成功",
@@ -164,7 +224,13 @@ def control_ac(ac_id):
 
 @air_conditioner_bp.route("/ac/<ac_id>/events", methods=["GET"])
 def ac_events(ac_id):
-    """获取空调事件历史"""
+    """获取空调事件历史（带 cursor/before/after 参数时按游标分页）"""
+    if wants_page(request.args):
+        try:
+            page = parse_page_args(request.args, 50)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(get_ac_events_page(ac_id, **page))
     limit = request.args.get('limit', 50, type=int)
     events = get_ac_events(ac_id, limit)
     return jsonify(events)
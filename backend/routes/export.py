@@ -0,0 +1,80 @@
+"""
+数据导出 API 路由
+功能：按设备和时间范围把历史数据流式导出为 NDJSON 或 CSV
+数据库游标逐批读取、逐批写入分块响应，导出任意行数时内存占用都只有一批
+"""
+
+import csv
+import io
+import json
+
+from flask import Blueprint, Response, jsonify, request
+from database import EXPORT_DATASETS, export_columns, iter_export
+from pagination import parse_time
+
+# 创建蓝图
+export_bp = Blueprint('export', __name__, url_prefix='/export')
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _ndjson(columns, batches):
+    """每行一个 JSON 对象，每批拼成一个分块"""
+    for rows in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows)
+
+
+def _csv(columns, batches):
+    """首个分块为表头，之后每批一个分块"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+@export_bp.route("/<dataset>", methods=["GET"])
+def export_dataset(dataset):
+    """
+    流式导出数据集 [start, end) 内的记录（dataset 为 sensors / lock_events / ac_events /
+    lighting_events / smoke_alarm_events）
+
+    查询参数:
+    - device_id: 只导出该设备（缺省全部设备）
+    - start / end: ISO 时间（缺省不限）
+    - format: ndjson（默认）或 csv
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format 必须为 {' / '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        columns = export_columns(dataset)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    try:
+        start = parse_time(request.args.get('start'))
+        end = parse_time(request.args.get('end'))
+    except ValueError:
+        return jsonify({"error": "时间格式错误，应为 ISO 格式，如 2024-01-01T00:00:00"}), 400
+    if start and end and start >= end:
+        return jsonify({"error": "start 必须早于 end"}), 400
+
+    batches = iter_export(dataset, device_id=request.args.get('device_id') or None,
+                          start=start, end=end)
+    body = _csv(columns, batches) if fmt == 'csv' else _ndjson(columns, batches)
+    response = Response(body, mimetype=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+    return response
+
+
+@export_bp.route("", methods=["GET"])
+def list_datasets():
+    """可导出的数据集及其列"""
+    return jsonify({name: list(spec[2]) for name, spec in EXPORT_DATASETS.items()})
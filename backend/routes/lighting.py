@@ -7,8 +7,9 @@
 from flask import Blueprint, jsonify, request
 from database import (
     upsert_lighting_state, get_lighting_state, get_all_lights,
-    insert_lighting_event, get_lighting_events
+    insert_lighting_event, get_lighting_events, get_lighting_events_page, unit_of_work
 )
+from pagination import wants_page, parse_page_args
 import mqtt_client
 
 # 创建蓝图
@@ -36,84 +37,86 @@ def control_lighting(light_id):
     """控制灯具（开关、亮度、智能模式等）"""
     body = request.get_json(force=True) or {}
     
-    # 获取当前状态
-    current_state = get_lighting_state(light_id)
-    
-    # 提取控制参数
-    power = body.get('power')  # True/False
-    brightness = body.get('brightness')  # 0-100
-    auto_mode = body.get('auto_mode')  # True/False
-    color_temp = body.get('color_temp')  # 色温
-    device_id = body.get('device_id', 'room1')
-    
-    # 记录旧值（用于事件日志）
-    old_power = current_state.get('power') if current_state else False
-    old_brightness = current_state.get('brightness') if current_state else None
-    old_auto_mode = current_state.get('auto_mode') if current_state else None
-    old_color_temp = current_state.get('color_temp') if current_state else None
-    
-    # 新的控制逻辑：
-    # 1. 开灯状态下：与房间亮度无关，只受到用户手动调节
-    # 2. 关灯条件下：用户选择是否开启"智能控制"，然后根据用户的选择实现
-    
-    # 如果关闭智能模式，确保灯具关闭
-    if auto_mode is False:
-        power = False
-    
-    # 如果开启智能模式，但当前是关灯状态，保持关灯（等待自动调节）
-    if auto_mode is True and power is None and old_power is False:
-        power = False
-    
-    # 更新灯具状态
-    upsert_lighting_state(
-        light_id=light_id,
-        device_id=device_id,
-        power=power,
-        brightness=brightness,
-        auto_mode=auto_mode,
-        color_temp=color_temp
-    )
-    
-    # 记录事件
-    if power is not None and power != old_power:
-        event_type = 'power_on' if power else 'power_off'
-        insert_lighting_event(
-            light_id=light_id,
-            event_type=event_type,
-            old_value=str(old_power),
-            new_value=str(power),
-            detail=f"Manual control: Light {'turned on' if power else 'turned off'}"
-        )
-    
-    if brightness is not None and brightness != old_brightness:
-        insert_lighting_event(
-            light_id=light_id,
-            event_type='brightness_change',
-            old_value=str(old_brightness) if old_brightness else None,
-            new_value=str(brightness),
-            detail=f"Manual control: Brightness set to {brightness}%"
-        )
-    
-    if auto_mode is not None and auto_mode != old_auto_mode:
-        insert_lighting_event(
-            light_id=light_id,
-            event_type='auto_mode_change',
-            old_value=str(old_auto_mode),
-            new_value=str(auto_mode),
-            detail=f"Manual control: Auto mode {'enabled' if auto_mode else 'disabled'}"
-        )
-    
-    if color_temp is not None and color_temp != old_color_temp:
-        insert_lighting_event(
+    # 读取、状态更新和事件记录在同一个事务中完成，提交后再发布 MQTT
+    with unit_of_work():
+        # 获取当前状态
+        current_state = get_lighting_state(light_id)
+
+        # 提取控制参数
+        power = body.get('power')  # True/False
+        brightness = body.get('brightness')  # 0-100
+        auto_mode = body.get('auto_mode')  # True/False
+        color_temp = body.get('color_temp')  # 色温
+        device_id = body.get('device_id', 'room1')
+
+        # 记录旧值（用于事件日志）
+        old_power = current_state.get('power') if current_state else False
+        old_brightness = current_state.get('brightness') if current_state else None
+        old_auto_mode = current_state.get('auto_mode') if current_state else None
+        old_color_temp = current_state.get('color_temp') if current_state else None
+
+        # 新的控制逻辑：
+        # 1. 开灯状态下：与房间亮度无关，只受到用户手动调节
+        # 2. 关灯条件下：用户选择是否开启"智能控制"，然后根据用户的选择实现
+
+        # 如果关闭智能模式，确保灯具关闭
+        if auto_mode is False:
+            power = False
+
+        # 如果开启智能模式，但当前是关灯状态，保持关灯（等待自动调节）
+        if auto_mode is True and power is None and old_power is False:
+            power = False
+
+        # 更新灯具状态
+        upsert_lighting_state(
             light_id=light_id,
-            event_type='color_temp_change',
-            old_value=str(old_color_temp) if old_color_temp else None,
-            new_value=str(color_temp),
-            detail=f"Manual control: Color temperature set to {color_temp}K"
+            device_id=device_id,
+            power=power,
+            brightness=brightness,
+            auto_mode=auto_mode,
+            color_temp=color_temp
         )
 
-    # 获取更新后的状态
-    updated_state = get_lighting_state(light_id)
+        # 记录事件
+        if power is not None and power != old_power:
+            event_type = 'power_on' if power else 'power_off'
+            insert_lighting_event(
+                light_id=light_id,
+                event_type=event_type,
+                old_value=str(old_power),
+                new_value=str(power),
+                detail=f"Manual control: Light {'turned on' if power else 'turned off'}"
+            )
+
+        if brightness is not None and brightness != old_brightness:
+            insert_lighting_event(
+                light_id=light_id,
+                event_type='brightness_change',
+                old_value=str(old_brightness) if old_brightness else None,
+                new_value=str(brightness),
+                detail=f"Manual control: Brightness set to {brightness}%"
+            )
+
+        if auto_mode is not None and auto_mode != old_auto_mode:
+            insert_lighting_event(
+                light_id=light_id,
+                event_type='auto_mode_change',
+                old_value=str(old_auto_mode),
+                new_value=str(auto_mode),
+                detail=f"Manual control: Auto mode {'enabled' if auto_mode else 'disabled'}"
+            )
+
+        if color_temp is not None and color_temp != old_color_temp:
+            insert_lighting_event(
+                light_id=light_id,
+                event_type='color_temp_change',
+                old_value=str(old_color_temp) if old_color_temp else None,
+                new_value=str(color_temp),
+                detail=f"Manual control: Color temperature set to {color_temp}K"
+            )
+
+        # 获取更新后的状态
+        updated_state = get_lighting_state(light_id)
 
     # 发布 MQTT 消息以触发 WebSocket 实时推送
     if updated_state:
@@ -141,7 +144,13 @@ def control_lighting(light_id):
 
 @lighting_bp.route("/lighting/<light_id>/events", methods=["GET"])
 def lighting_events(light_id):
-    """获取灯具事件历史"""
+    """获取灯具事件历史（带 cursor/before/after 参数时按游标分页）"""
+    if wants_page(request.args):
+        try:
+            page = parse_page_args(request.args, 50)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(get_lighting_events_page(light_id, **page))
     limit = request.args.get('limit', 50, type=int)
     events = get_lighting_events(light_id, limit)
     return jsonify(events)
@@ -6,13 +6,14 @@
 
 from flask import Blueprint, jsonify, request
 from database import (
-    get_all_locks, get_lock_state, get_lock_events, 
+    get_all_locks, get_lock_state, get_lock_events, get_lock_events_page,
     insert_lock_event, verify_user_password, get_user_face_image,
     get_user_fingerprint_data, get_auto_lock_config, update_auto_lock_config,
     create_lock_user, get_all_lock_users, delete_lock_user, get_connection
 )
 from config import GLOBAL_PINCODE, DB_TYPE
 from mqtt_client import publish_lock_command
+from pagination import wants_page, parse_page_args
 
 
 def verify_pincode(pin):
@@ -90,7 +91,13 @@ def lock_state(lock_id):
 
 @lock_bp.route("/<lock_id>/events", methods=["GET"])
 def lock_events(lock_id):
-    """获取指定门锁的事件历史"""
+    """获取指定门锁的事件历史（带 cursor/before/after 参数时按游标分页）"""
+    if wants_page(request.args):
+        try:
+            page = parse_page_args(request.args, 50)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(get_lock_events_page(lock_id, **page))
     limit = request.args.get('limit', 50, type=int)
     return jsonify(get_lock_events(lock_id, limit))
 
@@ -8,8 +8,10 @@ import os
 from flask import Blueprint, jsonify, request
 from database import (
     upsert_smoke_alarm_state, get_smoke_alarm_state, get_all_smoke_alarms,
-    insert_smoke_alarm_event, get_smoke_alarm_events
+    insert_smoke_alarm_event, get_smoke_alarm_events, get_smoke_alarm_events_page,
+    unit_of_work
 )
+from pagination import wants_page, parse_page_args
 
 # 添加当前目录到路径以便导入 database_enhanced
 current_dir = os.path.dirname(__file__)
@@ -19,10 +21,10 @@ if parent_dir not in sys.path:
 
 from database_enhanced import (
     get_maintenance_records, add_maintenance_record, get_maintenance_due_devices,
-    get_all_maintenance_records,
+    get_all_maintenance_records_page,
     get_all_response_rules, create_response_rule, update_response_rule, delete_response_rule,
     acknowledge_alarm as db_acknowledge_alarm, get_alarm_acknowledgments,
-    get_alarm_statistics, update_daily_statistics
+    get_alarm_statistics
 )
 
 # 创建蓝图
@@ -115,7 +117,13 @@ def update_sensitivity(alarm_id):
 
 @smoke_alarm_bp.route("/<alarm_id>/events", methods=["GET"])
 def alarm_events(alarm_id):
-    """获取烟雾报警器事件历史"""
+    """获取烟雾报警器事件历史（带 cursor/before/after 参数时按游标分页）"""
+    if wants_page(request.args):
+        try:
+            page = parse_page_args(request.args, 50)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        return jsonify(get_smoke_alarm_events_page(alarm_id, **page))
     limit = request.args.get('limit', 50, type=int)
     events = get_smoke_alarm_events(alarm_id, limit)
     return jsonify(events)
@@ -138,55 +146,51 @@ def acknowledge_alarm(alarm_id):
     try:
         data = request.get_json() or {}
 
-        # 获取当前状态
-        current_state = get_smoke_alarm_state(alarm_id)
-        if not current_state:
-            return jsonify({"error": "烟雾报警器未找到"}), 404
-
-        # 获取参数
-        acknowledged_by = data.get('acknowledged_by', 'Unknown User')
-        event_id = data.get('event_id')
-        response_time = data.get('response_time')
-        action_taken = data.get('action_taken')
-        resolution = data.get('resolution', 'resolved')
-        notes = data.get('notes')
-
-        # 如果没有提供event_id，尝试获取最近的报警事件
-        if not event_id:
-            recent_events = get_smoke_alarm_events(alarm_id, limit=1)
-            if recent_events and recent_events[0].get('event_type') == 'ALARM_TRIGGERED':
-                event_id = recent_events[0].get('id')
-
-        # 使用增强的确认函数
-        ack_id = db_acknowledge_alarm(
-            alarm_id=alarm_id,
-            event_id=event_id,
-            acknowledged_by=acknowledged_by,
-            response_time=response_time,
-            action_taken=action_taken,
-            resolution=resolution,
-            notes=notes
-        )
-
-        # 清除报警状态
-        upsert_smoke_alarm_state(
-            alarm_id=alarm_id,
-            alarm_active=False
-        )
+        # 确认记录、状态清除、事件和统计在同一个事务中完成
+        with unit_of_work():
+            # 获取当前状态
+            current_state = get_smoke_alarm_state(alarm_id)
+            if not current_state:
+                return jsonify({"error": "烟雾报警器未找到"}), 404
+
+            # 获取参数
+            acknowledged_by = data.get('acknowledged_by', 'Unknown User')
+            event_id = data.get('event_id')
+            response_time = data.get('response_time')
+            action_taken = data.get('action_taken')
+            resolution = data.get('resolution', 'resolved')
+            notes = data.get('notes')
+
+            # 如果没有提供event_id，尝试获取最近的报警事件
+            if not event_id:
+                recent_events = get_smoke_alarm_events(alarm_id, limit=1)
+                if recent_events and recent_events[0].get('event_type') == 'ALARM_TRIGGERED':
+                    event_id = recent_events[0].get('id')
+
+            # 使用增强的确认函数
+            ack_id = db_acknowledge_alarm(
+                alarm_id=alarm_id,
+                event_id=event_id,
+                acknowledged_by=acknowledged_by,
+                response_time=response_time,
+                action_taken=action_taken,
+                resolution=resolution,
+                notes=notes
+            )
 
-        # 记录事件
-        insert_smoke_alarm_event(
-            alarm_id=alarm_id,
-            event_type='ALARM_ACKNOWLEDGED',
-            smoke_level=current_state.get('smoke_level'),
-            detail=f"Alarm acknowledged by {acknowledged_by}, resolution: {resolution}"
-        )
+            # 清除报警状态
+            upsert_smoke_alarm_state(
+                alarm_id=alarm_id,
+                alarm_active=False
+            )
 
-        # 更新统计
-        try:
-            update_daily_statistics(alarm_id)
-        except Exception as e:
-            print(f"Warning: Failed to update statistics: {e}")
+            # 记录事件
+            insert_smoke_alarm_event(
+                alarm_id=alarm_id,
+                event_type='ALARM_ACKNOWLEDGED',
+                smoke_level=current_state.get('smoke_level'),
+                detail=f"Alarm acknowledged by {acknowledged_by}, resolution: {resolution}"
+            )
 
         return jsonify({
             "status": "success",
@@ -316,17 +320,25 @@ def get_all_maintenance():
     - limit: 返回记录数量限制 (默认: 100)
     - alarm_id: 筛选指定设备 (可选)
     - maintenance_type: 筛选维护类型 (可选)
+    - cursor: 上一页返回的 next_cursor (可选)
+    - before / after: 只返回该时间之前 / 之后的记录 (可选)
     """
     try:
-        limit = request.args.get('limit', 100, type=int)
+        page = parse_page_args(request.args, 100)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    try:
         filter_alarm_id = request.args.get('alarm_id')
         filter_type = request.args.get('maintenance_type')
 
-        records = get_all_maintenance_records(limit, filter_alarm_id, filter_type)
+        result = get_all_maintenance_records_page(filter_alarm_id=filter_alarm_id,
+                                                  filter_type=filter_type, **page)
+        records = result['items']
         return jsonify({
             "success": True,
             "count": len(records),
-            "records": records
+            "records": records,
+            "next_cursor": result['next_cursor']
         })
     except Exception as e:
         return jsonify({
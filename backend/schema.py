@@ -0,0 +1,629 @@
+"""
+数据库结构版本管理（迁移）
+进程启动时执行一次 migrate()：按版本号顺序应用尚未执行的迁移，
+并把已应用的版本记录在 schema_version 表中，之后的连接不再执行任何 DDL。
+
+openGauss 的基础表结构由 init_db.sql 创建，这里只记录基线版本并执行后续增量迁移。
+新增迁移时在 MIGRATIONS 末尾追加一项，版本号递增，已发布的迁移不要修改。
+"""
+
+# ==================== SQLite 基线表结构 ====================
+
+SQLITE_BASELINE = [
+    # 温湿度数据表
+    """
+    CREATE TABLE IF NOT EXISTS temperature_humidity_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        device_id VARCHAR(50) NOT NULL,
+        temperature FLOAT NOT NULL,
+        humidity FLOAT NOT NULL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 门锁状态表
+    """
+    CREATE TABLE IF NOT EXISTS lock_state (
+        lock_id VARCHAR(50) PRIMARY KEY,
+        locked BOOLEAN NOT NULL,
+        method VARCHAR(20),
+        actor VARCHAR(64),
+        battery INTEGER DEFAULT 100,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 门锁事件表
+    """
+    CREATE TABLE IF NOT EXISTS lock_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        lock_id VARCHAR(50) NOT NULL,
+        event_type VARCHAR(32) NOT NULL,
+        method VARCHAR(20),
+        actor VARCHAR(64),
+        detail TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 用户认证表
+    """
+    CREATE TABLE IF NOT EXISTS lock_users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username VARCHAR(50) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        face_image_path VARCHAR(255),
+        fingerprint_data TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 自动锁定配置表
+    """
+    CREATE TABLE IF NOT EXISTS lock_auto_config (
+        lock_id VARCHAR(50) PRIMARY KEY,
+        auto_lock_enabled BOOLEAN DEFAULT 1,
+        auto_lock_delay INTEGER DEFAULT 5,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 空调状态表
+    """
+    CREATE TABLE IF NOT EXISTS ac_state (
+        ac_id VARCHAR(50) PRIMARY KEY,
+        device_id VARCHAR(50) NOT NULL,
+        power BOOLEAN DEFAULT 0,
+        mode VARCHAR(20) DEFAULT 'cool',
+        target_temp FLOAT DEFAULT 26.0,
+        current_temp FLOAT,
+        current_humidity FLOAT,
+        fan_speed VARCHAR(20) DEFAULT 'auto',
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 空调事件表
+    """
+    CREATE TABLE IF NOT EXISTS ac_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ac_id VARCHAR(50) NOT NULL,
+        event_type VARCHAR(32) NOT NULL,
+        old_value TEXT,
+        new_value TEXT,
+        detail TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 灯具状态表
+    """
+    CREATE TABLE IF NOT EXISTS lighting_state (
+        light_id VARCHAR(50) PRIMARY KEY,
+        device_id VARCHAR(50) NOT NULL,
+        power BOOLEAN DEFAULT 0,
+        brightness INTEGER DEFAULT 50,
+        auto_mode BOOLEAN DEFAULT 0,
+        room_brightness FLOAT,
+        color_temp INTEGER DEFAULT 4000,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 灯具事件表
+    """
+    CREATE TABLE IF NOT EXISTS lighting_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        light_id VARCHAR(50) NOT NULL,
+        event_type VARCHAR(32) NOT NULL,
+        old_value TEXT,
+        new_value TEXT,
+        detail TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 房间表
+    """
+    CREATE TABLE IF NOT EXISTS rooms (
+        room_id VARCHAR(50) PRIMARY KEY,
+        room_name VARCHAR(100) NOT NULL,
+        floor INTEGER DEFAULT 1,
+        area FLOAT,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 烟雾报警器状态表（增强版）
+    """
+    CREATE TABLE IF NOT EXISTS smoke_alarm_state (
+        alarm_id VARCHAR(50) PRIMARY KEY,
+        room_id VARCHAR(50),
+        location VARCHAR(50) NOT NULL,
+        smoke_level FLOAT DEFAULT 0.0,
+        alarm_active BOOLEAN DEFAULT 0,
+        battery INTEGER DEFAULT 100,
+        test_mode BOOLEAN DEFAULT 0,
+        sensitivity VARCHAR(20) DEFAULT 'medium',
+        installation_date TIMESTAMP,
+        last_maintenance_date TIMESTAMP,
+        device_model VARCHAR(100) DEFAULT 'SA-2024',
+        firmware_version VARCHAR(50) DEFAULT '1.0.0',
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (room_id) REFERENCES rooms(room_id)
+    )
+    """,
+    # 烟雾报警器事件表
+    """
+    CREATE TABLE IF NOT EXISTS smoke_alarm_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        alarm_id VARCHAR(50) NOT NULL,
+        event_type VARCHAR(32) NOT NULL,
+        smoke_level FLOAT,
+        detail TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 自动化响应规则表
+    """
+    CREATE TABLE IF NOT EXISTS smoke_alarm_response_rules (
+        rule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        rule_name VARCHAR(100) NOT NULL,
+        alarm_id VARCHAR(50),
+        room_id VARCHAR(50),
+        trigger_condition VARCHAR(50),
+        condition_value FLOAT,
+        action_type VARCHAR(50),
+        action_target VARCHAR(100),
+        action_params TEXT,
+        enabled BOOLEAN DEFAULT 1,
+        priority INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (alarm_id) REFERENCES smoke_alarm_state(alarm_id),
+        FOREIGN KEY (room_id) REFERENCES rooms(room_id)
+    )
+    """,
+    # 用户通知配置表
+    """
+    CREATE TABLE IF NOT EXISTS user_notification_config (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id VARCHAR(50) NOT NULL UNIQUE,
+        username VARCHAR(100),
+        email VARCHAR(255),
+        phone VARCHAR(20),
+        notify_on_alarm BOOLEAN DEFAULT 1,
+        notify_on_low_battery BOOLEAN DEFAULT 1,
+        notify_on_maintenance_due BOOLEAN DEFAULT 1,
+        notification_channels TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    # 通知历史表
+    """
+    CREATE TABLE IF NOT EXISTS notification_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id VARCHAR(50) NOT NULL,
+        alarm_id VARCHAR(50),
+        notification_type VARCHAR(50),
+        channel VARCHAR(20),
+        subject VARCHAR(255),
+        message TEXT,
+        sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        status VARCHAR(20) DEFAULT 'sent',
+        error_message TEXT
+    )
+    """,
+    # 设备维护记录表
+    """
+    CREATE TABLE IF NOT EXISTS device_maintenance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        alarm_id VARCHAR(50),
+        maintenance_type VARCHAR(50),
+        performed_by VARCHAR(100),
+        maintenance_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        next_maintenance_date TIMESTAMP,
+        notes TEXT,
+        cost DECIMAL(10, 2),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (alarm_id) REFERENCES smoke_alarm_state(alarm_id)
+    )
+    """,
+    # 报警确认记录表
+    """
+    CREATE TABLE IF NOT EXISTS alarm_acknowledgments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        alarm_id VARCHAR(50) NOT NULL,
+        event_id INTEGER,
+        acknowledged_by VARCHAR(100) NOT NULL,
+        acknowledged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        response_time INTEGER,
+        action_taken TEXT,
+        resolution VARCHAR(50),
+        notes TEXT,
+        FOREIGN KEY (event_id) REFERENCES smoke_alarm_events(id)
+    )
+    """,
+    # 报警统计表
+    """
+    CREATE TABLE IF NOT EXISTS alarm_statistics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        alarm_id VARCHAR(50),
+        room_id VARCHAR(50),
+        stat_date DATE,
+        total_alarms INTEGER DEFAULT 0,
+        false_alarms INTEGER DEFAULT 0,
+        real_alarms INTEGER DEFAULT 0,
+        avg_response_time INTEGER,
+        max_smoke_level FLOAT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(alarm_id, stat_date)
+    )
+    """,
+]
+
+# ==================== v2：按查询模式建立的索引 ====================
+# 热点查询都是「按设备过滤 + ORDER BY timestamp DESC LIMIT n」，
+# (设备, timestamp DESC) 复合索引可以直接按顺序取前 n 行，避免全表扫描和排序
+
+SQLITE_QUERY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_temp_hum_device_time ON temperature_humidity_data(device_id, timestamp DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_temp_hum_timestamp ON temperature_humidity_data(timestamp DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_lock_events_lock_time ON lock_events(lock_id, timestamp DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_ac_events_ac_time ON ac_events(ac_id, timestamp DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_lighting_events_light_time ON lighting_events(light_id, timestamp DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_smoke_alarm_events_alarm_time ON smoke_alarm_events(alarm_id, timestamp DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_smoke_alarm_rules_alarm ON smoke_alarm_response_rules(alarm_id, enabled)",
+    "CREATE INDEX IF NOT EXISTS idx_notification_history_user_time ON notification_history(user_id, sent_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_device_maintenance_alarm ON device_maintenance(alarm_id, maintenance_date DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_alarm_ack_alarm_time ON alarm_acknowledgments(alarm_id, acknowledged_at DESC)",
+]
+
+# openGauss 的事件表索引已在 init_db.sql 中，只缺温湿度表的复合索引
+OPENGAUSS_QUERY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_temp_hum_device_time ON temperature_humidity_data(device_id, timestamp DESC)",
+]
+
+# ==================== v3：温湿度降采样汇总表 ====================
+# 每个设备每个时间桶一行，写入原始数据时增量维护；平均值 = *_sum / samples
+
+ROLLUP_TABLES = {
+    '1m': 'temperature_humidity_1m',
+    '1h': 'temperature_humidity_1h',
+    '1d': 'temperature_humidity_1d',
+}
+
+# 时间桶起点表达式（SQLite 时间为 UTC 文本，与 CURRENT_TIMESTAMP 一致）
+SQLITE_BUCKET_FORMAT = {
+    '1m': '%Y-%m-%d %H:%M:00',
+    '1h': '%Y-%m-%d %H:00:00',
+    '1d': '%Y-%m-%d 00:00:00',
+}
+OPENGAUSS_BUCKET_UNIT = {'1m': 'minute', '1h': 'hour', '1d': 'day'}
+
+_ROLLUP_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        device_id VARCHAR(50) NOT NULL,
+        bucket TIMESTAMP NOT NULL,
+        samples INTEGER NOT NULL,
+        temp_min FLOAT,
+        temp_max FLOAT,
+        temp_sum FLOAT,
+        hum_min FLOAT,
+        hum_max FLOAT,
+        hum_sum FLOAT,
+        PRIMARY KEY (device_id, bucket)
+    )
+"""
+
+# 从已有原始数据回填汇总表
+_ROLLUP_BACKFILL = """
+    INSERT INTO {table} (device_id, bucket, samples, temp_min, temp_max, temp_sum, hum_min, hum_max, hum_sum)
+    SELECT device_id, {bucket} AS b, COUNT(*),
+           MIN(temperature), MAX(temperature), SUM(temperature),
+           MIN(humidity), MAX(humidity), SUM(humidity)
+    FROM temperature_humidity_data
+    WHERE temperature IS NOT NULL AND humidity IS NOT NULL
+    GROUP BY device_id, b
+"""
+
+SQLITE_ROLLUPS = []
+OPENGAUSS_ROLLUPS = []
+for _res, _table in ROLLUP_TABLES.items():
+    SQLITE_ROLLUPS.append(_ROLLUP_DDL.format(table=_table))
+    SQLITE_ROLLUPS.append(_ROLLUP_BACKFILL.format(
+        table=_table, bucket=f"strftime('{SQLITE_BUCKET_FORMAT[_res]}', timestamp)"))
+    OPENGAUSS_ROLLUPS.append(_ROLLUP_DDL.format(table=_table))
+    OPENGAUSS_ROLLUPS.append(_ROLLUP_BACKFILL.format(
+        table=_table, bucket=f"date_trunc('{OPENGAUSS_BUCKET_UNIT[_res]}', timestamp)"))
+
+# ==================== v4：openGauss 按月分区 ====================
+# 高频追加表改为按 timestamp 的间隔分区表（每月一个分区），过期数据按分区整体删除。
+# 重建方式：改名旧表 -> 建分区表（沿用原序列）-> 复制数据 -> 删除旧表 -> 重建本地索引。
+# smoke_alarm_events 被 alarm_acknowledgments.event_id 外键引用，分区表无法作为外键目标，保持不分区。
+# SQLite 没有原生分区，过期数据按时间索引分批删除（见 database.purge_expired）。
+
+OPENGAUSS_PARTITION_START = '2024-01-01 00:00:00'
+
+# 表 -> (除 id/timestamp 外的列定义, 本地索引)
+OPENGAUSS_PARTITIONED_TABLES = {
+    'temperature_humidity_data': (
+        """
+        device_id VARCHAR(50) NOT NULL,
+        temperature FLOAT NOT NULL,
+        humidity FLOAT NOT NULL,
+        """,
+        [
+            "CREATE INDEX idx_temp_hum_device_time ON temperature_humidity_data(device_id, timestamp DESC) LOCAL",
+            "CREATE INDEX idx_temp_hum_timestamp ON temperature_humidity_data(timestamp DESC) LOCAL",
+        ],
+    ),
+    'lock_events': (
+        """
+        lock_id VARCHAR(50) NOT NULL,
+        event_type VARCHAR(32) NOT NULL,
+        method VARCHAR(20),
+        actor VARCHAR(64),
+        detail TEXT,
+        """,
+        ["CREATE INDEX idx_lock_events_lock_time ON lock_events(lock_id, timestamp DESC) LOCAL"],
+    ),
+    'ac_events': (
+        """
+        ac_id VARCHAR(50) NOT NULL,
+        event_type VARCHAR(32) NOT NULL,
+        old_value TEXT,
+        new_value TEXT,
+        detail TEXT,
+        """,
+        ["CREATE INDEX idx_ac_events_ac_time ON ac_events(ac_id, timestamp DESC) LOCAL"],
+    ),
+    'lighting_events': (
+        """
+        light_id VARCHAR(50) NOT NULL,
+        event_type VARCHAR(32) NOT NULL,
+        old_value TEXT,
+        new_value TEXT,
+        detail TEXT,
+        """,
+        ["CREATE INDEX idx_lighting_events_light_time ON lighting_events(light_id, timestamp DESC) LOCAL"],
+    ),
+}
+
+
+def _partition_opengauss_table(table, columns, indexes):
+    """生成把 table 重建为按月间隔分区表的迁移步骤"""
+    names = [line.strip().split()[0] for line in columns.strip().splitlines()]
+    column_list = ', '.join(['id'] + names)
+    return [
+        f"ALTER TABLE {table} RENAME TO {table}_unpartitioned",
+        f"""
+        CREATE TABLE {table} (
+            id INTEGER NOT NULL DEFAULT nextval('{table}_id_seq'),
+            {columns.strip()}
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, timestamp)
+        )
+        PARTITION BY RANGE (timestamp)
+        INTERVAL ('1 month')
+        (PARTITION p_history VALUES LESS THAN ('{OPENGAUSS_PARTITION_START}'))
+        """,
+        f"""
+        INSERT INTO {table} ({column_list}, timestamp)
+        SELECT {column_list}, COALESCE(timestamp, CURRENT_TIMESTAMP) FROM {table}_unpartitioned
+        """,
+        f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id",
+        f"DROP TABLE {table}_unpartitioned",
+    ] + indexes
+
+
+OPENGAUSS_PARTITIONING = []
+for _table, (_columns, _indexes) in OPENGAUSS_PARTITIONED_TABLES.items():
+    OPENGAUSS_PARTITIONING.extend(_partition_opengauss_table(_table, _columns, _indexes))
+
+# ==================== v5：游标分页索引 ====================
+# 分页按 (timestamp DESC, id) 排序。SQLite 索引末尾隐含 rowid，v2 的索引已满足该顺序；
+# openGauss 需要把 id 显式加到索引末尾，否则同一设备的所有行都要排序后才能取出一页。
+# 维护记录列表不按设备过滤时按 maintenance_date 分页，两边都补一条单列索引。
+
+SQLITE_KEYSET_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_device_maintenance_date ON device_maintenance(maintenance_date DESC)",
+]
+
+OPENGAUSS_KEYSET_INDEXES = [
+    "DROP INDEX IF EXISTS idx_temp_hum_device_time",
+    "DROP INDEX IF EXISTS idx_temp_hum_timestamp",
+    "CREATE INDEX idx_temp_hum_device_time_id ON temperature_humidity_data(device_id, timestamp DESC, id) LOCAL",
+    "CREATE INDEX idx_temp_hum_time_id ON temperature_humidity_data(timestamp DESC, id) LOCAL",
+    "DROP INDEX IF EXISTS idx_lock_events_lock_time",
+    "CREATE INDEX idx_lock_events_lock_time_id ON lock_events(lock_id, timestamp DESC, id) LOCAL",
+    "DROP INDEX IF EXISTS idx_ac_events_ac_time",
+    "CREATE INDEX idx_ac_events_ac_time_id ON ac_events(ac_id, timestamp DESC, id) LOCAL",
+    "DROP INDEX IF EXISTS idx_lighting_events_light_time",
+    "CREATE INDEX idx_lighting_events_light_time_id ON lighting_events(light_id, timestamp DESC, id) LOCAL",
+    "DROP INDEX IF EXISTS idx_smoke_alarm_events_alarm_time",
+    "CREATE INDEX IF NOT EXISTS idx_smoke_alarm_events_alarm_time_id ON smoke_alarm_events(alarm_id, timestamp DESC, id)",
+    "DROP INDEX IF EXISTS idx_device_maintenance_alarm",
+    "CREATE INDEX IF NOT EXISTS idx_device_maintenance_alarm_id ON device_maintenance(alarm_id, maintenance_date DESC, id)",
+    "CREATE INDEX IF NOT EXISTS idx_device_maintenance_date_id ON device_maintenance(maintenance_date DESC, id)",
+]
+
+# ==================== v6：温湿度设备汇总表 ====================
+# 每个设备一行，写入温湿度时在同一事务内累加，/devices 不再对整张原始表 COUNT(*) GROUP BY。
+# reading_count 为累计写入条数，不随数据保留策略删除原始数据而减少。
+
+SENSOR_DEVICES_DDL = """
+    CREATE TABLE IF NOT EXISTS sensor_devices (
+        device_id VARCHAR(50) PRIMARY KEY,
+        reading_count INTEGER NOT NULL DEFAULT 0,
+        first_seen TIMESTAMP,
+        last_seen TIMESTAMP,
+        last_temperature FLOAT,
+        last_humidity FLOAT
+    )
+"""
+
+# 从已有原始数据回填（最后一条读数走 (device_id, timestamp DESC) 索引）
+SENSOR_DEVICES_BACKFILL = """
+    INSERT INTO sensor_devices
+    (device_id, reading_count, first_seen, last_seen, last_temperature, last_humidity)
+    SELECT d.device_id, d.n, d.first_seen, d.last_seen,
+           (SELECT t.temperature FROM temperature_humidity_data t
+            WHERE t.device_id = d.device_id ORDER BY t.timestamp DESC LIMIT 1),
+           (SELECT t.humidity FROM temperature_humidity_data t
+            WHERE t.device_id = d.device_id ORDER BY t.timestamp DESC LIMIT 1)
+    FROM (
+        SELECT device_id, COUNT(*) AS n, MIN(timestamp) AS first_seen, MAX(timestamp) AS last_seen
+        FROM temperature_humidity_data
+        GROUP BY device_id
+    ) d
+"""
+
+# ==================== v7：报警统计增量计数 ====================
+# 事件和确认写入时在同一事务内累加 alarm_statistics 当天一行，不再按天重算。
+# 平均响应时间由累计的 response_time_sum / response_count 得出；
+# 离线重建按时间范围扫描事件表和确认表，补两条时间单列索引。
+
+ALARM_STATISTICS_COUNTERS = [
+    "ALTER TABLE alarm_statistics ADD COLUMN response_count INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE alarm_statistics ADD COLUMN response_time_sum INTEGER NOT NULL DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS idx_smoke_alarm_events_time ON smoke_alarm_events(timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_alarm_ack_time ON alarm_acknowledgments(acknowledged_at)",
+]
+
+# 初始房间数据
+DEFAULT_ROOMS = [
+    ('living_room', '客厅', 1, 35.5, '主要活动区域'),
+    ('bedroom1', '主卧', 1, 20.0, '主卧室'),
+    ('bedroom2', '次卧', 1, 15.0, '次卧室'),
+    ('kitchen', '厨房', 1, 12.0, '烹饪区域'),
+    ('study', '书房', 1, 18.0, '学习工作空间')
+]
+
+
+def _seed_rooms_sqlite(conn):
+    """插入初始房间数据（如果不存在）"""
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM rooms")
+    if cur.fetchone()[0] == 0:
+        cur.executemany("""
+            INSERT INTO rooms (room_id, room_name, floor, area, description)
+            VALUES (?, ?, ?, ?, ?)
+        """, DEFAULT_ROOMS)
+
+
+# ==================== 迁移列表 ====================
+# 每项：(版本号, 说明, {'sqlite': [步骤...], 'opengauss': [步骤...]})
+# 步骤可以是 SQL 字符串，也可以是接收连接对象的函数
+
+MIGRATIONS = [
+    (1, 'baseline tables', {
+        'sqlite': SQLITE_BASELINE + [_seed_rooms_sqlite],
+        'opengauss': [],  # 基线由 init_db.sql 创建
+    }),
+    (2, 'query pattern indexes', {
+        'sqlite': SQLITE_QUERY_INDEXES,
+        'opengauss': OPENGAUSS_QUERY_INDEXES,
+    }),
+    (3, 'temperature/humidity rollup tables', {
+        'sqlite': SQLITE_ROLLUPS,
+        'opengauss': OPENGAUSS_ROLLUPS,
+    }),
+    (4, 'monthly partitions for append-only tables (openGauss)', {
+        'sqlite': [],
+        'opengauss': OPENGAUSS_PARTITIONING,
+    }),
+    (5, 'keyset pagination indexes', {
+        'sqlite': SQLITE_KEYSET_INDEXES,
+        'opengauss': OPENGAUSS_KEYSET_INDEXES,
+    }),
+    (6, 'sensor device summary table', {
+        'sqlite': [SENSOR_DEVICES_DDL, SENSOR_DEVICES_BACKFILL],
+        'opengauss': [SENSOR_DEVICES_DDL, SENSOR_DEVICES_BACKFILL],
+    }),
+    (7, 'incremental alarm statistics counters', {
+        'sqlite': ALARM_STATISTICS_COUNTERS,
+        'opengauss': ALARM_STATISTICS_COUNTERS,
+    }),
+]
+
+SCHEMA_VERSION_DDL = {
+    'sqlite': """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(200),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+    'opengauss': """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(200),
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+}
+
+
+def latest_version():
+    """代码中定义的最新结构版本"""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def _run_step(conn, step):
+    if callable(step):
+        step(conn)
+    else:
+        conn.execute(step)
+
+
+def _migrate_sqlite(conn):
+    conn.execute(SCHEMA_VERSION_DDL['sqlite'])
+    conn.commit()
+    # BEGIN IMMEDIATE 取得写锁，避免多个进程（后端、模拟器）同时迁移
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+        applied = []
+        for version, description, steps in MIGRATIONS:
+            if version <= current:
+                continue
+            for step in steps.get('sqlite', []):
+                _run_step(conn, step)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            applied.append(version)
+        conn.commit()
+        return applied
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _migrate_opengauss(conn):
+    conn.execute(SCHEMA_VERSION_DDL['opengauss'])
+    with conn.xact():
+        conn.execute("LOCK TABLE schema_version IN EXCLUSIVE MODE")
+        current = conn.prepare("SELECT COALESCE(MAX(version), 0) FROM schema_version").first()
+        applied = []
+        record = conn.prepare("INSERT INTO schema_version (version, description) VALUES ($1, $2)")
+        for version, description, steps in MIGRATIONS:
+            if version <= current:
+                continue
+            for step in steps.get('opengauss', []):
+                _run_step(conn, step)
+            record(version, description)
+            applied.append(version)
+        return applied
+
+
+def migrate(conn, dialect):
+    """应用所有尚未执行的迁移，返回本次应用的版本号列表"""
+    if dialect == 'sqlite':
+        return _migrate_sqlite(conn)
+    return _migrate_opengauss(conn)
+
+
+def current_version(conn, dialect):
+    """数据库中已记录的结构版本（未初始化时为 0）"""
+    try:
+        if dialect == 'sqlite':
+            return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+        return conn.prepare("SELECT COALESCE(MAX(version), 0) FROM schema_version").first()
+    except Exception:
+        return 0
@@ -0,0 +1,434 @@
+"""
+温湿度原始数据的追加式分段存储（SENSOR_STORE=segments 时代替 temperature_humidity_data 表，需要 NumPy）
+
+每个设备每天一个段文件 <SEGMENT_DIR>/<device_id>/<YYYY-MM-DD>.seg，记录为定长
+(ts 秒, seq, temperature, humidity)，只追加不修改；读取时用 numpy.memmap 映射，不复制数据。
+seq 是全局递增的记录号，作用与表的自增 id 相同（分页游标、同一秒内的先后顺序）。
+
+每 SEGMENT_INDEX_STRIDE 条记录在同名 .idx 文件中追加一个 (ts, 记录号) 稀疏索引项：
+范围查询先在稀疏索引上二分定位到块，再在块内二分，只触及需要的页；
+聚合直接在映射数组上向量化计算（np.*.reduceat）。
+段内时间出现回退（时钟回拨）时写入 .unsorted 标记，该段的查询改为整段过滤后排序。
+
+同一目录可以被多个进程打开（如 ingest 进程写入、Web 进程查询和执行保留 / 归档）：
+- 追加和删除段文件持有 <SEGMENT_DIR>/.lock 文件锁，下一个 seq 保存在 <SEGMENT_DIR>/.seq
+- 每次读取和追加前按文件当前大小刷新段的记录数和稀疏索引，能看到其他进程追加的记录和删除的段
+"""
+
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import fcntl
+except ImportError:
+    # 没有 fcntl 的平台（Windows）只做进程内互斥
+    fcntl = None
+
+_EPOCH = datetime(1970, 1, 1)
+
+# 设备ID 直接作为目录名：只允许字母、数字、下划线、连字符和点，不能以点开头（排除 . 和 ..）
+_DEVICE_ID = re.compile(r'^[\w-][\w.-]{0,127}$')
+
+
+def valid_device_id(device_id):
+    return isinstance(device_id, str) and _DEVICE_ID.match(device_id) is not None
+
+
+def available():
+    return np is not None
+
+
+if np is not None:
+    RECORD = np.dtype([('ts', '<i8'), ('seq', '<i8'), ('temperature', '<f8'), ('humidity', '<f8')])
+    INDEX = np.dtype([('ts', '<i8'), ('pos', '<i8')])
+
+
+def to_epoch(value):
+    """datetime 或时间文本转为 Unix 秒"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int((value - _EPOCH).total_seconds())
+
+
+def format_times(ts, sep=' '):
+    """Unix 秒数组批量转为时间文本（YYYY-MM-DD{sep}HH:MM:SS）"""
+    if not len(ts):
+        # 空数组上 np.char.replace 会报错（NumPy 2.x）
+        return []
+    text = np.datetime_as_string(np.asarray(ts, dtype='datetime64[s]'))
+    return text.tolist() if sep == 'T' else np.char.replace(text, 'T', sep).tolist()
+
+
+class _Segment:
+    """一个段文件的元数据（记录数、稀疏索引、是否有序），refresh() 按文件当前状态更新"""
+
+    def __init__(self, path):
+        self.path = path
+        self._signature = None
+        self.count = 0
+        self.sorted = True
+        self.index = np.empty(0, INDEX)
+        self.last = None
+        self.refresh()
+
+    def refresh(self):
+        """文件被追加、删除或重建后重新读取记录数、稀疏索引和最后一条记录"""
+        try:
+            st = os.stat(self.path)
+            signature = (st.st_ino, st.st_size)
+        except FileNotFoundError:
+            signature = None
+        if signature == self._signature:
+            return
+        self._signature = signature
+        # 写入中断（或其他进程正在写入）的不完整记录不计入
+        self.count = signature[1] // RECORD.itemsize if signature else 0
+        self.sorted = not os.path.exists(self.path + '.unsorted')
+        try:
+            index = np.fromfile(self.path + '.idx', dtype=INDEX)
+        except (FileNotFoundError, ValueError):
+            index = np.empty(0, INDEX)
+        self.index = index[index['pos'] < self.count]
+        self.last = self.record(self.count - 1) if self.count else None
+
+    def record(self, pos):
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(pos * RECORD.itemsize)
+                data = f.read(RECORD.itemsize)
+        except FileNotFoundError:
+            return None
+        return np.frombuffer(data, dtype=RECORD)[0] if len(data) == RECORD.itemsize else None
+
+    def map(self):
+        """当前全部记录的只读映射"""
+        if not self.count:
+            return np.empty(0, RECORD)
+        try:
+            return np.memmap(self.path, dtype=RECORD, mode='r', shape=(self.count,))
+        except (FileNotFoundError, ValueError):
+            # 段已被其他进程删除
+            return np.empty(0, RECORD)
+
+    def slice(self, lo, hi):
+        """段内 lo <= ts < hi 的记录，按 (ts, seq) 排序；有序段返回映射视图"""
+        data = self.map()
+        if not len(data):
+            return data
+        if not self.sorted:
+            ts = data['ts']
+            picked = data[(ts >= lo) & (ts < hi)]
+            return picked[np.argsort(picked['ts'], kind='stable')]
+        start, end = 0, self.count
+        if len(self.index):
+            first = np.searchsorted(self.index['ts'], lo, side='left') - 1
+            if first >= 0:
+                start = int(self.index['pos'][first])
+            last = np.searchsorted(self.index['ts'], hi, side='left')
+            if last < len(self.index):
+                end = int(self.index['pos'][last])
+        block = data[start:end]
+        ts = block['ts']
+        return block[np.searchsorted(ts, lo, side='left'):np.searchsorted(ts, hi, side='left')]
+
+
+class SegmentStore:
+    """按 设备/日期 分段的定长记录存储，线程安全；追加和删除用文件锁与其他进程互斥"""
+
+    def __init__(self, root, stride=256):
+        self.root = root
+        self.stride = stride
+        self._lock = threading.Lock()
+        self._segments = {}
+
+    @contextmanager
+    def _writing(self):
+        """追加 / 删除段文件：进程内线程锁 + 跨进程文件锁"""
+        with self._lock:
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, '.lock'), 'a') as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+
+    # ---------- 段文件 ----------
+
+    def devices(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def _days(self, device_id):
+        """设备已有的段日期（升序）；不合法的设备ID 没有数据"""
+        if not valid_device_id(device_id):
+            return []
+        directory = os.path.join(self.root, device_id)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(f[:-4] for f in os.listdir(directory) if f.endswith('.seg'))
+
+    def _segment(self, device_id, day):
+        """取得段并按文件当前状态刷新（调用方持有 self._lock）"""
+        if not valid_device_id(device_id):
+            raise ValueError(f"非法的设备ID: {device_id!r}")
+        key = (device_id, day)
+        segment = self._segments.get(key)
+        if segment is None:
+            segment = self._segments[key] = _Segment(os.path.join(self.root, device_id, f'{day}.seg'))
+        else:
+            segment.refresh()
+        return segment
+
+    def _segments_in(self, device_id, lo, hi):
+        """与 [lo, hi) 有交集的段（按日期升序）"""
+        first = (_EPOCH + timedelta(seconds=lo)).strftime('%Y-%m-%d')
+        last = (_EPOCH + timedelta(seconds=hi - 1)).strftime('%Y-%m-%d')
+        with self._lock:
+            return [self._segment(device_id, day) for day in self._days(device_id) if first <= day <= last]
+
+    # ---------- 写入 ----------
+
+    def _reserve_seq(self, n):
+        """
+        分配 n 个连续 seq，返回第一个（调用方持有写锁）
+        下一个 seq 保存在 .seq 文件中，各进程共用；没有该文件时（旧目录）取各段最后一条记录的最大 seq + 1
+        """
+        path = os.path.join(self.root, '.seq')
+        try:
+            with open(path, 'rb') as f:
+                first = int.from_bytes(f.read(), 'little')
+        except FileNotFoundError:
+            first = 0
+        if not first:
+            top = 0
+            for device_id in self.devices():
+                for day in self._days(device_id):
+                    last = self._segment(device_id, day).last
+                    if last is not None:
+                        top = max(top, int(last['seq']))
+            first = top + 1
+        # 先写回再追加记录：中途失败只会跳过若干 seq，不会重复使用
+        with open(path + '.tmp', 'wb') as f:
+            f.write((first + n).to_bytes(8, 'little'))
+        os.replace(path + '.tmp', path)
+        return first
+
+    def append(self, readings):
+        """
+        追加一批读数 [(device_id, datetime, temperature, humidity), ...]，返回写入条数
+        temperature / humidity 不能为空（与表的 NOT NULL 约束一致）
+        """
+        groups = {}
+        for device_id, ts, temperature, humidity in readings:
+            if not valid_device_id(device_id):
+                raise ValueError(f"非法的设备ID: {device_id!r}")
+            if temperature is None or humidity is None:
+                raise ValueError(f"温湿度数据不完整: {device_id}")
+            groups.setdefault((device_id, ts.strftime('%Y-%m-%d')), []).append(
+                (to_epoch(ts), float(temperature), float(humidity)))
+        if not groups:
+            return 0
+
+        with self._writing():
+            seq = self._reserve_seq(len(readings))
+            for (device_id, day), rows in groups.items():
+                os.makedirs(os.path.join(self.root, device_id), exist_ok=True)
+                # _segment 按文件当前大小刷新：包含其他进程刚追加的记录，段被删除后从 0 开始
+                segment = self._segment(device_id, day)
+                records = np.empty(len(rows), RECORD)
+                records['ts'] = [r[0] for r in rows]
+                records['seq'] = np.arange(seq, seq + len(rows))
+                records['temperature'] = [r[1] for r in rows]
+                records['humidity'] = [r[2] for r in rows]
+                self._write(segment, records)
+                seq += len(rows)
+        return len(readings)
+
+    def _write(self, segment, records):
+        """
+        追加到段文件（调用方持有写锁，segment 已按文件当前大小刷新）
+        先写 .unsorted 标记和稀疏索引、最后写记录：其他进程按记录数刷新时，标记和索引已经就绪；
+        只截掉上次写入中断留下的不完整记录和多余的索引项
+        """
+        start = segment.count
+        ts = records['ts']
+        if segment.sorted and ((segment.last is not None and ts[0] < segment.last['ts']) or np.any(ts[1:] < ts[:-1])):
+            open(segment.path + '.unsorted', 'w').close()
+
+        positions = np.arange(-start % self.stride, len(records), self.stride)
+        if len(positions):
+            entries = np.empty(len(positions), INDEX)
+            entries['ts'] = ts[positions]
+            entries['pos'] = positions + start
+            with open(segment.path + '.idx', 'ab') as f:
+                if f.tell() > len(segment.index) * INDEX.itemsize:
+                    f.truncate(len(segment.index) * INDEX.itemsize)
+                f.write(entries.tobytes())
+
+        with open(segment.path, 'ab') as f:
+            if f.tell() > start * RECORD.itemsize:
+                f.truncate(start * RECORD.itemsize)
+            f.write(records.tobytes())
+        segment.refresh()
+
+    # ---------- 读取 ----------
+
+    def range(self, device_id, start, end):
+        """设备 [start, end) 内的记录数组，按 (ts, seq) 排序"""
+        lo, hi = to_epoch(start), to_epoch(end)
+        parts = [s.slice(lo, hi) for s in self._segments_in(device_id, lo, hi)]
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return np.empty(0, RECORD)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def count(self, device_id, start, end):
+        lo, hi = to_epoch(start), to_epoch(end)
+        return sum(len(s.slice(lo, hi)) for s in self._segments_in(device_id, lo, hi))
+
+    def aggregate(self, device_id, start, end, seconds):
+        """
+        按桶宽聚合，返回 [(桶起点 Unix 秒, 样本数, 温度 avg/min/max, 湿度 avg/min/max), ...]
+        列顺序与 sensor.aggregate.raw 相同
+        """
+        data = self.range(device_id, start, end)
+        if not len(data):
+            return []
+        buckets = data['ts'] // seconds * seconds
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        counts = np.diff(np.r_[starts, len(buckets)])
+        t, h = data['temperature'], data['humidity']
+        columns = (buckets[starts], counts,
+                   np.add.reduceat(t, starts) / counts, np.minimum.reduceat(t, starts), np.maximum.reduceat(t, starts),
+                   np.add.reduceat(h, starts) / counts, np.minimum.reduceat(h, starts), np.maximum.reduceat(h, starts))
+        return list(zip(*(c.tolist() for c in columns)))
+
+    def scan(self, device_id, start, end):
+        """
+        按天依次产生 [start, end) 内的 (设备ID 列表, 记录数组)，每天内按 (ts, seq) 排序
+        device_id 为 None 时合并全部设备；内存占用只与一天的数据量有关
+        """
+        lo, hi = to_epoch(start), to_epoch(end)
+        first = (_EPOCH + timedelta(seconds=lo)).strftime('%Y-%m-%d')
+        last = (_EPOCH + timedelta(seconds=hi - 1)).strftime('%Y-%m-%d')
+        with self._lock:
+            days = {d: set(self._days(d)) for d in ([device_id] if device_id else self.devices())}
+        for day in sorted(set().union(*days.values())):
+            if not first <= day <= last:
+                continue
+            parts, names = [], []
+            for d, present in days.items():
+                if day not in present:
+                    continue
+                with self._lock:
+                    segment = self._segment(d, day)
+                part = segment.slice(lo, hi)
+                if len(part):
+                    parts.append(part)
+                    names.append(np.full(len(part), d, dtype=object))
+            if not parts:
+                continue
+            data, labels = np.concatenate(parts), np.concatenate(names)
+            order = np.lexsort((data['seq'], data['ts']))
+            yield labels[order].tolist(), data[order]
+
+    def newest(self, device_id, limit, upper, lower, upper_seq):
+        """
+        分页读取：lower < ts <= upper 且 ts 等于 upper 时 seq > upper_seq，
+        按 (ts DESC, seq) 排序取前 limit 条，返回记录数组（与 queries._page_query 语义相同）
+        """
+        picked = []
+        found = 0
+        with self._lock:
+            days = self._days(device_id)
+        for day in reversed(days):
+            day_start = to_epoch(datetime.fromisoformat(day))
+            if day_start + 86400 <= lower:
+                break
+            if day_start > upper:
+                continue
+            with self._lock:
+                segment = self._segment(device_id, day)
+            data = segment.slice(lower + 1, upper + 1)
+            # slice 按时间升序：时间等于 upper 的记录在末尾，按 seq 过滤；
+            # 其余只需要最新的 limit 条，以及与其中最早一条同一时间的全部记录
+            ts = data['ts']
+            k = np.searchsorted(ts, upper, side='left')
+            ties = data[k:]
+            start = np.searchsorted(ts[:k], ts[k - limit], side='left') if k > limit else 0
+            data = np.concatenate([data[start:k], ties[ties['seq'] > upper_seq]])
+            if not len(data):
+                continue
+            picked.append(data[np.lexsort((data['seq'], -data['ts']))][:limit])
+            found += len(picked[-1])
+            if found >= limit:
+                break
+        if not picked:
+            return np.empty(0, RECORD)
+        return np.concatenate(picked)[:limit]
+
+    def latest(self, device_id):
+        """设备最新的一条记录（时间最大，长度为 1 的记录数组），没有数据时返回 None"""
+        with self._lock:
+            days = self._days(device_id)
+            for day in reversed(days):
+                segment = self._segment(device_id, day)
+                if not segment.count:
+                    continue
+                data = segment.map()
+                if segment.sorted:
+                    return data[-1:]
+                return data[np.lexsort((data['seq'], data['ts']))[-1:]]
+        return None
+
+    # ---------- 清理 ----------
+
+    def oldest_day(self):
+        """全部设备中最早的段日期（datetime 零点），没有数据时返回 None"""
+        with self._lock:
+            days = [d[0] for d in (self._days(device_id) for device_id in self.devices()) if d]
+        return datetime.fromisoformat(min(days)) if days else None
+
+    def _remove(self, device_id, day):
+        # 调用方持有写锁
+        segment = self._segments.pop((device_id, day), None) or _Segment(
+            os.path.join(self.root, device_id, f'{day}.seg'))
+        segment.refresh()
+        for suffix in ('', '.idx', '.unsorted'):
+            if os.path.exists(segment.path + suffix):
+                os.remove(segment.path + suffix)
+        return segment.count
+
+    def drop_day(self, day):
+        """删除全部设备在 day 这一天的段文件（已归档后调用），返回删除的记录数"""
+        name = day.strftime('%Y-%m-%d')
+        dropped = 0
+        with self._writing():
+            for device_id in self.devices():
+                if name in self._days(device_id):
+                    dropped += self._remove(device_id, name)
+        return dropped
+
+    def drop_before(self, cutoff):
+        """删除整天都早于 cutoff 的段文件，返回删除的记录数"""
+        limit = (cutoff - timedelta(days=1)).strftime('%Y-%m-%d')
+        dropped = 0
+        with self._writing():
+            for device_id in self.devices():
+                for day in self._days(device_id):
+                    if day > limit:
+                        break
+                    dropped += self._remove(device_id, day)
+        return dropped
@@ -0,0 +1,182 @@
+"""
+进程内设备状态缓存
+仪表盘轮询的设备状态直接从内存读取，不再每次查询数据库：
+- MQTT on_message 收到状态消息时立即合并到缓存
+- 本进程内的状态写入（upsert_* / write_batch）提交后同步缓存
+- 未命中时由 database 回源查询并回填；启动时预热全部状态表
+每条记录就是 get_*_state() 返回的字典，写入和读取都复制一份，调用方修改返回值不影响缓存。
+"""
+
+import threading
+
+# 设备类型 -> 主键字段、可更新字段、为 None 时也覆盖的字段（与 upsert 语句一致）、布尔字段
+STATE_KINDS = {
+    'lock': {
+        'key': 'lock_id',
+        'fields': ('locked', 'method', 'actor', 'battery'),
+        'overwrite': ('locked', 'method', 'actor'),
+        'bools': ('locked',),
+    },
+    'ac': {
+        'key': 'ac_id',
+        'fields': ('power', 'mode', 'target_temp', 'current_temp', 'current_humidity', 'fan_speed'),
+        'overwrite': (),
+        'bools': ('power',),
+    },
+    'lighting': {
+        'key': 'light_id',
+        'fields': ('device_id', 'power', 'brightness', 'auto_mode', 'room_brightness', 'color_temp'),
+        'overwrite': (),
+        'bools': ('power', 'auto_mode'),
+    },
+    'smoke_alarm': {
+        'key': 'alarm_id',
+        'fields': ('location', 'smoke_level', 'alarm_active', 'battery', 'test_mode', 'sensitivity'),
+        'overwrite': (),
+        'bools': ('alarm_active', 'test_mode'),
+    },
+    # 每个温湿度设备的最新一条数据（只整行回填，不合并）
+    'sensor': {
+        'key': 'device_id',
+        'fields': (),
+        'overwrite': (),
+        'bools': (),
+    },
+}
+
+
+class DeviceStateCache:
+    """按 (设备类型, 设备ID) 保存最新状态的线程安全字典"""
+
+    def __init__(self, timestamp, enabled=True):
+        # timestamp(): 返回与数据库 updated_at 相同格式的当前时间
+        self._timestamp = timestamp
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._records = {kind: {} for kind in STATE_KINDS}
+        self._complete = set()
+        # 修改计数：回源查询前取一次，回填时计数未变才写入，避免旧数据覆盖新数据
+        self._versions = {}
+        self._stats = {'hits': 0, 'misses': 0, 'merges': 0, 'fills': 0}
+
+    # ---------- 读取 ----------
+
+    def get(self, kind, device_id):
+        """返回记录副本；未命中（或缓存关闭）返回 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            record = self._records[kind].get(device_id)
+            self._stats['hits' if record is not None else 'misses'] += 1
+            return dict(record) if record is not None else None
+
+    def all(self, kind):
+        """返回该类型全部记录的副本；尚未完整加载时返回 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if kind not in self._complete:
+                self._stats['misses'] += 1
+                return None
+            self._stats['hits'] += 1
+            return [dict(r) for r in self._records[kind].values()]
+
+    def contains(self, kind, device_id):
+        """是否已缓存该设备（不计入命中率）"""
+        with self._lock:
+            return device_id in self._records[kind]
+
+    def version(self, kind, device_id=None):
+        """回源查询前取得的版本号，传给 fill() / load()"""
+        with self._lock:
+            return self._versions.get((kind, device_id) if device_id is not None else kind, 0)
+
+    # ---------- 写入 ----------
+
+    def fill(self, kind, device_id, record, token):
+        """用回源查询结果回填一条记录；查询期间该记录被修改过则放弃"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if self._versions.get((kind, device_id), 0) != token:
+                return False
+            self._store(kind, device_id, dict(record))
+            self._stats['fills'] += 1
+            return True
+
+    def load(self, kind, records, token):
+        """用全表查询结果替换该类型的全部记录；查询期间该类型有修改则放弃"""
+        if not self.enabled:
+            return False
+        key = STATE_KINDS[kind]['key']
+        with self._lock:
+            if self._versions.get(kind, 0) != token:
+                return False
+            self._records[kind] = {r[key]: dict(r) for r in records}
+            self._complete.add(kind)
+            self._versions[kind] = token + 1
+            return True
+
+    def merge(self, kind, device_id, fields):
+        """
+        把一次状态更新合并到已缓存的记录，语义与 upsert 语句相同：
+        None 表示不修改（overwrite 字段除外）。记录不在缓存中时返回 False，由调用方回源
+        """
+        if not self.enabled:
+            return False
+        with self._lock:
+            current = self._records[kind].get(device_id)
+            if current is None:
+                return False
+            self._merge(kind, device_id, current, fields)
+            return True
+
+    def merge_where(self, kind, field, value, fields):
+        """把更新合并到所有 record[field] == value 的已缓存记录，返回合并条数"""
+        if not self.enabled:
+            return 0
+        with self._lock:
+            matched = [(device_id, record) for device_id, record in self._records[kind].items()
+                       if record.get(field) == value]
+            for device_id, record in matched:
+                self._merge(kind, device_id, record, fields)
+            return len(matched)
+
+    def invalidate(self, kind=None):
+        """清空某一类型（缺省全部）的缓存，之后的读取回源"""
+        with self._lock:
+            for k in ([kind] if kind else list(STATE_KINDS)):
+                self._records[k] = {}
+                self._complete.discard(k)
+                self._versions[k] = self._versions.get(k, 0) + 1
+
+    def _merge(self, kind, device_id, current, fields):
+        spec = STATE_KINDS[kind]
+        record = dict(current)
+        for name in spec['fields']:
+            if name not in fields:
+                continue
+            value = fields[name]
+            if value is None and name not in spec['overwrite']:
+                continue
+            record[name] = bool(value) if name in spec['bools'] else value
+        record['updated_at'] = self._timestamp()
+        self._store(kind, device_id, record)
+        self._stats['merges'] += 1
+
+    def _store(self, kind, device_id, record):
+        self._records[kind][device_id] = record
+        self._versions[(kind, device_id)] = self._versions.get((kind, device_id), 0) + 1
+        self._versions[kind] = self._versions.get(kind, 0) + 1
+
+    # ---------- 指标 ----------
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['devices'] = {kind: len(records) for kind, records in self._records.items()}
+            s['complete'] = sorted(self._complete)
+        lookups = s['hits'] + s['misses']
+        s['hit_ratio'] = round(s['hits'] / lookups, 4) if lookups else None
+        s['enabled'] = self.enabled
+        return s
@@ -0,0 +1,199 @@
+"""
+MQTT 主题路由
+处理器按主题模式注册（支持 + 单层通配和末尾的 # 多层通配），模式预编译为按层级的前缀树：
+匹配一个主题只需沿树走一遍各层，与注册的处理器数量无关；已匹配过的主题再缓存在字典里，
+常见主题（设备数 × 消息类型）的分发就是一次字典查找。
+
+    router = TopicRouter()
+
+    @router.route("home/lock/+/state")
+    def lock_state(lock_id, data):
+        ...
+
+    router.dispatch(msg.topic, msg.payload)   # + 匹配到的层按顺序作为位置参数
+    client.subscribe([(t, 0) for t in shared_topics(router.patterns(), 'ingest')])
+
+载荷只解码一次（缺省按 JSON，解析失败为 {}），每条路由可以指定自己的 decode 函数
+（如 payloads.decoder 编译的类型化解码）；decode 抛出 ValueError 的消息计入 rejected，不调用处理器。
+"""
+
+import json
+import threading
+
+# 已匹配主题缓存的上限，超出后清空重建（主题数量由设备数决定，正常不会超出）
+MAX_CACHED_TOPICS = 4096
+
+
+def decode_json(payload):
+    """缺省解码：JSON 对象，无法解析时返回 {}"""
+    try:
+        data = json.loads(payload)
+    except (ValueError, UnicodeDecodeError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def shared_topics(patterns, group=None):
+    """
+    订阅用的主题列表：指定共享订阅组时加上 $share/<组>/ 前缀（EMQX 与 Mosquitto 2.x 均支持），
+    Broker 把每条消息只投递给组内的一个订阅者；收到的消息主题不带前缀，路由不受影响
+    """
+    if not group:
+        return list(patterns)
+    if any(c in group for c in '/+#'):
+        raise ValueError(f"共享订阅组名无效: {group}")
+    return [f"$share/{group}/{pattern}" for pattern in patterns]
+
+
+class Route:
+    """一条已注册的路由"""
+
+    __slots__ = ('pattern', 'handler', 'decode')
+
+    def __init__(self, pattern, handler, decode):
+        self.pattern = pattern
+        self.handler = handler
+        self.decode = decode
+
+
+class _Node:
+    __slots__ = ('children', 'wildcard', 'route', 'tail')
+
+    def __init__(self):
+        self.children = {}
+        # + 通配的子节点
+        self.wildcard = None
+        # 主题在此结束时匹配的路由
+        self.route = None
+        # 以 # 结尾的路由（匹配此后任意层）
+        self.tail = None
+
+
+class TopicRouter:
+    """主题模式 -> 处理器的路由表，线程安全"""
+
+    def __init__(self):
+        self._root = _Node()
+        self._routes = []
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._stats = {'unrouted': 0, 'rejected': 0, 'failed': 0}
+        self._counts = {}
+
+    # ---------- 注册 ----------
+
+    def add(self, pattern, handler, decode=decode_json):
+        """注册一条路由；同一模式重复注册时替换原处理器"""
+        levels = pattern.split('/')
+        if '#' in levels[:-1] or any(('+' in l or '#' in l) and len(l) > 1 for l in levels):
+            raise ValueError(f"主题模式无效: {pattern}")
+        route = Route(pattern, handler, decode)
+        with self._lock:
+            node = self._root
+            for level in levels:
+                if level == '#':
+                    break
+                if level == '+':
+                    if node.wildcard is None:
+                        node.wildcard = _Node()
+                    node = node.wildcard
+                else:
+                    node = node.children.setdefault(level, _Node())
+            if levels[-1] == '#':
+                node.tail = route
+            else:
+                node.route = route
+            self._routes = [r for r in self._routes if r.pattern != pattern] + [route]
+            self._counts.setdefault(pattern, 0)
+            self._cache.clear()
+        return route
+
+    def route(self, pattern, decode=decode_json):
+        """装饰器形式的 add()"""
+        def register(handler):
+            self.add(pattern, handler, decode)
+            return handler
+        return register
+
+    def patterns(self):
+        """全部已注册的主题模式（用于订阅）"""
+        return [r.pattern for r in self._routes]
+
+    # ---------- 匹配 ----------
+
+    def match(self, topic):
+        """
+        返回 (Route, + 匹配到的各层)；没有匹配的路由时返回 None
+        优先级：完整匹配的路由优先于 # 路由，同类中具体层优先于 +
+        """
+        hit = self._cache.get(topic)
+        if hit is not None:
+            return hit
+        levels = topic.split('/')
+        # 先只找完整匹配的路由，没有时再考虑 # 路由
+        hit = self._walk(self._root, levels, 0, False) or self._walk(self._root, levels, 0, True)
+        if hit is not None:
+            with self._lock:
+                if len(self._cache) >= MAX_CACHED_TOPICS:
+                    self._cache.clear()
+                self._cache[topic] = hit
+        return hit
+
+    def _walk(self, node, levels, i, tails):
+        if i == len(levels):
+            if node.route is not None:
+                return node.route, ()
+            if tails and node.tail is not None:
+                return node.tail, ()
+            return None
+        child = node.children.get(levels[i])
+        if child is not None:
+            hit = self._walk(child, levels, i + 1, tails)
+            if hit is not None:
+                return hit
+        if node.wildcard is not None:
+            hit = self._walk(node.wildcard, levels, i + 1, tails)
+            if hit is not None:
+                return hit[0], (levels[i],) + hit[1]
+        if tails and node.tail is not None:
+            return node.tail, ()
+        return None
+
+    # ---------- 分发 ----------
+
+    def dispatch(self, topic, payload):
+        """
+        解码载荷并调用匹配的处理器，返回是否有路由处理了该主题
+        解码失败（ValueError，如 payloads.PayloadError）计入 rejected、处理器抛出的异常计入 failed，
+        两者都向上传递由调用方记录
+        """
+        hit = self.match(topic)
+        if hit is None:
+            with self._lock:
+                self._stats['unrouted'] += 1
+            return False
+        route, params = hit
+        with self._lock:
+            self._counts[route.pattern] += 1
+        try:
+            data = route.decode(payload)
+        except ValueError:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise
+        try:
+            route.handler(*params, data)
+        except Exception:
+            with self._lock:
+                self._stats['failed'] += 1
+            raise
+        return True
+
+    # ---------- 指标 ----------
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            s['routes'] = dict(self._counts)
+            s['cached_topics'] = len(self._cache)
+        return s
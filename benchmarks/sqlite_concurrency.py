@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+SQLite 读写并发基准测试
+多个进程同时读写同一个数据库文件，对比两种配置的吞吐、延迟与 "database is locked" 错误数：
+- default：旧版应用的做法，SQLite 默认参数（回滚日志 + synchronous=FULL）
+- tuned：config.SQLITE_PROFILE 调优参数（WAL 等），连接由连接池长期持有
+
+负载（--workload）：
+- history：写进程追加温湿度数据，读进程按设备读取最近 50 条
+- state：写进程更新空调状态并记录事件，读进程读取全部空调状态（GET /ac）。
+  default 按旧版 upsert_ac_state 的方式每次调用新建连接，在一个事务中先 SELECT 再 UPDATE；
+  回滚日志下持有读锁的事务升级为写锁时与另一个写事务互相等待，SQLite 不等 busy_timeout
+  直接返回 "database is locked"。tuned 与当前应用一致，复用连接并用一条 UPSERT 语句写入。
+
+延迟：--rate 为 0 时每个进程尽快循环执行（闭环，测最大吞吐）；此时进程数多于 CPU 核数，
+p99 主要是等待 CPU 调度的时间，吞吐越高的配置排队越长，不能直接比较两种配置的延迟。
+比较延迟请用 --rate 固定每个进程的请求速率，两种配置在相同负载下测量，
+延迟从计划开始时间算起（包含排队等待，避免协调遗漏）。
+
+用法：
+    python benchmarks/sqlite_concurrency.py --seconds 5 --readers 4 --writers 2
+    python benchmarks/sqlite_concurrency.py --workload state --seconds 5
+    python benchmarks/sqlite_concurrency.py --rate 200 --seconds 5
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+# 添加 backend 路径
+current_dir = os.path.dirname(__file__)
+backend_dir = os.path.join(current_dir, '..', 'backend')
+sys.path.insert(0, backend_dir)
+
+from config import SQLITE_PROFILE
+from database import configure_sqlite_connection
+from queries import QUERIES, compile_queries
+import schema
+
+# 旧版行为：每次 sqlite3.connect() 的默认值
+DEFAULT_PROFILE = {"journal_mode": "DELETE", "synchronous": "FULL"}
+
+SQL = compile_queries(QUERIES, 'sqlite')
+
+READ_SQL = ("SELECT id, device_id, temperature, humidity, timestamp FROM temperature_humidity_data "
+            "WHERE device_id = ? ORDER BY timestamp DESC LIMIT 50")
+WRITE_SQL = ("INSERT INTO temperature_humidity_data (device_id, temperature, humidity, timestamp) "
+             "VALUES (?, ?, ?, CURRENT_TIMESTAMP)")
+DEVICES = ['living_room', 'bedroom1', 'bedroom2', 'kitchen', 'study']
+AC_IDS = [f'ac_{d}' for d in DEVICES]
+
+
+def _prepare(path, profile, rows):
+    conn = sqlite3.connect(path)
+    configure_sqlite_connection(conn, profile)
+    schema.migrate(conn, 'sqlite')
+    conn.executemany(
+        "INSERT INTO temperature_humidity_data (device_id, temperature, humidity) VALUES (?, ?, ?)",
+        [(DEVICES[i % len(DEVICES)], 20 + i % 10, 40 + i % 20) for i in range(rows)]
+    )
+    conn.executemany("INSERT INTO ac_state (ac_id, device_id) VALUES (?, ?)", zip(AC_IDS, DEVICES))
+    conn.commit()
+    conn.close()
+
+
+# ---------- 负载 ----------
+
+def _history_read(conn, i):
+    conn.execute(READ_SQL, (DEVICES[i % len(DEVICES)],)).fetchall()
+
+
+def _history_write(conn, i):
+    conn.execute(WRITE_SQL, (DEVICES[i % len(DEVICES)], 25.0, 50.0))
+    conn.commit()
+
+
+def _state_read(conn, i):
+    conn.execute(SQL['ac_state.all']).fetchall()
+
+
+def _state_write_legacy(conn, i):
+    """旧版 upsert_ac_state：同一事务内先查是否存在再 UPDATE，之后写一条事件"""
+    ac_id = AC_IDS[i % len(AC_IDS)]
+    conn.execute("BEGIN")
+    try:
+        exists = conn.execute("SELECT ac_id FROM ac_state WHERE ac_id = ?", (ac_id,)).fetchone()
+        if exists:
+            conn.execute("UPDATE ac_state SET target_temp = ?, updated_at = CURRENT_TIMESTAMP WHERE ac_id = ?",
+                         (20.0 + i % 8, ac_id))
+        conn.execute(SQL['ac_event.insert'], (ac_id, 'set_temp', None, str(20.0 + i % 8), None))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _state_write(conn, i):
+    """当前应用：一条 UPSERT（隐式事务直接以写事务开始）"""
+    ac_id = AC_IDS[i % len(AC_IDS)]
+    device = DEVICES[i % len(DEVICES)]
+    conn.execute(SQL['ac_state.upsert'], (ac_id, device, 0, 'cool', 26.0, None, None, 'auto',
+                                          None, None, 20.0 + i % 8, None, None, None))
+    conn.execute(SQL['ac_event.insert'], (ac_id, 'set_temp', None, str(20.0 + i % 8), None))
+    conn.commit()
+
+
+# 负载 -> 配置 -> 进程类型 -> (操作, 每次操作是否新建连接)
+WORKLOADS = {
+    'history': {
+        'default': {'writer': (_history_write, False), 'reader': (_history_read, False)},
+        'tuned': {'writer': (_history_write, False), 'reader': (_history_read, False)},
+    },
+    'state': {
+        'default': {'writer': (_state_write_legacy, True), 'reader': (_state_read, True)},
+        'tuned': {'writer': (_state_write, False), 'reader': (_state_read, False)},
+    },
+}
+
+
+def _connect(path, profile, manual):
+    # manual：自行发出 BEGIN / COMMIT（旧版读改写事务），其余使用 sqlite3 的隐式事务
+    conn = sqlite3.connect(path, timeout=5.0, isolation_level=None if manual else '')
+    configure_sqlite_connection(conn, profile)
+    return conn
+
+
+def _worker(workload, name, kind, path, profile, seconds, rate, index, results):
+    op, per_call = WORKLOADS[workload][name][kind]
+    manual = op is _state_write_legacy
+    conn = None if per_call else _connect(path, profile, manual)
+    ops = errors = 0
+    latencies = []
+    interval = 1.0 / rate if rate else 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    # 各进程错开起始时间，避免定速模式下同时发出请求
+    scheduled = started + (interval * index / 8 if interval else 0)
+    i = index
+    while True:
+        now = time.perf_counter()
+        if interval:
+            if scheduled > now:
+                time.sleep(scheduled - now)
+            begin = scheduled
+            scheduled += interval
+        else:
+            begin = now
+        if begin >= deadline:
+            break
+        try:
+            if per_call:
+                c = _connect(path, profile, manual)
+                try:
+                    op(c, i)
+                finally:
+                    c.close()
+            else:
+                op(conn, i)
+            ops += 1
+            latencies.append(time.perf_counter() - begin)
+        except sqlite3.OperationalError:
+            errors += 1
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+        i += 1
+    if conn is not None:
+        conn.close()
+    results.put((kind, ops, errors, latencies))
+
+
+def run_profile(name, profile, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.sqlite3')
+        _prepare(path, profile, args.rows)
+        results = mp.Queue()
+        procs = []
+        for kind, count in (('writer', args.writers), ('reader', args.readers)):
+            for i in range(count):
+                procs.append(mp.Process(target=_worker, args=(args.workload, name, kind, path, profile,
+                                                               args.seconds, args.rate, i, results)))
+        for p in procs:
+            p.start()
+        collected = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+    summary = {}
+    for kind in ('writer', 'reader'):
+        parts = [r for r in collected if r[0] == kind]
+        lat = sorted(l for r in parts for l in r[3])
+        summary[kind] = {
+            'ops_per_sec': sum(r[1] for r in parts) / args.seconds,
+            'errors': sum(r[2] for r in parts),
+            'p50_ms': lat[len(lat) // 2] * 1000 if lat else None,
+            'p99_ms': lat[int(len(lat) * 0.99) - 1] * 1000 if lat else None,
+        }
+    return name, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite 读写并发基准测试")
+    parser.add_argument('--workload', choices=sorted(WORKLOADS), default='history')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--rate', type=float, default=0,
+                        help="每个进程每秒请求数，0 表示尽快循环（闭环，测最大吞吐）")
+    parser.add_argument('--rows', type=int, default=20000, help="预填充的温湿度数据行数")
+    args = parser.parse_args()
+
+    print(f"workload={args.workload} readers={args.readers} writers={args.writers} "
+          f"seconds={args.seconds} rate={args.rate or 'max'} rows={args.rows} cpus={os.cpu_count()}")
+    print(f"{'profile':<10} {'kind':<7} {'ops/s':>10} {'p50(ms)':>10} {'p99(ms)':>10} {'locked':>8}")
+    for name, profile in (('default', DEFAULT_PROFILE), ('tuned', SQLITE_PROFILE)):
+        _, summary = run_profile(name, profile, args)
+        for kind, s in summary.items():
+            p50 = f"{s['p50_ms']:.2f}" if s['p50_ms'] is not None else '-'
+            p99 = f"{s['p99_ms']:.2f}" if s['p99_ms'] is not None else '-'
+            print(f"{name:<10} {kind:<7} {s['ops_per_sec']:>10.0f} {p50:>10} {p99:>10} {s['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
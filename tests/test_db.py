@@ -0,0 +1,1078 @@
+"""
+数据库层测试：连接池、结构迁移
+"""
+
+import os
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta
+
+# 添加 backend 路径
+current_dir = os.path.dirname(__file__)
+backend_dir = os.path.join(current_dir, '..', 'backend')
+sys.path.insert(0, backend_dir)
+
+import pytest
+
+from db_pool import SQLitePool, OpenGaussPool, PoolTimeoutError
+import schema
+
+
+class FakeConnection:
+    """模拟 py_opengauss 连接"""
+
+    def __init__(self):
+        self.closed = False
+
+    def prepare(self, sql):
+        conn = self
+
+        class _Stmt:
+            def first(self):
+                if conn.closed:
+                    raise RuntimeError("connection closed")
+                return 1
+        return _Stmt()
+
+    def close(self):
+        self.closed = True
+
+
+def test_sqlite_pool_reuses_thread_connection(tmp_path):
+    pool = SQLitePool(str(tmp_path / 'pool.sqlite3'))
+    conn = pool.acquire()
+    raw = conn.raw
+    conn.close()
+    with pool.connection() as again:
+        assert again.raw is raw
+        # 嵌套借用返回同一条连接
+        with pool.connection() as nested:
+            assert nested.raw is raw
+    pool.close()
+
+
+def test_sqlite_pool_rolls_back_uncommitted_work(tmp_path):
+    pool = SQLitePool(str(tmp_path / 'pool.sqlite3'))
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (1)")
+    with pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    pool.close()
+
+
+def test_sqlite_pool_transaction_commits_once_or_rolls_back(tmp_path):
+    pool = SQLitePool(str(tmp_path / 'pool.sqlite3'))
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+
+    done = []
+    with pool.transaction():
+        for x in (1, 2):
+            with pool.connection() as conn:
+                conn.execute("INSERT INTO t VALUES (?)", (x,))
+                conn.commit()  # 工作单元中不生效
+        pool.after_commit(lambda: done.append(True))
+        assert not done
+    assert done == [True]
+
+    with pytest.raises(RuntimeError):
+        with pool.transaction():
+            with pool.connection() as conn:
+                conn.execute("INSERT INTO t VALUES (3)")
+                conn.commit()
+            pool.after_commit(lambda: done.append(False))
+            raise RuntimeError("boom")
+    assert done == [True]
+
+    with pool.connection() as conn:
+        assert [r[0] for r in conn.execute("SELECT x FROM t ORDER BY x")] == [1, 2]
+    pool.close()
+
+
+def test_sqlite_pool_hands_dead_thread_connection_to_new_thread(tmp_path):
+    pool = SQLitePool(str(tmp_path / 'pool.sqlite3'))
+    seen = []
+
+    def work():
+        with pool.connection() as conn:
+            seen.append(conn.raw)
+
+    for _ in range(3):
+        t = threading.Thread(target=work)
+        t.start()
+        t.join()
+    assert seen[0] is seen[1] is seen[2]
+    pool.close()
+
+
+def test_opengauss_pool_is_bounded():
+    created = []
+
+    def connect():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    pool = OpenGaussPool(connect, max_size=1, timeout=0.05)
+    holder = pool.acquire()
+    errors = []
+
+    def other_thread():
+        try:
+            pool.acquire()
+        except PoolTimeoutError as e:
+            errors.append(e)
+
+    t = threading.Thread(target=other_thread)
+    t.start()
+    t.join()
+    assert len(errors) == 1
+    holder.close()
+    with pool.connection() as conn:
+        assert conn.raw is created[0]
+    assert len(created) == 1
+    pool.close()
+
+
+def test_opengauss_pool_replaces_unhealthy_and_idle_connections():
+    created = []
+
+    def connect():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    pool = OpenGaussPool(connect, max_size=2, health_check_interval=0, max_idle=60)
+    with pool.connection():
+        pass
+    created[0].closed = True
+    with pool.connection() as conn:
+        assert conn.raw is created[1]
+
+    pool.max_idle = 0
+    with pool.connection() as conn:
+        assert conn.raw is created[2]
+    assert pool.stats()['size'] == 1
+    pool.close()
+
+
+def test_schema_migrations_run_once(tmp_path):
+    pool = SQLitePool(str(tmp_path / 'schema.sqlite3'))
+    with pool.connection() as conn:
+        assert schema.migrate(conn, 'sqlite') == [v for v, _, _ in schema.MIGRATIONS]
+        assert schema.current_version(conn, 'sqlite') == schema.latest_version()
+        # 再次执行不应重复应用
+        assert schema.migrate(conn, 'sqlite') == []
+        rooms = conn.execute("SELECT COUNT(*) FROM rooms").fetchone()[0]
+        assert rooms == len(schema.DEFAULT_ROOMS)
+    pool.close()
+
+
+def test_sqlite_profile_applied_per_connection(tmp_path):
+    from database import configure_sqlite_connection
+    profile = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'mmap_size': 1 << 20,
+               'cache_size': -2000, 'temp_store': 'MEMORY', 'busy_timeout': 1234}
+    pool = SQLitePool(str(tmp_path / 'profile.sqlite3'),
+                      on_connect=lambda c: configure_sqlite_connection(c, profile))
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 1234
+    pool.close()
+
+    with pytest.raises(ValueError):
+        configure_sqlite_connection(sqlite3.connect(':memory:'), {'journal_mode': 'WAL; DROP TABLE x'})
+
+
+def test_state_upserts_insert_defaults_and_keep_unspecified_columns(tmp_path):
+    import database
+    pool = SQLitePool(str(tmp_path / 'upsert.sqlite3'))
+    with pool.connection() as conn:
+        schema.migrate(conn, 'sqlite')
+        database._upsert_ac_state(conn, 'ac_test', power=True)
+        database._upsert_ac_state(conn, 'ac_test', target_temp=22.5)
+        row = conn.execute("SELECT power, mode, target_temp, fan_speed FROM ac_state WHERE ac_id = 'ac_test'").fetchone()
+        assert row == (1, 'cool', 22.5, 'auto')
+
+        database._upsert_lighting_state(conn, 'light_test', brightness=80)
+        database._upsert_lighting_state(conn, 'light_test', power=True)
+        row = conn.execute("SELECT power, brightness, color_temp FROM lighting_state WHERE light_id = 'light_test'").fetchone()
+        assert row == (1, 80, 4000)
+
+        database._upsert_smoke_alarm_state(conn, 'smoke_test', smoke_level=1.5)
+        database._upsert_smoke_alarm_state(conn, 'smoke_test', alarm_active=True)
+        row = conn.execute("SELECT smoke_level, alarm_active, battery FROM smoke_alarm_state WHERE alarm_id = 'smoke_test'").fetchone()
+        assert row == (1.5, 1, 100)
+
+        database._upsert_lock_state(conn, 'door', True, battery=80)
+        database._upsert_lock_state(conn, 'door', False, method='app', battery=79)
+        row = conn.execute("SELECT locked, method, battery FROM lock_state WHERE lock_id = 'door'").fetchone()
+        assert row == (0, 'app', 79)
+        assert conn.execute("SELECT COUNT(*) FROM lock_state WHERE lock_id = 'door'").fetchone()[0] == 1
+        conn.commit()
+    pool.close()
+
+
+def test_query_catalog_compiles_for_both_dialects():
+    import queries
+    compiled = queries.compile_queries(queries.QUERIES, 'opengauss')
+    assert set(compiled) == set(queries.QUERIES)
+    assert compiled['lock_state.get'] == "SELECT lock_id, locked, method, actor, battery, updated_at FROM lock_state WHERE lock_id = $1"
+    assert '$2' in compiled['sensor.page_by_device'] and '?' not in compiled['sensor.page_by_device']
+    sqlite_sql = queries.compile_queries(queries.QUERIES, 'sqlite')
+    for name, text in compiled.items():
+        assert '?' not in text, name
+        # upsert 两种写法参数个数一致，调用方传同一组参数
+        if name.endswith('.upsert'):
+            assert sqlite_sql[name].count('?') == max(int(n) for n in re.findall(r'\$(\d+)', text))
+
+
+def test_opengauss_inserts_never_bind_null_timestamps():
+    import queries
+    compiled = queries.compile_queries(queries.QUERIES, 'opengauss')
+    checked = 0
+    for name, text in compiled.items():
+        m = re.match(r'\s*INSERT INTO \w+ \(([^)]*)\) VALUES \((.*)\)\s*$', text, re.S)
+        if not name.endswith('.insert') or not m:
+            continue
+        columns = [c.strip() for c in m.group(1).split(',')]
+        if 'timestamp' not in columns:
+            continue
+        # 按顶层逗号拆分 VALUES
+        values, depth, current = [], 0, ''
+        for ch in m.group(2):
+            depth += ch == '('
+            depth -= ch == ')'
+            if ch == ',' and depth == 0:
+                values.append(current.strip())
+                current = ''
+            else:
+                current += ch
+        values.append(current.strip())
+        value = values[columns.index('timestamp')]
+        # 分区表的 timestamp 为 NOT NULL：不能直接绑定可能为 None 的参数
+        assert not re.fullmatch(r'\$\d+', value), (name, value)
+        checked += 1
+    assert checked >= 4
+    assert 'COALESCE($6::timestamp, NOW())' in compiled['lock_event.insert']
+
+
+def test_archive_deletes_only_touch_the_archived_day():
+    import queries
+    for dialect in ('sqlite', 'opengauss'):
+        compiled = queries.compile_queries(queries.QUERIES, dialect)
+        for dataset in queries.EXPORT_DATASETS:
+            text = ' '.join(compiled[f'archive.delete.{dataset}'].split())
+            # ctid 在 openGauss 分区表中不唯一，不能用来定位要删除的行
+            assert 'ctid' not in text, (dialect, dataset)
+            if dialect == 'opengauss':
+                outer = text.split(' IN (')[0]
+                assert 'timestamp >= $1 AND timestamp < $2 AND id <= $3 AND id' in outer, text
+
+    conn = sqlite3.connect(':memory:')
+    schema.migrate(conn, 'sqlite')
+    conn.executemany(
+        "INSERT INTO lock_events (lock_id, event_type, timestamp) VALUES (?, ?, ?)",
+        [('L1', 'event', f'2024-0{m}-01 0{h}:00:00') for m in (1, 2) for h in range(3)]
+    )
+    text = queries.compile_queries(queries.QUERIES, 'sqlite')['archive.delete.lock_events']
+    assert conn.execute(text, ('2024-01-01', '2024-01-02', 10 ** 9, 2)).rowcount == 2
+    assert conn.execute(text, ('2024-01-01', '2024-01-02', 10 ** 9, 2)).rowcount == 1
+    assert [r[0] for r in conn.execute("SELECT timestamp FROM lock_events ORDER BY id")] == [
+        '2024-02-01 00:00:00', '2024-02-01 01:00:00', '2024-02-01 02:00:00']
+    conn.close()
+
+
+def test_opengauss_pool_caches_prepared_statements_per_connection():
+    prepares = []
+
+    class CountingConnection(FakeConnection):
+        def prepare(self, sql):
+            prepares.append(sql)
+            return super().prepare(sql)
+
+    pool = OpenGaussPool(CountingConnection, max_size=1, health_check_interval=60)
+    for _ in range(3):
+        with pool.connection() as conn:
+            assert conn.prepare_cached("SELECT 1").first() == 1
+    assert prepares == ["SELECT 1"]
+    assert pool.stats()['prepared_statements'] == 1
+
+    # 连接被淘汰后缓存一并丢弃，新连接重新 prepare
+    pool.max_idle = -1
+    with pool.connection() as conn:
+        conn.prepare_cached("SELECT 1")
+    assert len(prepares) == 2
+    assert pool.stats()['prepared_statements'] == 1
+    pool.close()
+    assert pool.stats()['prepared_statements'] == 0
+
+
+HOT_QUERIES = [
+    'sensor.page', 'sensor.page_by_device', 'sensor.latest', 'sensor.range', 'sensor.devices',
+    'rollup.range.1m', 'rollup.range.1h', 'rollup.range.1d',
+    'lock_state.get', 'lock_event.page',
+    'ac_state.get', 'ac_event.page',
+    'lighting_state.get', 'lighting_event.page',
+    'smoke_alarm_state.get', 'smoke_alarm_event.page',
+]
+
+
+def test_hot_queries_use_indexes_on_sqlite():
+    import queries
+    conn = sqlite3.connect(':memory:')
+    schema.migrate(conn, 'sqlite')
+    compiled = queries.compile_queries(queries.QUERIES, 'sqlite')
+    for name in HOT_QUERIES:
+        text = compiled[name]
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + text, [None] * text.count('?'))]
+        for step in plan:
+            # 不允许无索引的全表扫描，也不允许额外排序
+            assert not (step.startswith('SCAN') and 'INDEX' not in step), (name, plan)
+            assert 'TEMP B-TREE' not in step, (name, plan)
+    conn.close()
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """把 database 模块的连接池切换到临时 SQLite 文件"""
+    import database
+    database.close_pool()
+    # 与 ingest 进程一致启用状态缓存
+    database.enable_state_cache()
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'app.sqlite3'))
+    yield database
+    database.close_pool()
+    database.enable_state_cache(False)
+
+
+def test_sensor_rollups_follow_ingest(sqlite_db):
+    db = sqlite_db
+    db.write_batch([
+        ('sensor', {'device_id': 'room1', 'temperature': 20.0, 'humidity': 40.0}),
+        ('sensor', {'device_id': 'room1', 'temperature': 24.0, 'humidity': 50.0}),
+        ('sensor', {'device_id': 'room2', 'temperature': 18.0, 'humidity': 60.0}),
+    ])
+    db.insert_sensor_data({'temperature': 22.0, 'humidity': 45.0}, 'room1')
+
+    with db.get_connection() as conn:
+        for table in ('temperature_humidity_1m', 'temperature_humidity_1h', 'temperature_humidity_1d'):
+            rows = conn.execute(
+                f"SELECT SUM(samples), MIN(temp_min), MAX(temp_max), SUM(temp_sum) FROM {table} WHERE device_id = 'room1'"
+            ).fetchone()
+            assert rows == (3, 20.0, 24.0, 66.0)
+
+    series = db.get_sensor_series('room1', max_points=10)
+    # 24 小时 / 10 点 -> 只有 1d 满足
+    assert series['resolution'] == '1d'
+    assert series['points'][0]['samples'] == 3
+    assert series['points'][0]['temperature'] == 22.0
+
+    raw = db.get_sensor_series('room1', max_points=100000)
+    assert raw['resolution'] == 'raw'
+    assert sorted(p['temperature'] for p in raw['points']) == [20.0, 22.0, 24.0]
+
+
+def test_pick_resolution_uses_point_budget():
+    import database
+    day = 86400
+    assert database.pick_resolution(3600, 1000) == 'raw'
+    assert database.pick_resolution(day, 2000) == '1m'
+    assert database.pick_resolution(7 * day, 500) == '1h'
+    assert database.pick_resolution(365 * day, 500) == '1d'
+    assert database.pick_resolution(3650 * day, 500) == '1d'
+
+
+def test_retention_purges_expired_rows_in_batches(sqlite_db):
+    db = sqlite_db
+    db.init_schema()
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO temperature_humidity_data (device_id, temperature, humidity, timestamp) VALUES (?, ?, ?, ?)",
+            [('room1', 20.0 + i, 50.0, f'2020-01-01 00:{i:02d}:00') for i in range(7)]
+            + [('room1', 30.0, 50.0, '2099-01-01 00:00:00')])
+        conn.executemany(
+            "INSERT INTO smoke_alarm_events (alarm_id, event_type, timestamp) VALUES (?, ?, ?)",
+            [('alarm1', 'alarm', '2020-01-01 00:00:00'), ('alarm1', 'alarm', '2020-01-02 00:00:00')])
+        # 已被确认记录引用的报警事件不能删除
+        conn.execute("INSERT INTO alarm_acknowledgments (alarm_id, event_id, acknowledged_by) "
+                     "SELECT alarm_id, MIN(id), 'admin' FROM smoke_alarm_events")
+        conn.commit()
+
+    results = db.purge_expired('temperature_humidity_data', db.retention_cutoff(30), batch_size=3, pause_ms=0)
+    assert results == {'rows': 7, 'partitions': []}
+    results = db.enforce_retention({'smoke_alarm_events': 30, 'lock_events': 0})
+    assert results == {'smoke_alarm_events': {'rows': 1, 'partitions': []}}
+
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT temperature FROM temperature_humidity_data").fetchall() == [(30.0,)]
+        assert conn.execute("SELECT timestamp FROM smoke_alarm_events").fetchall() == [('2020-01-01 00:00:00',)]
+
+
+def test_retention_deletes_use_time_indexes_on_sqlite():
+    import queries
+    conn = sqlite3.connect(':memory:')
+    schema.migrate(conn, 'sqlite')
+    compiled = queries.compile_queries(queries.QUERIES, 'sqlite')
+    for table in queries.RETENTION_TIME_COLUMNS:
+        text = compiled[f'retention.purge.{table}']
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + text, ['2020-01-01', 10])]
+        assert any(table in step and 'INDEX' in step for step in plan), (table, plan)
+    conn.close()
+
+
+def test_keyset_pages_cover_history_without_gaps(sqlite_db):
+    db = sqlite_db
+    db.init_schema()
+    with db.get_connection() as conn:
+        # 每个时间戳两条事件，检查同一时间戳跨页时不重复、不遗漏
+        conn.executemany(
+            "INSERT INTO lock_events (lock_id, event_type, timestamp) VALUES (?, ?, ?)",
+            [('door', f'e{i}', f'2024-01-01 00:00:{i // 2:02d}') for i in range(11)]
+            + [('other', 'x', '2024-01-01 00:00:03')])
+        conn.commit()
+
+    seen, cursor = [], None
+    while True:
+        page = db.get_lock_events_page('door', limit=3, cursor=cursor)
+        assert len(page['items']) <= 3
+        seen.extend(e['event_type'] for e in page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(f'e{i}' for i in range(11))
+    assert len(seen) == 11
+    assert db.get_lock_events('door', limit=2) == db.get_lock_events_page('door', limit=2)['items']
+
+    from datetime import datetime
+    page = db.get_lock_events_page('door', limit=50,
+                                   before=datetime(2024, 1, 1, 0, 0, 4), after=datetime(2024, 1, 1, 0, 0, 1))
+    assert [e['timestamp'][-2:] for e in page['items']] == ['03', '03', '02', '02']
+    assert page['next_cursor'] is None
+
+
+def test_invalid_cursor_is_rejected():
+    import pagination
+    cursor = pagination.encode_cursor('2024-01-01 00:00:00', 7)
+    assert pagination.decode_cursor(cursor) == ('2024-01-01 00:00:00', 7)
+    for bad in ('not-a-cursor', pagination.encode_cursor('2024-01-01', 'x')):
+        with pytest.raises(pagination.InvalidCursor):
+            pagination.decode_cursor(bad)
+
+
+def test_state_cache_serves_reads_and_follows_writes(sqlite_db):
+    db = sqlite_db
+    db.upsert_ac_state('ac1', device_id='room1', power=True, mode='cool', target_temp=24.0)
+    assert db.warm_state_cache() == 1
+
+    # 绕过本进程直接改库：读取仍来自内存
+    with db.get_connection() as conn:
+        conn.execute("UPDATE ac_state SET mode = 'heat' WHERE ac_id = 'ac1'")
+        conn.commit()
+    assert db.get_ac_state('ac1')['mode'] == 'cool'
+
+    # 本进程写入提交后合并到缓存，未提供的字段保持不变
+    db.upsert_ac_state('ac1', target_temp=26.0)
+    state = db.get_ac_state('ac1')
+    assert (state['mode'], state['target_temp'], state['power']) == ('cool', 26.0, True)
+    state['mode'] = 'dry'
+    assert db.get_all_acs()[0]['mode'] == 'cool'
+
+    # MQTT 写入：新设备回填整行，温湿度最新一条带数据库生成的 id
+    db.write_batch([
+        ('lock_state', {'lock_id': 'door', 'locked': True, 'method': 'app', 'actor': 'u', 'battery': None}),
+        ('sensor', {'device_id': 'room1', 'temperature': 21.5, 'humidity': 40.0}),
+    ])
+    assert db.state_cache.contains('lock', 'door')
+    assert db.get_lock_state('door')['battery'] == 100
+    assert [l['lock_id'] for l in db.get_all_locks()] == ['door']
+    latest = db.get_latest_data('room1')
+    assert latest['temperature'] == 21.5 and latest['id'] is not None
+    assert db.state_cache.stats()['hits'] >= 5
+
+
+def test_state_cache_is_off_outside_ingest_process(sqlite_db, tmp_path):
+    import subprocess
+    # 只导入 database 的进程（如模拟器）缺省不启用缓存
+    env = dict(os.environ, DB_PATH=str(tmp_path / 'probe.sqlite3'))
+    probe = subprocess.run([sys.executable, '-c', 'import database; print(database.state_cache.enabled)'],
+                           cwd=backend_dir, env=env, capture_output=True, text=True, check=True)
+    assert probe.stdout.strip().splitlines()[-1] == 'False'
+
+    db = sqlite_db
+    db.enable_state_cache(False)
+    db.upsert_ac_state('ac_room1', device_id='room1', power=False, mode='cool')
+    assert db.get_ac_state('ac_room1')['power'] is False
+
+    # 其他进程（Web 界面）改库后立即可见
+    external = sqlite3.connect(db.DB_PATH)
+    external.execute("UPDATE ac_state SET power = 1, mode = 'heat' WHERE ac_id = 'ac_room1'")
+    external.commit()
+    external.close()
+    state = db.get_ac_state('ac_room1')
+    assert (state['power'], state['mode']) == (True, 'heat')
+
+
+def test_state_cache_merge_and_stale_fill():
+    from state_cache import DeviceStateCache
+    cache = DeviceStateCache(lambda: 'now')
+    assert not cache.merge('lock', 'door', {'locked': True})
+
+    token = cache.version('lock', 'door')
+    assert cache.fill('lock', 'door', {'lock_id': 'door', 'locked': False, 'method': 'pin',
+                                       'actor': 'a', 'battery': 80, 'updated_at': 't0'}, token)
+    # locked/method/actor 与 upsert 一样总是覆盖，battery 为 None 时保留
+    assert cache.merge('lock', 'door', {'locked': 1, 'method': None, 'actor': 'b', 'battery': None})
+    assert cache.get('lock', 'door') == {'lock_id': 'door', 'locked': True, 'method': None,
+                                         'actor': 'b', 'battery': 80, 'updated_at': 'now'}
+
+    # 回源查询期间记录被更新过，旧结果不能覆盖缓存
+    token = cache.version('lock', 'door')
+    cache.merge('lock', 'door', {'locked': False})
+    assert not cache.fill('lock', 'door', {'lock_id': 'door', 'locked': True}, token)
+    assert cache.get('lock', 'door')['locked'] is False
+
+
+def test_ac_readings_follow_sensor_ingest(sqlite_db, monkeypatch):
+    db = sqlite_db
+    db.upsert_ac_state('ac1', device_id='room1', power=True)
+    db.upsert_ac_state('ac2', device_id='room2')
+    db.warm_state_cache()
+    db.write_batch([
+        ('sensor', {'device_id': 'room1', 'temperature': 22.0, 'humidity': 50.0}),
+        ('sensor', {'device_id': 'room1', 'temperature': 23.5, 'humidity': 55.0}),
+    ])
+    for read in (db.get_ac_state, db._query_ac_state):
+        state = read('ac1')
+        assert (state['current_temp'], state['current_humidity']) == (23.5, 55.0)
+    assert db.get_ac_state('ac2')['current_temp'] is None
+
+    # GET /ac/<id> 只读：不再调用 upsert_ac_state
+    from flask import Flask
+    from routes import air_conditioner
+    monkeypatch.setattr(air_conditioner, 'upsert_ac_state', None)
+    app = Flask(__name__)
+    app.register_blueprint(air_conditioner.air_conditioner_bp)
+    body = app.test_client().get('/ac/ac1').get_json()
+    assert (body['current_temp'], body['power']) == (23.5, True)
+
+
+def test_sensor_devices_summary_follows_ingest(sqlite_db):
+    db = sqlite_db
+    db.write_batch([
+        ('sensor', {'device_id': 'living_room', 'temperature': 20.0, 'humidity': 40.0}),
+        ('sensor', {'device_id': 'living_room', 'temperature': 21.0, 'humidity': 41.0}),
+        ('sensor', {'device_id': 'garage', 'temperature': 15.0, 'humidity': 70.0}),
+    ])
+    db.insert_sensor_data({'temperature': 22.0, 'humidity': 42.0}, 'living_room')
+    devices = {d['device_id']: d for d in db.get_devices()}
+    assert devices['living_room']['data_count'] == 3
+    assert devices['living_room']['room_name'] == '客厅'
+    assert (devices['living_room']['last_temperature'], devices['living_room']['last_humidity']) == (22.0, 42.0)
+    assert devices['garage']['data_count'] == 1 and devices['garage']['room_name'] == 'garage'
+    assert devices['garage']['first_seen'] is not None
+
+
+def test_sensor_devices_backfill_matches_raw_data():
+    conn = sqlite3.connect(':memory:')
+    schema.migrate(conn, 'sqlite')
+    conn.executemany(
+        "INSERT INTO temperature_humidity_data (device_id, temperature, humidity, timestamp) VALUES (?, ?, ?, ?)",
+        [('room1', 20.0, 40.0, '2024-01-01 00:00:00'), ('room1', 25.0, 45.0, '2024-01-02 00:00:00'),
+         ('room2', 18.0, 60.0, '2024-01-01 12:00:00')])
+    conn.execute(schema.SENSOR_DEVICES_BACKFILL)
+    rows = conn.execute("SELECT * FROM sensor_devices ORDER BY device_id").fetchall()
+    assert rows == [
+        ('room1', 2, '2024-01-01 00:00:00', '2024-01-02 00:00:00', 25.0, 45.0),
+        ('room2', 1, '2024-01-01 12:00:00', '2024-01-01 12:00:00', 18.0, 60.0),
+    ]
+    conn.close()
+
+
+def test_alarm_statistics_increment_and_rebuild_agree(sqlite_db):
+    import database_enhanced
+    db = sqlite_db
+    db.upsert_smoke_alarm_state('smoke_kitchen', location='kitchen')
+    db.write_batch([
+        ('smoke_alarm_event', {'alarm_id': 'smoke_kitchen', 'event_type': 'ALARM_TRIGGERED', 'smoke_level': 80.0}),
+        ('smoke_alarm_event', {'alarm_id': 'smoke_kitchen', 'event_type': 'TEST', 'smoke_level': 99.0}),
+        ('smoke_alarm_event', {'alarm_id': 'smoke_hall', 'event_type': 'ALARM_TRIGGERED', 'smoke_level': None}),
+    ])
+    db.insert_smoke_alarm_event('smoke_kitchen', 'ALARM_CLEARED', smoke_level=90.5)
+    database_enhanced.acknowledge_alarm('smoke_kitchen', None, 'alice', response_time=100, resolution='false_alarm')
+    database_enhanced.acknowledge_alarm('smoke_kitchen', None, 'bob', response_time=151, resolution='resolved')
+    database_enhanced.acknowledge_alarm('smoke_kitchen', None, 'carol', resolution='resolved')
+
+    incremental = sorted(database_enhanced.get_alarm_statistics(), key=lambda s: s['alarm_id'])
+    assert [(s['alarm_id'], s['total_alarms'], s['false_alarms'], s['real_alarms'],
+             s['avg_response_time'], s['max_smoke_level']) for s in incremental] == [
+        ('smoke_hall', 1, 0, 1, None, None),
+        ('smoke_kitchen', 2, 1, 1, 126, 90.5),
+    ]
+
+    today = incremental[0]['stat_date']
+    assert database_enhanced.rebuild_alarm_statistics(today) == 2
+    rebuilt = sorted(database_enhanced.get_alarm_statistics(), key=lambda s: s['alarm_id'])
+    assert rebuilt == incremental
+
+
+def test_unit_of_work_reads_own_writes_and_syncs_cache_after_commit(sqlite_db):
+    db = sqlite_db
+    db.upsert_lighting_state('lamp', power=False, brightness=10)
+    assert db.get_lighting_state('lamp')['brightness'] == 10
+
+    with db.unit_of_work():
+        db.upsert_lighting_state('lamp', power=True, brightness=80)
+        db.insert_lighting_event('lamp', 'brightness_change', '10', '80')
+        # 块内读取本事务的写入，缓存要等提交后才更新
+        assert db.get_lighting_state('lamp')['brightness'] == 80
+        assert db.state_cache.get('lighting', 'lamp')['brightness'] == 10
+    assert db.state_cache.get('lighting', 'lamp')['brightness'] == 80
+
+    with pytest.raises(RuntimeError):
+        with db.unit_of_work():
+            db.upsert_lighting_state('lamp', brightness=5)
+            db.insert_lighting_event('lamp', 'brightness_change', '80', '5')
+            raise RuntimeError("boom")
+    assert db.get_lighting_state('lamp')['brightness'] == 80
+    assert [e['new_value'] for e in db.get_lighting_events('lamp')] == ['80']
+
+
+def test_sensor_aggregate_buckets_raw_and_rollup_data(sqlite_db):
+    db = sqlite_db
+    db.init_schema()
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO temperature_humidity_data (device_id, temperature, humidity, timestamp) VALUES (?, ?, ?, ?)",
+            [('room1', 20.0 + i, 40.0 + i, f'2024-01-01 00:00:{i * 10:02d}') for i in range(6)]
+            + [('room2', 99.0, 99.0, '2024-01-01 00:00:05')])
+        conn.commit()
+
+    result = db.get_sensor_aggregate('room1', datetime(2024, 1, 1, 0, 0, 5), datetime(2024, 1, 1, 0, 1),
+                                     bucket='30s', aggs=('avg', 'max', 'count'))
+    assert result['source'] == 'raw'
+    assert result['start'] == '2024-01-01 00:00:00'
+    assert result['columns'] == {
+        'time': ['2024-01-01 00:00:00', '2024-01-01 00:00:30'],
+        'temperature_avg': [21.0, 24.0],
+        'temperature_max': [22.0, 25.0],
+        'humidity_avg': [41.0, 44.0],
+        'humidity_max': [42.0, 45.0],
+        'count': [3, 3],
+    }
+
+    # 5m 是 1m 的整数倍：读汇总表
+    db.write_batch([('sensor', {'device_id': 'room3', 'temperature': t, 'humidity': 50.0}) for t in (18.0, 22.0)])
+    result = db.get_sensor_aggregate('room3', bucket='5m', aggs=('min', 'max', 'count'))
+    assert result['source'] == '1m'
+    assert result['columns']['temperature_min'] == [18.0]
+    assert result['columns']['temperature_max'] == [22.0]
+    assert result['columns']['count'] == [2]
+
+    with pytest.raises(ValueError):
+        db.get_sensor_aggregate('room1', bucket='5x')
+    with pytest.raises(ValueError):
+        db.get_sensor_aggregate('room1', datetime(2024, 1, 1), datetime(2024, 2, 1), bucket='1s')
+
+
+def test_sensor_aggregate_queries_use_indexes_on_sqlite():
+    import queries
+    conn = sqlite3.connect(':memory:')
+    schema.migrate(conn, 'sqlite')
+    compiled = queries.compile_queries(queries.QUERIES, 'sqlite')
+    for source in ('raw', '1m', '1h', '1d'):
+        text = compiled[f'sensor.aggregate.{source}']
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + text, [60, 'room1', '2024-01-01', '2024-01-02'])]
+        # 按设备和时间范围走索引；GROUP BY 只对范围内的行排序
+        assert any('INDEX' in step and '<' in step for step in plan), (source, plan)
+        assert not any(step.startswith('SCAN') and 'INDEX' not in step for step in plan), (source, plan)
+    conn.close()
+
+
+def _lttb_reference(xs, ys, threshold):
+    """整表一次性计算的 LTTB，用来核对流式实现"""
+    n = len(xs)
+    every = (n - 2) / (threshold - 2)
+    selected, a = [0], 0
+    for k in range(threshold - 2):
+        start, end = int(k * every) + 1, int((k + 1) * every) + 1
+        if k == threshold - 3:
+            nxt = range(n - 1, n)
+        else:
+            nxt = range(end, min(int((k + 2) * every) + 1, n - 1))
+        cx = sum(xs[i] for i in nxt) / len(nxt)
+        cy = sum(ys[i] for i in nxt) / len(nxt)
+        a = max(range(start, min(end, n - 1)),
+                key=lambda i: abs((xs[a] - cx) * (ys[i] - ys[a]) - (xs[a] - xs[i]) * (cy - ys[a])))
+        selected.append(a)
+    return selected + [n - 1]
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+def test_lttb_stream_matches_reference(monkeypatch, use_numpy):
+    import math
+    import downsample
+    if not use_numpy:
+        monkeypatch.setattr(downsample, 'np', None)
+    xs = list(range(1003))
+    ys = [math.sin(i / 7.0) * (i % 13) for i in xs]
+    stream = downsample.LTTBStream(len(xs), 50)
+    for i in range(0, len(xs), 64):
+        stream.feed(xs[i:i + 64], xs[i:i + 64], [ys[i:i + 64]])
+    (labels, values), = stream.finish()
+    assert labels == _lttb_reference(xs, ys, 50)
+    assert values == [ys[i] for i in labels]
+
+    # 点数不超过目标时原样返回
+    stream = downsample.LTTBStream(3, 50)
+    stream.feed([0, 1, 2], ['a', 'b', 'c'], [[1.0, 2.0, 3.0]])
+    assert stream.finish() == [(['a', 'b', 'c'], [1.0, 2.0, 3.0])]
+
+
+def test_sensor_lttb_streams_range_in_chunks(sqlite_db):
+    db = sqlite_db
+    db.init_schema()
+    rows = [('room1', 20.0 + (i % 7), 40.0 + (i % 5), f'2024-01-01 00:{i // 60:02d}:{i % 60:02d}')
+            for i in range(600)]
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO temperature_humidity_data (device_id, temperature, humidity, timestamp) VALUES (?, ?, ?, ?)",
+            rows + [('room2', 0.0, 0.0, '2024-01-01 00:00:30')])
+        conn.commit()
+
+    start, end = datetime(2024, 1, 1), datetime(2024, 1, 1, 1)
+    chunks = list(db.iter_sensor_range('room1', start, end, chunk_size=128))
+    assert [len(c) for c in chunks] == [128, 128, 128, 128, 88]
+    assert [r[0] for c in chunks for r in c] == [r[3] for r in rows]
+
+    result = db.get_sensor_lttb('room1', start, end, points=40, chunk_size=128)
+    assert result['rows'] == 600
+    for field, column in (('temperature', 1), ('humidity', 2)):
+        series = result['series'][field]
+        assert len(series['time']) == 40
+        assert series['time'][0] == rows[0][3] and series['time'][-1] == rows[-1][3]
+        expected = _lttb_reference([i * 1.0 for i in range(600)], [r[column] for r in rows], 40)
+        assert series['time'] == [rows[i][3] for i in expected]
+
+
+def test_export_streams_batches_as_ndjson_and_csv(sqlite_db):
+    db = sqlite_db
+    db.init_schema()
+    rows = [(f'room{i % 2}', 20.0 + i, 40.0, f'2024-01-01 00:00:{i:02d}') for i in range(25)]
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO temperature_humidity_data (device_id, temperature, humidity, timestamp) VALUES (?, ?, ?, ?)",
+            rows)
+        conn.commit()
+
+    batches = list(db.iter_export('sensors', device_id='room1', batch_size=5))
+    assert [len(b) for b in batches] == [5, 5, 2]
+    assert [r[4] for b in batches for r in b] == [r[3] for r in rows if r[0] == 'room1']
+    assert sum(len(b) for b in db.iter_export('sensors', start=datetime(2024, 1, 1, 0, 0, 10))) == 15
+    with pytest.raises(ValueError):
+        db.export_columns('users')
+
+    import csv
+    import json
+    from flask import Flask
+    from routes.export import export_bp
+    app = Flask(__name__)
+    app.register_blueprint(export_bp)
+    client = app.test_client()
+
+    resp = client.get('/export/sensors?device_id=room0&end=2024-01-01T00:00:04')
+    assert resp.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert [(r['device_id'], r['timestamp']) for r in lines] == [
+        ('room0', '2024-01-01 00:00:00'), ('room0', '2024-01-01 00:00:02')]
+
+    resp = client.get('/export/sensors?format=csv')
+    table = list(csv.reader(resp.get_data(as_text=True).splitlines()))
+    assert table[0] == ['id', 'device_id', 'temperature', 'humidity', 'timestamp']
+    assert len(table) == 26 and resp.headers['Content-Disposition'].endswith('sensors.csv"')
+
+    assert client.get('/export/sensors?format=xml').status_code == 400
+    assert client.get('/export/sensors?start=bad').status_code == 400
+    assert client.get('/export/users').status_code == 404
+
+
+def test_archive_moves_old_days_to_parquet_and_queries_stay_transparent(sqlite_db, tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    pytest.importorskip('duckdb')
+    from archive import ParquetArchive
+    db = sqlite_db
+    db.init_schema()
+    rows = [('room1', 20.0 + i % 9, 40.0 + i % 4, f'2024-01-0{1 + i // 48} {i % 48 // 2:02d}:{i % 2 * 30:02d}:00')
+            for i in range(144)]
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO temperature_humidity_data (device_id, temperature, humidity, timestamp) VALUES (?, ?, ?, ?)",
+            rows)
+        conn.execute("INSERT INTO lock_events (lock_id, event_type, timestamp) VALUES ('front', 'lock', '2024-01-01 08:00:00')")
+        conn.commit()
+
+    start, end = datetime(2024, 1, 1), datetime(2024, 1, 4)
+    before = (db.get_sensor_aggregate('room1', start, end, bucket='90s', aggs=('avg', 'min', 'max', 'count')),
+              db.get_sensor_lttb('room1', start, end, points=30),
+              db.get_sensor_series('room1', datetime(2024, 1, 1, 23), datetime(2024, 1, 2, 1)))
+
+    monkeypatch.setattr(db, '_archive', ParquetArchive(str(tmp_path / 'archive')))
+    result = db.archive_expired(days=1, now=datetime(2024, 1, 4, 12))
+    assert result['sensors']['rows'] == 96 and len(result['sensors']['files']) == 2
+    assert result['lock_events']['rows'] == 1
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*), MIN(timestamp) FROM temperature_humidity_data").fetchone() == (
+            48, '2024-01-03 00:00:00')
+        assert conn.execute("SELECT COUNT(*) FROM lock_events").fetchone()[0] == 0
+
+    after = (db.get_sensor_aggregate('room1', start, end, bucket='90s', aggs=('avg', 'min', 'max', 'count')),
+             db.get_sensor_lttb('room1', start, end, points=30),
+             db.get_sensor_series('room1', datetime(2024, 1, 1, 23), datetime(2024, 1, 2, 1)))
+    assert after == before
+    # 再次归档没有新数据
+    assert db.archive_expired(days=1, now=datetime(2024, 1, 4, 12))['sensors']['rows'] == 0
+
+
+def test_history_pages_continue_into_the_archive(sqlite_db, tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    pytest.importorskip('duckdb')
+    from archive import ParquetArchive
+    db = sqlite_db
+    db.init_schema()
+    times = [datetime(2024, 1, 1) + timedelta(hours=6 * i) for i in range(16)]
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO temperature_humidity_data (device_id, temperature, humidity, timestamp) VALUES (?, ?, ?, ?)",
+            [(f'room{i % 2}', float(i), 40.0, t.isoformat(sep=' ')) for i, t in enumerate(times)])
+        conn.executemany("INSERT INTO lock_events (lock_id, event_type, timestamp) VALUES ('front', 'lock', ?)",
+                         [(t.isoformat(sep=' '),) for t in times])
+        conn.commit()
+
+    def pages(fetch, **kwargs):
+        seen, cursor = [], None
+        while True:
+            page = fetch(limit=3, cursor=cursor, **kwargs)
+            seen.extend(page['items'])
+            cursor = page['next_cursor']
+            if not cursor:
+                return seen
+
+    before = (pages(db.get_recent_data_page), pages(db.get_recent_data_page, device_id='room1'),
+              pages(db.get_lock_events_page, lock_id='front'),
+              db.get_recent_data_page(limit=100, before=datetime(2024, 1, 3), after=datetime(2024, 1, 1, 6)))
+    assert len(before[0]) == 16 and len(before[1]) == 8 and len(before[2]) == 16
+
+    monkeypatch.setattr(db, '_archive', ParquetArchive(str(tmp_path / 'archive')))
+    result = db.archive_expired(days=1, now=datetime(2024, 1, 4, 12))
+    assert result['sensors']['rows'] == 8 and result['lock_events']['rows'] == 8
+    after = (pages(db.get_recent_data_page), pages(db.get_recent_data_page, device_id='room1'),
+             pages(db.get_lock_events_page, lock_id='front'),
+             db.get_recent_data_page(limit=100, before=datetime(2024, 1, 3), after=datetime(2024, 1, 1, 6)))
+    assert after == before
+
+    # 迟到写入的行留在数据库中，与已归档的同一天合并排序
+    with db.get_connection() as conn:
+        conn.execute("INSERT INTO temperature_humidity_data (device_id, temperature, humidity, timestamp) "
+                     "VALUES ('room1', 99.0, 40.0, '2024-01-02 13:00:00')")
+        conn.commit()
+    seen = pages(db.get_recent_data_page, device_id='room1')
+    assert [r['timestamp'] for r in seen] == sorted((r['timestamp'] for r in seen), reverse=True)
+    assert len(seen) == 9 and seen[5]['temperature'] == 99.0
+
+
+def test_archive_with_segment_store_archives_segments_before_retention(sqlite_db, tmp_path, monkeypatch):
+    pytest.importorskip('numpy')
+    pytest.importorskip('pyarrow')
+    pytest.importorskip('duckdb')
+    from archive import ParquetArchive
+    from segment_store import SegmentStore
+    db = sqlite_db
+    db.init_schema()
+    # 切换到分段存储之前写入表中的旧数据，id 与段记录的 seq 重叠
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO temperature_humidity_data (device_id, temperature, humidity, timestamp) VALUES (?, ?, ?, ?)",
+            [('room1', 10.0, 30.0, '2024-01-01 08:00:00'), ('room1', 11.0, 31.0, '2024-01-05 08:00:00')])
+        conn.commit()
+    store = SegmentStore(str(tmp_path / 'segments'), stride=4)
+    monkeypatch.setattr(db, '_segment_store', store)
+    monkeypatch.setattr(db, '_archive', ParquetArchive(str(tmp_path / 'archive')))
+    store.append([('room1', datetime(2024, 1, 1, 9), 20.0, 40.0), ('room2', datetime(2024, 1, 1, 10), 21.0, 41.0),
+                  ('room1', datetime(2024, 1, 5, 9), 22.0, 42.0), ('room1', datetime(2024, 1, 20, 9), 23.0, 43.0)])
+    now = datetime(2024, 1, 21, 12)
+
+    result = db.archive_expired(days=7, now=now)['sensors']
+    assert result['rows'] == 5 and len(result['files']) == 4
+    assert store.oldest_day() == datetime(2024, 1, 20)
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM temperature_humidity_data").fetchone()[0] == 0
+    # 表中旧数据和段数据都可从归档读出
+    points = db.get_sensor_series('room1', datetime(2024, 1, 1), datetime(2024, 1, 2), max_points=100000)['points']
+    assert [(p['timestamp'], p['temperature']) for p in points] == [
+        ('2024-01-01 08:00:00', 10.0), ('2024-01-01 09:00:00', 20.0)]
+
+    # 已归档的段不再由保留任务删除，未到期的段保留
+    assert db.enforce_retention({'temperature_humidity_data': 10}, now=now)['temperature_humidity_data']['rows'] == 0
+    assert db.get_latest_data('room1')['temperature'] == 23.0
+    assert db.archive_expired(days=7, now=now)['sensors']['rows'] == 0
+
+
+def test_retention_after_archive_only_purges_archived_tables(sqlite_db, tmp_path, monkeypatch):
+    pytest.importorskip('pyarrow')
+    pytest.importorskip('duckdb')
+    from archive import ParquetArchive
+    db = sqlite_db
+    db.init_schema()
+    with db.get_connection() as conn:
+        conn.execute("INSERT INTO temperature_humidity_data (device_id, temperature, humidity, timestamp) "
+                     "VALUES ('room1', 20.0, 40.0, '2024-01-01 08:00:00')")
+        conn.execute("INSERT INTO lock_events (lock_id, event_type, timestamp) VALUES ('front', 'lock', '2024-01-01 08:00:00')")
+        conn.commit()
+    policies = {'temperature_humidity_data': 30, 'lock_events': 30}
+    now = datetime(2024, 3, 1)
+
+    # 归档失败或未执行的表不清理
+    results = db.enforce_retention_after_archive({'sensors': {'rows': 0, 'files': [], 'error': 'disk full'}}, policies, now)
+    assert results == {}
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM temperature_humidity_data").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM lock_events").fetchone()[0] == 1
+
+    # 先归档再清理：过期数据全部进入归档，不会在归档前被删除
+    monkeypatch.setattr(db, '_archive', ParquetArchive(str(tmp_path / 'archive')))
+    archived = db.archive_expired(days=7, now=now)
+    assert archived['sensors']['rows'] == 1 and archived['lock_events']['rows'] == 1
+    results = db.enforce_retention_after_archive(archived, policies, now)
+    assert set(results) == {'temperature_humidity_data', 'lock_events'}
+    points = db.get_sensor_series('room1', datetime(2024, 1, 1), datetime(2024, 1, 2), max_points=100000)['points']
+    assert [p['temperature'] for p in points] == [20.0]
+
+    db.check_archive_settings(7, policies)
+    for days in (0, 30, 60):
+        with pytest.raises(ValueError):
+            db.check_archive_settings(days, policies)
+    # 永久保留（0）的表不限制
+    db.check_archive_settings(60, {'temperature_humidity_data': 0, 'lock_events': 90})
+
+
+def test_segment_store_serves_sensor_reads_and_writes(sqlite_db, tmp_path, monkeypatch):
+    pytest.importorskip('numpy')
+    from segment_store import SegmentStore
+    db = sqlite_db
+    db.init_schema()
+    store = SegmentStore(str(tmp_path / 'segments'), stride=4)
+    monkeypatch.setattr(db, '_segment_store', store)
+
+    db.write_batch([('sensor', {'device_id': 'room1', 'temperature': 20.0 + i, 'humidity': 40.0}) for i in range(5)]
+                   + [('sensor', {'device_id': 'room2', 'temperature': 18.0, 'humidity': 60.0})])
+    db.insert_sensor_data({'temperature': 26.0, 'humidity': 45.0}, 'room1')
+    with db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM temperature_humidity_data").fetchone()[0] == 0
+        assert conn.execute("SELECT SUM(samples) FROM temperature_humidity_1m WHERE device_id = 'room1'").fetchone()[0] == 6
+    rows = db.get_recent_data('room1', limit=100)
+    assert sorted(r['temperature'] for r in rows) == [20.0, 21.0, 22.0, 23.0, 24.0, 26.0]
+    expected = sorted(sorted(rows, key=lambda r: r['id']), key=lambda r: r['timestamp'], reverse=True)
+    assert db.get_recent_data('room1', limit=3) == expected[:3]
+    assert db.get_latest_data('room1')['temperature'] == 26.0
+
+    # 手动写入跨两天、含时钟回拨的数据，验证分页、范围、聚合与清理
+    base = datetime(2024, 1, 1, 23, 58)
+    readings = [('room3', base + timedelta(seconds=10 * i), 20.0 + i % 3, 50.0 - i % 4) for i in range(30)]
+    readings.insert(20, ('room3', base, 99.0, 1.0))
+    store.append(readings)
+    ordered = sorted(readings, key=lambda r: r[1])
+
+    seen, cursor = [], None
+    while True:
+        page = db.get_recent_data_page('room3', limit=7, cursor=cursor)
+        seen.extend(page['items'])
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    assert len(seen) == 31 and len({r['id'] for r in seen}) == 31
+    assert [r['timestamp'] for r in seen] == sorted((r['timestamp'] for r in seen), reverse=True)
+
+    start, end = datetime(2024, 1, 1), datetime(2024, 1, 3)
+    series = db.get_sensor_series('room3', base, base + timedelta(minutes=3))
+    assert [p['timestamp'] for p in series['points']] == [r[1].isoformat(sep=' ') for r in ordered if r[1] < base + timedelta(minutes=3)]
+    agg = db.get_sensor_aggregate('room3', start, end, bucket='90s', aggs=('min', 'max', 'count'))['columns']
+    buckets = {}
+    for _, ts, t, _ in readings:
+        key = db._epoch_floor(ts, 90).isoformat(sep=' ')
+        buckets.setdefault(key, []).append(t)
+    assert agg['time'] == sorted(buckets)
+    assert agg['count'] == [len(buckets[k]) for k in agg['time']]
+    assert agg['temperature_max'] == [max(buckets[k]) for k in agg['time']]
+    assert db.get_sensor_lttb('room3', start, end, points=10)['rows'] == 31
+    assert [r[4] for b in db.iter_export('sensors', device_id='room3') for r in b] == [
+        r[1].isoformat(sep=' ') for r in ordered]
+
+    assert db.purge_expired('temperature_humidity_data', datetime(2024, 1, 2, 12))['rows'] == 13
+    assert db.get_recent_data_page('room3', limit=100)['items'][-1]['timestamp'] == '2024-01-02 00:00:00'
+
+
+def test_segment_store_instances_share_a_directory(tmp_path):
+    pytest.importorskip('numpy')
+    from segment_store import SegmentStore, RECORD
+    root = str(tmp_path / 'segments')
+    # 两个实例相当于 ingest 进程和 Web 进程，各自缓存段的元数据
+    ingest, web = SegmentStore(root, stride=4), SegmentStore(root, stride=4)
+    day = datetime(2024, 1, 1)
+    ingest.append([('room1', day + timedelta(seconds=i), 20.0 + i, 40.0) for i in range(3)])
+    assert web.count('room1', day, day + timedelta(days=1)) == 3
+
+    # 读取端能看到之后追加的记录
+    ingest.append([('room1', day + timedelta(seconds=3), 23.0, 40.0)])
+    assert web.latest('room1')['temperature'].tolist() == [23.0]
+    assert web.count('room1', day, day + timedelta(days=1)) == 4
+
+    # 两个实例并发追加：不截断对方的记录，seq 不重复
+    def write(store, base):
+        for i in range(50):
+            store.append([('room1', day + timedelta(seconds=10 + base + i), float(base + i), 40.0),
+                          ('room2', day + timedelta(seconds=10 + base + i), float(base + i), 40.0)])
+    threads = [threading.Thread(target=write, args=(s, b)) for s, b in ((ingest, 0), (web, 1000))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for store in (ingest, web):
+        data = store.range('room1', day, day + timedelta(days=1))
+        assert len(data) == 104 and len(set(data['seq'].tolist())) == 104
+        assert len(store.range('room2', day, day + timedelta(days=1))) == 100
+    seqs = [r['seq'] for d in ('room1', 'room2') for r in ingest.range(d, day, day + timedelta(days=1))]
+    assert len(set(seqs)) == 204
+    assert os.path.getsize(os.path.join(root, 'room1', '2024-01-01.seg')) == 104 * RECORD.itemsize
+
+    # Web 进程删除段后，ingest 进程的下一次追加从空文件开始，不补零
+    assert web.drop_day(day) == 204
+    assert ingest.count('room1', day, day + timedelta(days=1)) == 0
+    ingest.append([('room1', day + timedelta(hours=1), 30.0, 50.0)])
+    data = web.range('room1', day, day + timedelta(days=1))
+    assert data['temperature'].tolist() == [30.0] and int(data['seq'][0]) > max(seqs)
+    assert os.path.getsize(os.path.join(root, 'room1', '2024-01-01.seg')) == RECORD.itemsize
+
+
+def test_segment_store_rejects_device_ids_that_escape_the_directory(tmp_path):
+    pytest.importorskip('numpy')
+    from segment_store import SegmentStore
+    root = tmp_path / 'segments'
+    store = SegmentStore(str(root))
+    day = datetime(2024, 1, 1)
+    for device_id in ('..', '.', '../outside', 'a/b', '.hidden', '', 'room1\x00'):
+        with pytest.raises(ValueError):
+            store.append([(device_id, day, 20.0, 40.0)])
+        assert len(store.range(device_id, day, day + timedelta(days=1))) == 0
+        assert store.latest(device_id) is None
+    # 整批拒绝，合法设备的读数也不会写入一半
+    with pytest.raises(ValueError):
+        store.append([('room1', day, 20.0, 40.0), ('..', day, 20.0, 40.0)])
+    assert not list(tmp_path.rglob('*.seg'))
+    store.append([('room-1.a', day, 20.0, 40.0), ('客厅', day, 21.0, 41.0)])
+    assert store.devices() == ['room-1.a', '客厅']
@@ -0,0 +1,373 @@
+"""
+MQTT 写入缓冲测试
+"""
+
+import os
+import sys
+import threading
+
+# 添加 backend 路径
+current_dir = os.path.dirname(__file__)
+backend_dir = os.path.join(current_dir, '..', 'backend')
+sys.path.insert(0, backend_dir)
+
+from ingest import WriteBehindQueue
+
+
+def test_write_behind_batches_records():
+    batches = []
+    q = WriteBehindQueue(lambda batch: batches.append(list(batch)),
+                         batch_size=10, flush_interval_ms=50).start()
+    for i in range(25):
+        assert q.submit('sensor', device_id='room1', temperature=i, humidity=50)
+    q.flush()
+    q.stop()
+
+    records = [r for b in batches for r in b]
+    assert [f['temperature'] for _, f in records] == list(range(25))
+    assert all(len(b) <= 10 for b in batches)
+    stats = q.stats()
+    assert stats['enqueued'] == stats['written'] == 25
+    assert stats['batches'] == len(batches)
+    assert stats['queue_depth'] == 0
+
+
+def test_write_behind_drops_when_full():
+    gate = threading.Event()
+    q = WriteBehindQueue(lambda batch: gate.wait(), batch_size=1,
+                         flush_interval_ms=0, max_queue=1, enqueue_timeout_ms=10).start()
+    accepted = sum(q.submit('sensor', device_id='room1') for _ in range(5))
+    gate.set()
+    q.flush()
+    q.stop()
+    stats = q.stats()
+    assert stats['dropped'] == 5 - accepted
+    assert stats['dropped'] > 0
+
+
+def test_write_behind_falls_back_to_single_records():
+    written = []
+
+    def write_batch(batch):
+        if any(f.get('bad') for _, f in batch):
+            raise ValueError("bad record")
+        written.extend(batch)
+
+    q = WriteBehindQueue(write_batch, batch_size=10, flush_interval_ms=50).start()
+    q.submit('sensor', device_id='a')
+    q.submit('sensor', device_id='b', bad=True)
+    q.submit('sensor', device_id='c')
+    q.flush()
+    q.stop()
+    assert [f['device_id'] for _, f in written] == ['a', 'c']
+    assert q.stats()['failed'] == 1
+
+
+def test_topic_router_matches_patterns_and_decodes_once():
+    from topic_router import TopicRouter
+    router = TopicRouter()
+    calls = []
+
+    @router.route("home/lock/+/state")
+    def lock_state(lock_id, data):
+        calls.append(('lock', lock_id, data))
+
+    @router.route("home/+/temperature_humidity")
+    def sensor(device_id, data):
+        calls.append(('sensor', device_id, data))
+
+    router.add("home/lock/front/#", lambda data: calls.append(('front', data)))
+    router.add("home/+/+/event", lambda kind, device_id, data: calls.append((kind, device_id, data)))
+
+    assert router.dispatch("home/lock/back/state", b'{"locked": true}')
+    assert router.dispatch("home/room1/temperature_humidity", b'{"temperature": 21}')
+    # 具体层优先于通配：front 的 state 仍由 lock_state 处理，其余由 # 路由处理
+    assert router.dispatch("home/lock/front/state", b'not json')
+    assert router.dispatch("home/lock/front/cmd/ack", b'{}')
+    assert router.dispatch("home/lighting/l1/event", b'[1, 2]')
+    assert not router.dispatch("home/lighting/l1/state", b'{}')
+    assert not router.dispatch("office/room1/temperature_humidity", b'{}')
+
+    assert calls == [
+        ('lock', 'back', {'locked': True}),
+        ('sensor', 'room1', {'temperature': 21}),
+        ('lock', 'front', {}),
+        ('front', {}),
+        ('lighting', 'l1', {}),
+    ]
+    assert router.patterns() == ["home/lock/+/state", "home/+/temperature_humidity",
+                                 "home/lock/front/#", "home/+/+/event"]
+    stats = router.stats()
+    assert stats['unrouted'] == 2 and stats['routes']["home/lock/+/state"] == 2
+    assert router.match("home/lock/back/state") is router.match("home/lock/back/state")
+
+    import pytest
+    with pytest.raises(ValueError):
+        router.add("home/#/state", lambda data: None)
+
+
+def test_keyed_worker_pool_keeps_per_key_order():
+    from ingest import KeyedWorkerPool
+    seen = {}
+    lock = threading.Lock()
+
+    def handle(key, i):
+        with lock:
+            seen.setdefault(key, []).append((i, threading.current_thread().name))
+
+    pool = KeyedWorkerPool(workers=4, max_queue=1000, enqueue_timeout_ms=1000).start()
+    for i in range(200):
+        assert pool.submit(f'dev{i % 7}', handle, f'dev{i % 7}', i)
+    pool.join()
+    pool.stop()
+
+    for key, items in seen.items():
+        assert [i for i, _ in items] == sorted(i for i, _ in items)
+        assert len({name for _, name in items}) == 1
+    assert len({items[0][1] for items in seen.values()}) > 1
+    stats = pool.stats()
+    assert stats['submitted'] == stats['processed'] == 200
+    assert stats['queue_depth'] == [0, 0, 0, 0]
+
+
+def test_keyed_worker_pool_drops_when_backlogged_and_counts_failures():
+    from ingest import KeyedWorkerPool
+    gate = threading.Event()
+    pool = KeyedWorkerPool(workers=1, max_queue=1, enqueue_timeout_ms=10).start()
+    accepted = sum(pool.submit('dev', gate.wait) for _ in range(5))
+    gate.set()
+    pool.submit('dev', lambda: 1 / 0)
+    pool.join()
+    pool.stop()
+    stats = pool.stats()
+    assert stats['dropped'] == 5 - accepted > 0
+    assert stats['failed'] == 1
+
+    inline = KeyedWorkerPool(workers=0)
+    ran = []
+    assert inline.submit('dev', ran.append, threading.current_thread().name)
+    assert ran == [threading.current_thread().name]
+
+
+def test_latest_value_buffer_keeps_newest_state_per_key():
+    from ingest import LatestValueBuffer
+    flushed = []
+    buffer = LatestValueBuffer(interval_ms=10000).start()
+    for i in range(50):
+        buffer.put(('lock', 'front'), flushed.append, ('front', i))
+        buffer.put(('lock', 'back'), flushed.append, ('back', i))
+    buffer.put(('lighting', 'l1'), lambda v: 1 / 0, 'bad')
+    assert flushed == []
+    buffer.flush()
+    assert flushed == [('front', 49), ('back', 49)]
+    stats = buffer.stats()
+    assert stats['received'] == 101 and stats['coalesced'] == 98
+    assert stats['flushed'] == 2 and stats['failed'] == 1 and stats['pending'] == 0
+
+    # 停止时执行剩余任务，之后直接执行
+    buffer.put(('lock', 'front'), flushed.append, ('front', 50))
+    buffer.stop()
+    buffer.put(('lock', 'front'), flushed.append, ('front', 51))
+    assert flushed[-2:] == [('front', 50), ('front', 51)]
+
+    inline = []
+    LatestValueBuffer(interval_ms=0).start().put('k', inline.append, 1)
+    assert inline == [1]
+
+
+def test_payload_decoder_validates_and_rejects_malformed_messages():
+    import pytest
+    from payloads import PayloadError, decoder, SensorReading, LockState, LockEvent
+    from topic_router import TopicRouter
+
+    decode = decoder(SensorReading)
+    assert decode(b'{"temperature": 21, "humidity": 40.5, "extra": 1}') == SensorReading(21.0, 40.5, None)
+    # 与旧处理器一致：数字字符串按 float() 接受
+    assert decode(b'{"temperature": "21.5", "humidity": " 40 "}') == SensorReading(21.5, 40.0, None)
+    for bad in (b"{'temperature': 21, 'humidity': 40}", b'[1, 2]', b'{"temperature": 21}',
+                b'{"temperature": "warm", "humidity": 40}', b'{"temperature": "nan", "humidity": 40}',
+                b'{"temperature": true, "humidity": 40}', b'\xff'):
+        with pytest.raises(PayloadError):
+            decode(bad)
+
+    state = decoder(LockState)(b'{"locked": 1, "battery": 79.6, "method": null}')
+    assert state.locked is True and state.battery == 80 and state.method is None
+    # 与旧处理器一致：缺少 locked 视为解锁
+    assert decoder(LockState)(b'{"battery": 50}').locked is False
+    event = decoder(LockEvent)(b'{"detail": {"pin": "bad"}}')
+    assert event.type == 'event' and event.detail == '{"pin": "bad"}'
+
+    router = TopicRouter()
+    seen = []
+    router.add("home/+/temperature_humidity", lambda device_id, data: seen.append(data), decode=decode)
+    with pytest.raises(PayloadError):
+        router.dispatch("home/room1/temperature_humidity", b"__import__('os')")
+    assert router.dispatch("home/room1/temperature_humidity", b'{"temperature": 1, "humidity": 2}')
+    assert len(seen) == 1
+    assert router.stats()['rejected'] == 1 and router.stats()['failed'] == 0
+
+
+def test_shared_topics_prefix_patterns_with_group():
+    import pytest
+    from topic_router import shared_topics
+    patterns = ["home/+/temperature_humidity", "home/lock/+/state"]
+    assert shared_topics(patterns) == patterns
+    assert shared_topics(patterns, '') == patterns
+    assert shared_topics(patterns, 'ingest') == ["$share/ingest/home/+/temperature_humidity",
+                                                  "$share/ingest/home/lock/+/state"]
+    for bad in ('a/b', 'in+', '#'):
+        with pytest.raises(ValueError):
+            shared_topics(patterns, bad)
+
+
+def _probe_mqtt_client(tmp_path, **settings):
+    """在子进程中按给定配置导入 mqtt_client，返回 (订阅主题, 各设备是否由本进程写入状态)"""
+    import json
+    import subprocess
+    env = dict(os.environ, DB_PATH=str(tmp_path / 'probe.sqlite3'), MQTT_BROKER='127.0.0.1',
+               MQTT_PORT=str(_free_port()), **settings)
+    code = ("import json, mqtt_client as m; "
+            "print(json.dumps([m.subscriptions(), [m.owns_device(f'door{i}') for i in range(8)]]))")
+    out = subprocess.run([sys.executable, '-c', code], cwd=backend_dir, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def test_ingest_modes_choose_subscriptions(tmp_path):
+    from ingest import shard
+    topics, owned = _probe_mqtt_client(tmp_path, MQTT_INGEST='false')
+    assert topics == []
+
+    topics, owned = _probe_mqtt_client(tmp_path, MQTT_SHARED_GROUP='ingest',
+                                       MQTT_SHARED_WORKERS='2', MQTT_SHARED_WORKER_INDEX='1')
+    # 读数和事件走共享订阅，状态主题直接订阅并按设备分片
+    assert "$share/ingest/home/lock/+/event" in topics and "home/lock/+/state" in topics
+    assert not any(t.startswith('$share/') and t.endswith('/state') for t in topics)
+    assert owned == [shard(f'door{i}', 2) == 1 for i in range(8)]
+    assert True in owned and False in owned
+
+    # 分段存储只支持一个 ingest 进程：共享订阅组内拒绝启动，Web 进程不受影响
+    import subprocess
+    import pytest
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        _probe_mqtt_client(tmp_path, MQTT_SHARED_GROUP='ingest', SENSOR_STORE='segments',
+                           SEGMENT_DIR=str(tmp_path / 'segments'))
+    assert 'SENSOR_STORE=segments' in e.value.stderr
+    topics, owned = _probe_mqtt_client(tmp_path, MQTT_INGEST='false', MQTT_SHARED_GROUP='ingest',
+                                       SENSOR_STORE='segments', SEGMENT_DIR=str(tmp_path / 'segments'))
+    assert topics == []
+
+
+def _free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class _Process:
+    """后台运行的 mqtt_client 进程，收集输出并等待订阅完成"""
+
+    def __init__(self, env):
+        import subprocess
+        self.lines = []
+        self.ready = threading.Event()
+        self.proc = subprocess.Popen([sys.executable, '-u', 'mqtt_client.py'], cwd=backend_dir, env=env,
+                                     stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self.proc.stdout:
+            self.lines.append(line)
+            if '已订阅主题' in line or '只发布控制命令' in line:
+                self.ready.set()
+
+    def stop(self):
+        import signal
+        import subprocess
+        self.proc.send_signal(signal.SIGINT)
+        try:
+            self.proc.wait(10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+def test_shared_ingest_splits_messages_across_workers(tmp_path):
+    import shutil
+    import socket
+    import sqlite3
+    import subprocess
+    import time
+    import pytest
+    mosquitto = shutil.which('mosquitto')
+    if not mosquitto:
+        pytest.skip("需要 PATH 中的 mosquitto")
+    import paho.mqtt.client as mqtt
+
+    port = _free_port()
+    broker = subprocess.Popen([mosquitto, '-p', str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    processes = []
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), 0.2).close()
+                break
+            except OSError:
+                assert time.monotonic() < deadline, "mosquitto 未启动"
+                time.sleep(0.1)
+
+        db_path = str(tmp_path / 'ingest.sqlite3')
+        env = dict(os.environ, DB_TYPE='sqlite', DB_PATH=db_path, MQTT_BROKER='127.0.0.1', MQTT_PORT=str(port),
+                   SENSOR_STORE='db', INGEST_FLUSH_INTERVAL_MS='20', STATE_COALESCE_INTERVAL_MS='20')
+        subprocess.run([sys.executable, '-c', 'import database; database.init_schema()'],
+                       cwd=backend_dir, env=env, check=True, capture_output=True)
+        for i in range(2):
+            processes.append(_Process(dict(env, MQTT_CLIENT_ID=f'ingest-{i}', MQTT_SHARED_GROUP='ingest',
+                                           MQTT_SHARED_WORKERS='2', MQTT_SHARED_WORKER_INDEX=str(i))))
+        # 只发布命令的 Web 进程：不订阅，不能重复写入
+        processes.append(_Process(dict(env, MQTT_CLIENT_ID='web', MQTT_INGEST='false')))
+        for p in processes:
+            assert p.ready.wait(15), ''.join(p.lines)
+        assert any('只发布控制命令' in line for line in processes[2].lines)
+
+        publisher = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id='publisher')
+        publisher.connect('127.0.0.1', port)
+        publisher.loop_start()
+        readings, locks, updates = 60, 6, 10
+        for i in range(readings):
+            publisher.publish(f'home/room{i % 8}/temperature_humidity',
+                              f'{{"temperature": {i}, "humidity": 50}}', qos=1).wait_for_publish()
+        for n in range(updates):
+            for lock in range(locks):
+                publisher.publish(f'home/lock/door{lock}/state',
+                                  f'{{"locked": {"true" if n % 2 else "false"}, "battery": {n}}}', qos=1).wait_for_publish()
+        for lock in range(locks):
+            publisher.publish(f'home/lock/door{lock}/event', '{"type": "lock"}', qos=1).wait_for_publish()
+        publisher.loop_stop()
+        publisher.disconnect()
+
+        def counts():
+            with sqlite3.connect(db_path) as conn:
+                return (conn.execute("SELECT COUNT(*) FROM temperature_humidity_data").fetchone()[0],
+                        conn.execute("SELECT COUNT(*) FROM lock_events").fetchone()[0],
+                        conn.execute("SELECT COUNT(*) FROM lock_state WHERE battery = ?", (updates - 1,)).fetchone()[0])
+
+        deadline = time.monotonic() + 15
+        while counts() != (readings, locks, locks) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        time.sleep(0.5)
+        # 每条读数和事件只写入一次；每把锁的最终状态是最后发布的一条
+        assert counts() == (readings, locks, locks)
+        with sqlite3.connect(db_path) as conn:
+            temps = sorted(r[0] for r in conn.execute("SELECT temperature FROM temperature_humidity_data"))
+        assert temps == [float(i) for i in range(readings)]
+
+        handled = [sum('温度' in line for line in p.lines) for p in processes]
+        assert handled[0] > 0 and handled[1] > 0 and handled[2] == 0
+        assert handled[0] + handled[1] == readings
+    finally:
+        for p in processes:
+            p.stop()
+        broker.terminate()
+        broker.wait(10)